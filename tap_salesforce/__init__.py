@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from copy import deepcopy
 import json
 import sys
@@ -12,6 +13,7 @@ from tap_salesforce.sync import (
     get_stream_version,
     get_existing_stream_version,
     set_stream_version)
+from tap_salesforce.messages import OUTPUT_LOCK, StreamState, write_message, write_state
 from tap_salesforce.salesforce import Salesforce
 from tap_salesforce.salesforce.bulk import Bulk
 from tap_salesforce.salesforce.exceptions import (
@@ -76,6 +78,9 @@ def build_state(raw_state, catalog):
     state = deepcopy(raw_state)
     state.pop("bookmarks", None)
     state.pop("activate_versions", None)
+    # Jobs submitted ahead by an earlier run are not reused, their results
+    # may be long outdated
+    state.pop("submitted_jobs", None)
 
     for catalog_entry in catalog['streams']:
         tap_stream_id = catalog_entry['tap_stream_id']
@@ -98,9 +103,30 @@ def build_state(raw_state, catalog):
             job_id = singer.get_bookmark(raw_state, tap_stream_id, 'JobID')
             batches = singer.get_bookmark(raw_state, tap_stream_id, 'BatchIDs')
             current_bookmark = singer.get_bookmark(raw_state, tap_stream_id, 'JobHighestBookmarkSeen')
+            batch_result_offset = singer.get_bookmark(raw_state, tap_stream_id, 'BatchResultOffset')
             state = singer.set_bookmark(state, tap_stream_id, 'JobID', job_id)
             state = singer.set_bookmark(state, tap_stream_id, 'BatchIDs', batches)
             state = singer.set_bookmark(state, tap_stream_id, 'JobHighestBookmarkSeen', current_bookmark)
+            if batch_result_offset:
+                state = singer.set_bookmark(state, tap_stream_id, 'BatchResultOffset', batch_result_offset)
+
+        # Preserve the date window size learned from query timeouts and the
+        # windows left by an interrupted sync, for streams whose query can be
+        # windowed, and the PK chunk size learned from previous jobs, along
+        # with whether the stream needed PK chunking and how many records its
+        # last sync returned
+        window_keys = ('WindowSeconds', 'WindowPlan') if catalog_metadata.get((), {}).get('replication-key') else ()
+        for key in window_keys + ('PKChunkSize', 'PKChunkedRecords', 'LastSyncRecords'):
+            if singer.get_bookmark(raw_state, tap_stream_id, key):
+                state = singer.set_bookmark(state, tap_stream_id, key,
+                                            singer.get_bookmark(raw_state, tap_stream_id, key))
+
+        # Preserve state that deals with resuming an incomplete Bulk API 2.0 job
+        if singer.get_bookmark(raw_state, tap_stream_id, 'Bulk2JobID'):
+            state = singer.set_bookmark(state, tap_stream_id, 'Bulk2JobID',
+                                        singer.get_bookmark(raw_state, tap_stream_id, 'Bulk2JobID'))
+            state = singer.set_bookmark(state, tap_stream_id, 'Bulk2Locator',
+                                        singer.get_bookmark(raw_state, tap_stream_id, 'Bulk2Locator'))
 
         if replication_method == 'INCREMENTAL':
             replication_key = catalog_metadata.get((), {}).get('replication-key')
@@ -117,6 +143,55 @@ def build_state(raw_state, catalog):
 
     return state
 
+# Stream metadata set by users rather than by discovery, carried over as is
+# when an existing catalog is merged
+USER_STREAM_METADATA = ('pk-chunk-size',)
+
+def merge_catalog_selections(entries, existing_catalog):
+    """Carries the selections of `existing_catalog` over to the discovered
+    `entries`: the 'selected' metadata of streams and fields, the
+    replication method and key of streams, as long as they are still valid,
+    and the alias and PK chunk size set on streams."""
+    existing_entries = {e['tap_stream_id']: e for e in existing_catalog.get('streams', [])}
+
+    for entry in entries:
+        existing_entry = existing_entries.get(entry['tap_stream_id'])
+        if existing_entry is None:
+            continue
+
+        existing_mdata = metadata.to_map(existing_entry.get('metadata', []))
+        mdata = metadata.to_map(entry['metadata'])
+
+        for breadcrumb, existing_values in existing_mdata.items():
+            # Fields that were removed or became unsupported lose their selection
+            if breadcrumb not in mdata or mdata[breadcrumb].get('inclusion') == 'unsupported':
+                continue
+            if 'selected' in existing_values:
+                mdata[breadcrumb]['selected'] = existing_values['selected']
+
+        stream_mdata = mdata.get((), {})
+        existing_stream_mdata = existing_mdata.get((), {})
+        replication_method = existing_stream_mdata.get('replication-method')
+        if replication_method and stream_mdata.get('forced-replication-method') in (None, replication_method):
+            stream_mdata['replication-method'] = replication_method
+        replication_key = existing_stream_mdata.get('replication-key')
+        if replication_key in stream_mdata.get('valid-replication-keys', []):
+            stream_mdata['replication-key'] = replication_key
+        for key in USER_STREAM_METADATA:
+            if key in existing_stream_mdata:
+                stream_mdata[key] = existing_stream_mdata[key]
+
+        entry['metadata'] = metadata.to_list(mdata)
+        if existing_entry.get('stream_alias'):
+            entry['stream_alias'] = existing_entry['stream_alias']
+
+    removed = sorted(set(existing_entries) - {e['tap_stream_id'] for e in entries})
+    if removed:
+        LOGGER.info("Dropping the following streams of the existing catalog, they are no longer discovered: %s",
+                    ', '.join(removed))
+
+    return entries
+
 # pylint: disable=undefined-variable
 def create_property_schema(field, mdata, expected_pk_field):
     field_name = field['name']
@@ -137,16 +212,33 @@ PK_OVERRIDES = {
 }
 
 # pylint: disable=too-many-branches,too-many-statements
-def do_discover(sf):
-    """Describes a Salesforce instance's objects and generates a JSON schema for each field."""
+def do_discover(sf, existing_catalog=None):
+    """Describes a Salesforce instance's objects and generates a JSON schema for each field.
+
+    When an `existing_catalog` is given, the selections made in it are kept
+    in the generated catalog. With a describe cache, only the objects that
+    are new or changed since the last discovery are described again."""
     global_description = sf.describe()
 
     blacklisted = sf.get_blacklisted_objects()
     objects_to_discover = [
         o['name'] for o in global_description['sobjects']
         if o['name'] not in blacklisted and not o['name'].endswith("ChangeEvent")
+        and sf.is_discover_included(o['name'])
     ]
 
+    if sf.discover_sobjects:
+        LOGGER.info("Discovering %d of %d objects matching discover_sobjects",
+                    len(objects_to_discover), len(global_description['sobjects']))
+
+    if existing_catalog is not None:
+        existing_streams = {e['tap_stream_id'] for e in existing_catalog.get('streams', [])}
+        new_objects = [o for o in objects_to_discover if o not in existing_streams]
+        LOGGER.info("Merging discovery into the existing catalog of %d streams, %d objects are not in it yet",
+                    len(existing_streams), len(new_objects))
+        if not sf.describe_cache_dir:
+            LOGGER.info("No describe_cache_dir is set, describing every object")
+
     sf_custom_setting_objects = []
     object_to_tag_references = {}
 
@@ -154,10 +246,10 @@ def do_discover(sf):
     entries = []
 
     # Check if the user has BULK API enabled
-    if sf.api_type == 'BULK' and not Bulk(sf).has_permissions():
+    if sf.api_type in ('BULK', 'BULK2') and not Bulk(sf).has_permissions():
         raise TapSalesforceBulkAPIDisabledException('This client does not have Bulk API permissions, received "API_DISABLED_FOR_ORG" error code')
 
-    sobject_descriptions = sf.batch_describe(objects_to_discover)
+    sobject_descriptions = sf.describe_sobjects(objects_to_discover)
     for sobject_name, sobject_description in sobject_descriptions.items():
         # Cache customSetting and Tag objects to check for blacklisting after
         # all objects have been described
@@ -193,7 +285,8 @@ def do_discover(sf):
             property_schema, mdata = create_property_schema(f, mdata, expected_pk_field)
 
             # Compound Address fields and geolocations cannot be queried by the Bulk API
-            if f['type'] in ("address", "location") and sf.api_type == tap_salesforce.salesforce.BULK_API_TYPE:
+            if f['type'] in ("address", "location") and sf.api_type in (tap_salesforce.salesforce.BULK_API_TYPE,
+                                                                         tap_salesforce.salesforce.BULK2_API_TYPE):
                 unsupported_fields.add(
                     (field_name, 'cannot query compound address fields or geolocations with bulk API'))
 
@@ -297,28 +390,142 @@ def do_discover(sf):
         entries = [e for e in entries if e['stream']
                    not in unsupported_tag_objects]
 
+    if existing_catalog is not None:
+        entries = merge_catalog_selections(entries, existing_catalog)
+
     result = {'streams': entries}
     json.dump(result, sys.stdout, indent=4)
 
+def sync_catalog_entry(sf, catalog_entry, state):
+    stream_version = get_stream_version(catalog_entry, state)
+    stream = catalog_entry['stream']
+    stream_alias = catalog_entry.get('stream_alias')
+    stream_name = catalog_entry["tap_stream_id"]
+    activate_version_message = singer.ActivateVersionMessage(
+        stream=(stream_alias or stream), version=stream_version)
+
+    catalog_metadata = metadata.to_map(catalog_entry['metadata'])
+    replication_key = catalog_metadata.get((), {}).get('replication-key')
+
+    key_properties = catalog_metadata.get((), {}).get('table-key-properties')
+    with OUTPUT_LOCK:
+        singer.write_schema(
+            stream,
+            catalog_entry['schema'],
+            key_properties,
+            replication_key,
+            stream_alias)
+
+    job_id = singer.get_bookmark(state, catalog_entry['tap_stream_id'], 'JobID')
+    batch_ids = singer.get_bookmark(state, catalog_entry['tap_stream_id'], 'BatchIDs')
+    # Checking whether job_id list is not empty and batches list is not empty
+    if job_id and batch_ids :
+        with metrics.record_counter(stream) as counter:
+            LOGGER.info("Found JobID from previous Bulk Query. Resuming sync for job: %s", job_id)
+            # Resuming a sync should clear out the remaining state once finished
+            counter = resume_syncing_bulk_query(sf, catalog_entry, job_id, state, counter)
+            LOGGER.info("%s: Completed sync (%s rows)", stream_name, counter.value)
+            # Remove Job info from state once we complete this resumed query. One of a few cases could have occurred:
+            # 1. The job succeeded, in which case make JobHighestBookmarkSeen the new bookmark
+            # 2. The job partially completed, in which case make JobHighestBookmarkSeen the new bookmark, or
+            #    existing bookmark if no bookmark exists for the Job.
+            # 3. The job completely failed, in which case maintain the existing bookmark, or None if no bookmark
+            state.get('bookmarks', {}).get(catalog_entry['tap_stream_id'], {}).pop('JobID', None)
+            state.get('bookmarks', {}).get(catalog_entry['tap_stream_id'], {}).pop('BatchIDs', None)
+            state.get('bookmarks', {}).get(catalog_entry['tap_stream_id'], {}).pop('BatchResultOffset', None)
+            bookmark = state.get('bookmarks', {}).get(catalog_entry['tap_stream_id'], {}) \
+                                                 .pop('JobHighestBookmarkSeen', None)
+            existing_bookmark = state.get('bookmarks', {}).get(catalog_entry['tap_stream_id'], {}) \
+                                                          .pop(replication_key, None)
+            state = singer.set_bookmark(
+                state,
+                catalog_entry['tap_stream_id'],
+                replication_key,
+                bookmark or existing_bookmark) # If job is removed, reset to existing bookmark or None
+            write_state(state)
+    else:
+        # Tables with a replication_key or an empty bookmark will emit an
+        # activate_version at the beginning of their sync
+        bookmark_is_empty = state.get('bookmarks', {}).get(
+            catalog_entry['tap_stream_id']) is None
+
+        if replication_key or bookmark_is_empty:
+            write_message(activate_version_message)
+            set_stream_version(catalog_entry, state, stream_version)
+
+        counter = sync_stream(sf, catalog_entry, state)
+        LOGGER.info("%s: Completed sync (%s rows)", stream_name, counter.value)
+
+def sync_streams_concurrently(sf, catalog_entries, state):
+    """Runs `sync_catalog_entry` for up to `sf.stream_concurrency` streams at
+    once. Each worker owns a `StreamState` copy that is merged back into
+    `state` whenever it is written, and the streams currently being synced
+    are tracked in `current_streams` so that an interrupted run resumes from
+    the earliest of them."""
+    stream_order = {e['tap_stream_id']: i for i, e in enumerate(catalog_entries)}
+    in_flight = []
+
+    def set_in_flight(tap_stream_id, syncing):
+        with OUTPUT_LOCK:
+            if syncing:
+                in_flight.append(tap_stream_id)
+            else:
+                in_flight.remove(tap_stream_id)
+            in_flight.sort(key=stream_order.get)
+            state["current_stream"] = in_flight[0] if in_flight else None
+            state["current_streams"] = in_flight[:]
+            write_state(state)
+
+    def run(catalog_entry):
+        tap_stream_id = catalog_entry['tap_stream_id']
+        LOGGER.info("%s: Starting", tap_stream_id)
+        set_in_flight(tap_stream_id, True)
+        stream_state = StreamState(state, tap_stream_id)
+        sync_catalog_entry(sf, catalog_entry, stream_state)
+        stream_state.merge()
+        set_in_flight(tap_stream_id, False)
+
+    with ThreadPoolExecutor(max_workers=sf.stream_concurrency) as executor:
+        futures = [executor.submit(run, catalog_entry) for catalog_entry in catalog_entries]
+        for future in as_completed(futures):
+            if future.exception() is not None:
+                # Streams that are already running are left to finish so
+                # their progress is checkpointed, the rest are abandoned
+                for pending in futures:
+                    pending.cancel()
+                raise future.exception()
+
+    state.pop("current_streams", None)
+
+def submit_bulk_jobs_ahead(sf, catalog_entries, state):
+    """Submits the Bulk jobs of `catalog_entries` that have not been
+    submitted yet, see `Bulk.submit_job_ahead`."""
+    bulk = Bulk(sf)
+    for catalog_entry in catalog_entries:
+        tap_stream_id = catalog_entry['tap_stream_id']
+        # Streams resuming a PK chunked job do not create a new one, and
+        # streams that start PK chunked or are routed to REST do not use a
+        # job submitted ahead
+        if tap_stream_id in (state.get('submitted_jobs') or {}) or \
+           singer.get_bookmark(state, tap_stream_id, 'JobID') or \
+           bulk.needs_pk_chunking(catalog_entry, state) or \
+           sf.is_small_stream(catalog_entry, state):
+            continue
+        bulk.submit_job_ahead(catalog_entry, state)
+
 def do_sync(sf, catalog, state):
-    starting_stream = state.get("current_stream")
+    starting_streams = set(state.get("current_streams") or [])
+    if state.get("current_stream"):
+        starting_streams.add(state["current_stream"])
 
-    if starting_stream:
-        LOGGER.info("Resuming sync from %s", starting_stream)
+    if starting_streams:
+        LOGGER.info("Resuming sync from %s", ", ".join(sorted(starting_streams)))
     else:
         LOGGER.info("Starting sync")
 
+    catalog_entries = []
     for catalog_entry in catalog["streams"]:
-        stream_version = get_stream_version(catalog_entry, state)
-        stream = catalog_entry['stream']
-        stream_alias = catalog_entry.get('stream_alias')
         stream_name = catalog_entry["tap_stream_id"]
-        activate_version_message = singer.ActivateVersionMessage(
-            stream=(stream_alias or stream), version=stream_version)
-
-        catalog_metadata = metadata.to_map(catalog_entry['metadata'])
-        replication_key = catalog_metadata.get((), {}).get('replication-key')
-
         mdata = metadata.to_map(catalog_entry['metadata'])
 
         if not stream_is_selected(mdata):
@@ -329,67 +536,32 @@ def do_sync(sf, catalog, state):
             LOGGER.info("%s: Skipping - blacklisted", stream_name)
             continue
 
-        if starting_stream:
-            if starting_stream == stream_name:
+        if starting_streams:
+            if stream_name in starting_streams:
                 LOGGER.info("%s: Resuming", stream_name)
-                starting_stream = None
+                starting_streams = None
             else:
                 LOGGER.info("%s: Skipping - already synced", stream_name)
                 continue
-        else:
-            LOGGER.info("%s: Starting", stream_name)
 
-        state["current_stream"] = stream_name
-        singer.write_state(state)
-        key_properties = metadata.to_map(catalog_entry['metadata']).get((), {}).get('table-key-properties')
-        singer.write_schema(
-            stream,
-            catalog_entry['schema'],
-            key_properties,
-            replication_key,
-            stream_alias)
+        catalog_entries.append(catalog_entry)
 
-        job_id = singer.get_bookmark(state, catalog_entry['tap_stream_id'], 'JobID')
-        batch_ids = singer.get_bookmark(state, catalog_entry['tap_stream_id'], 'BatchIDs')
-        # Checking whether job_id list is not empty and batches list is not empty
-        if job_id and batch_ids :
-            with metrics.record_counter(stream) as counter:
-                LOGGER.info("Found JobID from previous Bulk Query. Resuming sync for job: %s", job_id)
-                # Resuming a sync should clear out the remaining state once finished
-                counter = resume_syncing_bulk_query(sf, catalog_entry, job_id, state, counter)
-                LOGGER.info("%s: Completed sync (%s rows)", stream_name, counter.value)
-                # Remove Job info from state once we complete this resumed query. One of a few cases could have occurred:
-                # 1. The job succeeded, in which case make JobHighestBookmarkSeen the new bookmark
-                # 2. The job partially completed, in which case make JobHighestBookmarkSeen the new bookmark, or
-                #    existing bookmark if no bookmark exists for the Job.
-                # 3. The job completely failed, in which case maintain the existing bookmark, or None if no bookmark
-                state.get('bookmarks', {}).get(catalog_entry['tap_stream_id'], {}).pop('JobID', None)
-                state.get('bookmarks', {}).get(catalog_entry['tap_stream_id'], {}).pop('BatchIDs', None)
-                bookmark = state.get('bookmarks', {}).get(catalog_entry['tap_stream_id'], {}) \
-                                                     .pop('JobHighestBookmarkSeen', None)
-                existing_bookmark = state.get('bookmarks', {}).get(catalog_entry['tap_stream_id'], {}) \
-                                                              .pop(replication_key, None)
-                state = singer.set_bookmark(
-                    state,
-                    catalog_entry['tap_stream_id'],
-                    replication_key,
-                    bookmark or existing_bookmark) # If job is removed, reset to existing bookmark or None
-                singer.write_state(state)
-        else:
-            # Tables with a replication_key or an empty bookmark will emit an
-            # activate_version at the beginning of their sync
-            bookmark_is_empty = state.get('bookmarks', {}).get(
-                catalog_entry['tap_stream_id']) is None
-
-            if replication_key or bookmark_is_empty:
-                singer.write_message(activate_version_message)
-                set_stream_version(catalog_entry, state, stream_version)
+    if sf.stream_concurrency > 1:
+        sync_streams_concurrently(sf, catalog_entries, state)
+    else:
+        for index, catalog_entry in enumerate(catalog_entries):
+            # Keep the jobs of the next streams queued on Salesforce while
+            # this one is synced
+            if sf.bulk_submit_ahead and sf.api_type == tap_salesforce.salesforce.BULK_API_TYPE:
+                submit_bulk_jobs_ahead(sf, catalog_entries[index + 1:index + 1 + sf.bulk_submit_ahead], state)
 
-            counter = sync_stream(sf, catalog_entry, state)
-            LOGGER.info("%s: Completed sync (%s rows)", stream_name, counter.value)
+            LOGGER.info("%s: Starting", catalog_entry["tap_stream_id"])
+            state["current_stream"] = catalog_entry["tap_stream_id"]
+            write_state(state)
+            sync_catalog_entry(sf, catalog_entry, state)
 
     state["current_stream"] = None
-    singer.write_state(state)
+    write_state(state)
     LOGGER.info("Finished sync")
 
 def main_impl():
@@ -413,11 +585,32 @@ def main_impl():
             default_start_date=CONFIG.get('start_date'),
             api_type=CONFIG.get('api_type'),
             lookback_window=lookback_window,
+            stream_concurrency=CONFIG.get('stream_concurrency'),
+            bulk_download_concurrency=CONFIG.get('bulk_download_concurrency'),
+            bulk_stream_pk_chunks=CONFIG.get('bulk_stream_pk_chunks'),
+            bulk_spool_results=CONFIG.get('bulk_spool_results'),
+            state_flush_records=CONFIG.get('state_flush_records'),
+            state_flush_seconds=CONFIG.get('state_flush_seconds'),
+            describe_concurrency=CONFIG.get('describe_concurrency'),
+            describe_cache_dir=CONFIG.get('describe_cache_dir'),
+            discover_sobjects=CONFIG.get('discover_sobjects'),
+            bulk_submit_ahead=CONFIG.get('bulk_submit_ahead'),
+            rest_prefetch_pages=CONFIG.get('rest_prefetch_pages'),
+            rest_query_shards=CONFIG.get('rest_query_shards'),
+            count_probe=CONFIG.get('count_probe'),
+            bulk_window_concurrency=CONFIG.get('bulk_window_concurrency'),
+            pk_chunking_min_records=CONFIG.get('pk_chunking_min_records'),
+            rest_max_records=CONFIG.get('rest_max_records'),
             config_path=args.config_path)
         sf.login()
 
         if args.discover:
-            do_discover(sf)
+            # An existing catalog passed along with --discover is merged into
+            # the discovered one, keeping its selections
+            existing_catalog = args.properties
+            if args.catalog:
+                existing_catalog = singer_utils.load_json(args.catalog_path)
+            do_discover(sf, existing_catalog)
         elif args.properties:
             catalog = args.properties
             state = build_state(args.state, catalog)
@@ -0,0 +1,43 @@
+import re
+import singer.utils as singer_utils
+
+# The format singer_utils.strftime writes, which is also the format the
+# record converters give date-time fields. Values in this format compare
+# the same way as strings as they do as UTC datetimes.
+NORMALIZED_DATE_TIME_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{6}Z")
+
+
+def normalize_date_time(value):
+    """Returns a replication key value in the normalized UTC date-time
+    format, only parsing it when it is not in that format already."""
+    if isinstance(value, str) and NORMALIZED_DATE_TIME_PATTERN.fullmatch(value):
+        return value
+    return singer_utils.strftime(singer_utils.strptime_to_utc(value))
+
+
+class ReplicationKeyTracker():
+    """Keeps track of the replication key values of a stream's records
+    during a sync. Values are compared as normalized date-time strings rather
+    than being parsed into datetimes for every record.
+
+    `highest` starts at `initial_value` and is raised by every record whose
+    value is within the sync, i.e. not later than `sync_start`."""
+
+    def __init__(self, sync_start, initial_value):
+        self.sync_start = singer_utils.strftime(sync_start)
+        self.highest = normalize_date_time(initial_value)
+        self.last_value = None
+
+    def is_within_sync(self, value):
+        """Returns whether the normalized `value` is not later than the sync start."""
+        return value <= self.sync_start
+
+    def update(self, value):
+        """Records the value of the latest record, available normalized as
+        `last_value` (None for a null value). Returns True if it raised
+        `highest`."""
+        self.last_value = normalize_date_time(value) if value else None
+        if self.last_value and self.highest < self.last_value <= self.sync_start:
+            self.highest = self.last_value
+            return True
+        return False
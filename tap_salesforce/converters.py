@@ -0,0 +1,187 @@
+"""Record converters compiled from a stream's schema.
+
+singer's Transformer walks the JSON schema of every field of every record.
+The schemas built by discovery only use a handful of shapes, so each
+property is compiled once per stream into a function converting a value of
+that shape, with the same results as the Transformer and the
+`transform_bulk_data_hook` pre hook. Shapes without a compiled converter,
+and values a converter rejects, go through the Transformer itself so that
+the output and errors are unchanged."""
+import datetime
+import re
+from singer.transform import SchemaMismatch, string_to_datetime
+
+DATE_TIME_SCHEMA = [{"type": "string", "format": "date-time"}, {"type": ["string", "null"]}]
+
+# The UTC date and date-time formats Salesforce returns, e.g. 2024-01-31,
+# 2024-01-31T10:00:00.000Z (Bulk) and 2024-01-31T10:00:00.000+0000 (REST)
+UTC_DATE_TIME_PATTERN = re.compile(
+    r"(\d{4})-(\d{2})-(\d{2})(?:T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6}))?(?:Z|\+00:?00)?)?")
+
+
+class ConversionError(Exception):
+    pass
+
+
+def convert_anytype(value):
+    """Converts a value whose schema has no 'type' element due to a SF type
+    of 'anyType' to a float, boolean or None where possible."""
+    if value == "":
+        return None
+    if value in ("true", "false"):
+        return value == "true"
+    try:
+        return float(value)
+    except Exception: # pylint: disable=broad-except
+        return value
+
+
+def property_schema_is_anytype(property_schema):
+    return property_schema.get("type") is None
+
+
+def _convert_nullable_string(value):
+    if value is None or value == "":
+        return None
+    return value if isinstance(value, str) else str(value)
+
+
+def _convert_string(value):
+    if value is None:
+        raise ConversionError()
+    return value if isinstance(value, str) else str(value)
+
+
+def _convert_nullable_number(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = value.replace(",", "")
+    try:
+        return float(value)
+    except (TypeError, ValueError) as ex:
+        raise ConversionError() from ex
+
+
+def _convert_nullable_integer(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        # Salesforce can return '0.0' for integer typed fields
+        value = '0' if value == '0.0' else value.replace(",", "")
+    try:
+        return int(value)
+    except (TypeError, ValueError) as ex:
+        raise ConversionError() from ex
+
+
+def _convert_nullable_boolean(value):
+    if isinstance(value, str) and value.lower() == "false":
+        return False
+    return bool(value)
+
+
+SCALAR_CONVERTERS = {
+    ("null", "string"): _convert_nullable_string,
+    ("string",): _convert_string,
+    ("null", "number"): _convert_nullable_number,
+    ("null", "integer"): _convert_nullable_integer,
+    ("null", "boolean"): _convert_nullable_boolean,
+}
+
+
+def _format_utc_date_time(value):
+    """Formats the common UTC date-times like singer's
+    strftime(strptime_to_utc(value)) does, without going through dateutil.
+    Returns None for any other value."""
+    match = UTC_DATE_TIME_PATTERN.fullmatch(value) if isinstance(value, str) else None
+    if match is None:
+        return None
+
+    year, month, day, hour, minute, second, fraction = match.groups()
+    microsecond = int(fraction.ljust(6, '0')) if fraction else 0
+    try:
+        datetime.datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0), microsecond)
+    except ValueError:
+        return None
+
+    return "{}-{}-{}T{}:{}:{}.{:06d}Z".format(year, month, day, hour or "00", minute or "00", second or "00", microsecond)
+
+
+def _convert_date_time(value):
+    if value is None or value == "":
+        return None
+    # Values that are not dates are kept by the fallback to a string schema,
+    # and like other fields without a 'type' go through convert_anytype
+    return convert_anytype(_format_utc_date_time(value) or string_to_datetime(value) or str(value))
+
+
+def _compile_property(property_schema):
+    """Returns a function converting a value of `property_schema`, or None
+    if the value has to go through the Transformer."""
+    if property_schema.get("anyOf") == DATE_TIME_SCHEMA:
+        return _convert_date_time
+
+    if "anyOf" in property_schema or "format" in property_schema:
+        return None
+
+    if property_schema_is_anytype(property_schema):
+        return convert_anytype
+
+    types = property_schema["type"]
+    if not isinstance(types, list):
+        types = [types]
+
+    return SCALAR_CONVERTERS.get(tuple(sorted(types, key=lambda typ: typ != "null")))
+
+
+class RecordConverter():
+    """Converts the records of a stream with converters compiled from its
+    schema. Fields missing from the schema are dropped and reported by the
+    Transformer's log, except for `ignored_fields`."""
+
+    def __init__(self, schema, transformer, ignored_fields=()):
+        self.schema = schema
+        self.transformer = transformer
+        self.ignored_fields = set(ignored_fields)
+        self.is_object = schema.get("type") in ("object", ["object"])
+        self.properties = schema.get("properties", {})
+        self.converters = {name: _compile_property(property_schema)
+                           for name, property_schema in self.properties.items()}
+
+    def _transform_field(self, name, value):
+        success, value = self.transformer.transform_recur(value, self.properties[name], [name])
+        if property_schema_is_anytype(self.properties[name]):
+            value = convert_anytype(value)
+        return success, value
+
+    def convert(self, rec):
+        if not self.is_object:
+            rec = self.transformer.transform(rec, self.schema)
+            return {name: convert_anytype(value) if name in self.properties and property_schema_is_anytype(self.properties[name]) else value
+                    for name, value in rec.items()}
+
+        result = {}
+        failed = False
+        for name, value in rec.items():
+            if name in self.ignored_fields:
+                continue
+            if name not in self.converters:
+                self.transformer.removed.add(name)
+                continue
+
+            converter = self.converters[name]
+            if converter is not None:
+                try:
+                    result[name] = converter(value)
+                    continue
+                except ConversionError:
+                    pass
+
+            success, result[name] = self._transform_field(name, value)
+            failed = failed or not success
+
+        if failed:
+            raise SchemaMismatch(self.transformer.errors)
+
+        return result
@@ -0,0 +1,78 @@
+import threading
+import time
+from copy import deepcopy
+import singer
+
+# Guards stdout and the shared state dict so that messages from concurrent
+# stream workers are never interleaved and state is never serialized while
+# another worker is merging into it.
+OUTPUT_LOCK = threading.RLock()
+
+# Top level state keys that hold per-stream values keyed by tap_stream_id
+PER_STREAM_STATE_KEYS = ('bookmarks', 'versions', 'submitted_jobs')
+
+
+class StreamState(dict):
+    """A private copy of the tap state owned by a single stream worker.
+
+    The worker mutates this copy freely. Every time it is written, the
+    bookmarks and version belonging to `tap_stream_id` are merged back into
+    the shared state, which is what actually gets emitted."""
+
+    def __init__(self, shared_state, tap_stream_id):
+        with OUTPUT_LOCK:
+            super().__init__(deepcopy(dict(shared_state)))
+        self.shared_state = shared_state
+        self.tap_stream_id = tap_stream_id
+
+    def merge(self):
+        with OUTPUT_LOCK:
+            for key in PER_STREAM_STATE_KEYS:
+                value = (self.get(key) or {}).get(self.tap_stream_id)
+                if value is None:
+                    (self.shared_state.get(key) or {}).pop(self.tap_stream_id, None)
+                else:
+                    self.shared_state.setdefault(key, {})[self.tap_stream_id] = deepcopy(value)
+
+        return self.shared_state
+
+
+def write_message(message, **kwargs):
+    with OUTPUT_LOCK:
+        singer.write_message(message, **kwargs)
+
+
+def write_state(state):
+    with OUTPUT_LOCK:
+        if isinstance(state, StreamState):
+            state = state.merge()
+        singer.write_state(state)
+
+
+class ThrottledStateWriter():
+    """Writes the state of a stream at most once every `every_records`
+    calls or every `every_seconds` seconds, whichever comes first. With
+    neither set, every call writes the state.
+
+    Skipping writes is safe for streams whose records are ordered by the
+    replication key, the bookmark in any state written never points past a
+    record that has not been emitted. The caller still writes the state at
+    batch boundaries and at the end of the stream, which also writes any
+    pending update."""
+
+    def __init__(self, every_records=None, every_seconds=None):
+        self.every_records = every_records or (None if every_seconds else 1)
+        self.every_seconds = every_seconds
+        self.pending = 0
+        self.last_write = time.monotonic()
+
+    def write_state(self, state):
+        self.pending += 1
+        if (self.every_records and self.pending >= self.every_records) or \
+           (self.every_seconds and time.monotonic() - self.last_write >= self.every_seconds):
+            self.flush(state)
+
+    def flush(self, state):
+        write_state(state)
+        self.pending = 0
+        self.last_write = time.monotonic()
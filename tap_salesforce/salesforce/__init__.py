@@ -1,16 +1,24 @@
 import datetime
+import email.utils
+import fnmatch
 import json
 import re
 import threading
 import time
 import backoff
 import requests
-from requests.exceptions import RequestException
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
+from requests.exceptions import HTTPError, RequestException
 import singer
 import singer.utils as singer_utils
 from singer import metadata, metrics
 
 from tap_salesforce.salesforce.bulk import Bulk
+from tap_salesforce.salesforce.bulk2 import Bulk2
+from tap_salesforce.salesforce.concurrency import ordered_map
+from tap_salesforce.salesforce.describe_cache import DescribeCache
+from tap_salesforce.salesforce.planning import REST_MAX_RECORDS, TOO_MANY_TO_COUNT, plan_query
+from tap_salesforce.salesforce.poller import JobPoller
 from tap_salesforce.salesforce.rest import Rest, API_VERSION
 from tap_salesforce.salesforce.exceptions import (
     TapSalesforceException,
@@ -23,8 +31,10 @@ LOGGER = singer.get_logger()
 REFRESH_TOKEN_EXPIRATION_PERIOD = 900
 
 BULK_API_TYPE = "BULK"
+BULK2_API_TYPE = "BULK2"
 REST_API_TYPE = "REST"
 BATCH_DESCRIBE_SIZE = 25
+BATCH_DESCRIBE_RETRIES = 3
 
 STRING_TYPES = set([
     'id',
@@ -148,6 +158,29 @@ QUERY_INCOMPATIBLE_SALESFORCE_OBJECTS = set(['DataType',
                                              'AttachedContentNote',
                                              'QuoteTemplateRichTextData'])
 
+def parse_int_config(value, default):
+    if value is None or (isinstance(value, str) and value.strip() == ''):
+        return default
+    return int(value)
+
+def is_query_timeout(ex):
+    """Returns whether `ex` is the HTTPError of a query that timed out."""
+    if not isinstance(ex, HTTPError) or ex.response is None:
+        return False
+    try:
+        response = ex.response.json()
+    except ValueError:
+        return False
+    return isinstance(response, list) and bool(response) and response[0].get("errorCode") == "QUERY_TIMEOUT"
+
+def parse_list_config(value):
+    """Parses a list config value, given as a list or a comma separated string."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [item.strip() for item in value if item.strip()]
+
 def log_backoff_attempt(details):
     LOGGER.info("ConnectionError detected, triggering backoff: %d try", details.get("tries"))
 
@@ -223,6 +256,22 @@ class Salesforce():
                  default_start_date=None,
                  api_type=None,
                  lookback_window=None,
+                 stream_concurrency=None,
+                 bulk_download_concurrency=None,
+                 bulk_stream_pk_chunks=None,
+                 bulk_spool_results=None,
+                 state_flush_records=None,
+                 state_flush_seconds=None,
+                 describe_concurrency=None,
+                 describe_cache_dir=None,
+                 discover_sobjects=None,
+                 bulk_submit_ahead=None,
+                 rest_prefetch_pages=None,
+                 rest_query_shards=None,
+                 count_probe=None,
+                 bulk_window_concurrency=None,
+                 pk_chunking_min_records=None,
+                 rest_max_records=None,
                  config_path=None):
         self.api_type = api_type.upper() if api_type else None
         self.refresh_token = refresh_token
@@ -248,12 +297,67 @@ class Salesforce():
         self.jobs_completed = 0
         self.login_timer = None
         self.data_url = "{}/services/data/v{}.0/{}"
+        # Per-stream flags live in thread local storage so that streams
+        # synced concurrently do not see each other's values
+        self._stream_context = threading.local()
         self.pk_chunking = False
         self.lookback_window = lookback_window
+        self.stream_concurrency = max(parse_int_config(stream_concurrency, 1), 1)
+        self.bulk_download_concurrency = max(parse_int_config(bulk_download_concurrency, 1), 1)
+        self.bulk_stream_pk_chunks = bulk_stream_pk_chunks is True or (isinstance(bulk_stream_pk_chunks, str) and bulk_stream_pk_chunks.lower() == 'true')
+        self.bulk_spool_results = bulk_spool_results is True or (isinstance(bulk_spool_results, str) and bulk_spool_results.lower() == 'true')
+        self.state_flush_records = max(parse_int_config(state_flush_records, 0), 0)
+        self.state_flush_seconds = max(parse_int_config(state_flush_seconds, 0), 0)
+        self.describe_concurrency = max(parse_int_config(describe_concurrency, 1), 1)
+        self.describe_cache_dir = describe_cache_dir or None
+        self.discover_sobjects = parse_list_config(discover_sobjects)
+        self.bulk_submit_ahead = max(parse_int_config(bulk_submit_ahead, 0), 0)
+        self.rest_prefetch_pages = max(parse_int_config(rest_prefetch_pages, 0), 0)
+        self.rest_query_shards = max(parse_int_config(rest_query_shards, 1), 1)
+        self.bulk_window_concurrency = max(parse_int_config(bulk_window_concurrency, 1), 1)
+        # Streams that needed PK chunking stay PK chunked from the start
+        # unless this threshold is configured
+        self.pk_chunking_min_records = parse_int_config(pk_chunking_min_records, None)
+        self.count_probe = count_probe is True or (isinstance(count_probe, str) and count_probe.lower() == 'true')
+        # Streams are routed by the number of records their last sync
+        # returned only when the threshold is configured
+        self.route_small_streams = parse_int_config(rest_max_records, None) is not None
+        self.rest_max_records = max(parse_int_config(rest_max_records, REST_MAX_RECORDS), 0)
+        # Polls the Bulk jobs of every stream being synced
+        self.job_poller = JobPoller()
+
+        # Size the connection pool so concurrent workers are not blocked on
+        # (or discard) pooled connections
+        adapter = HTTPAdapter(pool_maxsize=max(DEFAULT_POOLSIZE,
+                                               self.stream_concurrency * self.bulk_download_concurrency,
+                                               self.stream_concurrency * self.rest_query_shards,
+                                               self.stream_concurrency * self.bulk_window_concurrency,
+                                               self.describe_concurrency))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
 
         # validate start_date
         singer_utils.strptime_to_utc(default_start_date)
 
+    @property
+    def pk_chunking(self):
+        return getattr(self._stream_context, 'pk_chunking', False)
+
+    @pk_chunking.setter
+    def pk_chunking(self, value):
+        self._stream_context.pk_chunking = value
+
+    @property
+    def query_started_at(self):
+        """When the query of the stream being synced ran before its sync
+        started, i.e. it used a job submitted ahead, the time it was
+        submitted at."""
+        return getattr(self._stream_context, 'query_started_at', None)
+
+    @query_started_at.setter
+    def query_started_at(self, value):
+        self._stream_context.query_started_at = value
+
     def _get_standard_headers(self):
         return {"Authorization": "Bearer {}".format(self.access_token)}
 
@@ -398,49 +502,154 @@ class Salesforce():
 
         return resp.json()
 
+    def describe_sobjects(self, sobject_names):
+        """Describes multiple objects. When a `describe_cache_dir` is set,
+        cached describes are revalidated with conditional requests and only
+        the objects that changed, or were not cached yet, are fetched again.
+
+        Returns a dict mapping sobject name -> description, in the order of
+        `sobject_names`."""
+        if not self.describe_cache_dir:
+            return self.batch_describe(sobject_names)
+
+        cache = DescribeCache(self.describe_cache_dir, self.instance_url, API_VERSION)
+        cached = [name for name in sobject_names if name in cache]
+
+        chunks = [cached[i:i + BATCH_DESCRIBE_SIZE] for i in range(0, len(cached), BATCH_DESCRIBE_SIZE)]
+        def revalidate(chunk):
+            return self._revalidate_describes(chunk, cache)
+
+        if self.describe_concurrency > 1:
+            revalidated_chunks = ordered_map(revalidate, chunks, self.describe_concurrency)
+        else:
+            revalidated_chunks = map(revalidate, chunks)
+
+        unchanged = changed = 0
+        for revalidated_chunk in revalidated_chunks:
+            for name, status_code, body, headers in revalidated_chunk:
+                if status_code == 304:
+                    unchanged += 1
+                elif status_code == 200:
+                    changed += 1
+                    cache.put(name, body, headers.get('Last-Modified') or email.utils.formatdate(usegmt=True), headers.get('ETag'))
+                else:
+                    # Leave it to batch_describe, which retries failed describes
+                    cache.remove(name)
+
+        uncached = [name for name in sobject_names if name not in cache]
+        fetched_at = email.utils.formatdate(usegmt=True)
+        for name, description in self.batch_describe(uncached).items():
+            cache.put(name, description, fetched_at)
+        cache.save()
+
+        LOGGER.info("Describe cache: %d objects unchanged, %d changed, %d described", unchanged, changed, len(uncached))
+
+        return {name: cache.get(name) for name in sobject_names}
+
+    def _revalidate_describes(self, sobject_names, cache):
+        """Sends a conditional describe of each of `sobject_names` in a single
+        composite request, which unlike a composite batch returns the response
+        headers. Returns a (name, status code, body, headers) tuple for each."""
+        url = self.data_url.format(self.instance_url, API_VERSION, "composite")
+        body = {
+            "allOrNone": False,
+            "compositeRequest": [
+                {
+                    "method": "GET",
+                    "url": "/services/data/v{}.0/sobjects/{}/describe".format(API_VERSION, name),
+                    "referenceId": "describe{}".format(i),
+                    "httpHeaders": cache.get_validators(name)
+                }
+                for i, name in enumerate(sobject_names)
+            ]
+        }
+        headers = self._get_standard_headers()
+        headers["Content-Type"] = "application/json"
+
+        with metrics.http_request_timer("describe") as timer:
+            timer.tags['endpoint'] = "composite"
+            resp = self._make_request('POST', url, headers=headers, body=json.dumps(body))
+
+        return [(name, result['httpStatusCode'], result.get('body'), result.get('httpHeaders') or {})
+                for name, result in zip(sobject_names, resp.json()['compositeResponse'])]
+
     def batch_describe(self, sobject_names):
         """Describes multiple objects using the Composite Batch API.
 
-        Returns a dict mapping sobject name -> description.
-        Raises exception if one or more batch request fails description.
+        Objects are described in chunks of BATCH_DESCRIBE_SIZE, up to
+        `describe_concurrency` chunks at a time. Returns a dict mapping
+        sobject name -> description, in the order of `sobject_names`.
+        Raises exception if one or more objects still fail description after
+        BATCH_DESCRIBE_RETRIES attempts.
         """
-        url = self.data_url.format(self.instance_url, API_VERSION, "composite/batch")
+        chunks = [sobject_names[i:i + BATCH_DESCRIBE_SIZE]
+                  for i in range(0, len(sobject_names), BATCH_DESCRIBE_SIZE)]
+
+        if self.describe_concurrency > 1:
+            described_chunks = ordered_map(self._describe_chunk, chunks, self.describe_concurrency)
+        else:
+            described_chunks = map(self._describe_chunk, chunks)
+
         results = {}
+        for described_chunk in described_chunks:
+            results.update(described_chunk)
+
+        return results
 
-        for i in range(0, len(sobject_names), BATCH_DESCRIBE_SIZE):
-            chunk = sobject_names[i:i + BATCH_DESCRIBE_SIZE]
-            body = {
-                "haltOnError": True,
-                "batchRequests": [
-                    {
-                        "method": "GET",
-                        "url": "/services/data/v{}.0/sobjects/{}/describe".format(API_VERSION, name)
-                    }
-                    for name in chunk
-                ]
-            }
-            headers = self._get_standard_headers()
-            headers["Content-Type"] = "application/json"
-
-            with metrics.http_request_timer("describe") as timer:
-                timer.tags['endpoint'] = "composite_batch"
-                resp = self._make_request('POST', url, headers=headers, body=json.dumps(body))
-
-            resp_json = resp.json()
-
-            if resp_json["hasErrors"]:
-                errors = [result["result"] for result in resp_json["results"] if result["statusCode"] != 200]
-                raise TapSalesforceException(f"Error(s) contained in composite batch response: {errors}")
+    def _describe_chunk(self, chunk):
+        """Describes a chunk of objects with a single composite batch request.
+        Objects whose describe fails are requested again in a new batch
+        rather than failing the whole discovery."""
+        results = {}
+        for attempt in range(1, BATCH_DESCRIBE_RETRIES + 1):
+            resp_json = self._post_describe_batch(chunk)
 
             # hasErrors was false but result count is still wrong
             if len(resp_json["results"]) != len(chunk):
                 raise TapSalesforceException(f"Composite batch returned {len(resp_json['results'])} results but expected {len(chunk)}")
 
+            errors = {}
             for name, result in zip(chunk, resp_json["results"]):
-                results[name] = result["result"]
+                if result["statusCode"] == 200:
+                    results[name] = result["result"]
+                else:
+                    errors[name] = result["result"]
+
+            if not errors:
+                break
+
+            if attempt == BATCH_DESCRIBE_RETRIES:
+                raise TapSalesforceException(f"Error(s) contained in composite batch response: {list(errors.values())}")
+
+            LOGGER.info("Describe failed for %s, retrying (attempt %d of %d)", sorted(errors), attempt, BATCH_DESCRIBE_RETRIES)
+            time.sleep(2 ** attempt)
+            chunk = list(errors)
 
         return results
 
+    def _post_describe_batch(self, sobject_names):
+        url = self.data_url.format(self.instance_url, API_VERSION, "composite/batch")
+        body = {
+            # Keep describing the other objects when one of them fails so
+            # that only the failed ones have to be retried
+            "haltOnError": False,
+            "batchRequests": [
+                {
+                    "method": "GET",
+                    "url": "/services/data/v{}.0/sobjects/{}/describe".format(API_VERSION, name)
+                }
+                for name in sobject_names
+            ]
+        }
+        headers = self._get_standard_headers()
+        headers["Content-Type"] = "application/json"
+
+        with metrics.http_request_timer("describe") as timer:
+            timer.tags['endpoint'] = "composite_batch"
+            resp = self._make_request('POST', url, headers=headers, body=json.dumps(body))
+
+        return resp.json()
+
     def _get_selected_properties(self, catalog_entry):
         mdata = metadata.to_map(catalog_entry['metadata'])
         properties = catalog_entry['schema'].get('properties', {})
@@ -494,38 +703,117 @@ class Salesforce():
         else:
             return query
 
+    def _build_count_query_string(self, catalog_entry, start_date):
+        query = "SELECT COUNT() FROM {}".format(catalog_entry['stream'])
+
+        catalog_metadata = metadata.to_map(catalog_entry['metadata'])
+        replication_key = catalog_metadata.get((), {}).get('replication-key')
+
+        if replication_key:
+            return query + " WHERE {} >= {}".format(replication_key, start_date)
+        return query
+
+    def probe_record_count(self, catalog_entry, start_date):
+        """Returns the number of records a query of the stream from
+        `start_date` returns, counted with a SELECT COUNT() query,
+        `TOO_MANY_TO_COUNT` if counting them timed out, or None if counting
+        them failed otherwise."""
+        url = "{}/services/data/v{}.0/queryAll".format(self.instance_url, API_VERSION)
+        params = {"q": self._build_count_query_string(catalog_entry, start_date)}
+
+        try:
+            with metrics.http_request_timer("count") as timer:
+                timer.tags['sobject'] = catalog_entry['stream']
+                resp = self._make_request('GET', url, headers=self._get_standard_headers(), params=params)
+            return resp.json()['totalSize']
+        except Exception as ex: # pylint: disable=broad-except
+            if is_query_timeout(ex):
+                return TOO_MANY_TO_COUNT
+            LOGGER.warning("Counting the records of %s failed, querying it without a plan: %s",
+                           catalog_entry['stream'], ex)
+            return None
+
+    def plan_query(self, catalog_entry, state):
+        """Plans the query of a stream from the number of records it is
+        expected to return, see `planning.plan_query`. The records are
+        counted with `probe_record_count` when `count_probe` is set, otherwise
+        the number of records the last sync returned is used. Returns None
+        when the number of records is not known."""
+        start_date = self.get_start_date(state, catalog_entry)
+        if self.count_probe:
+            record_count = self.probe_record_count(catalog_entry, start_date)
+        else:
+            record_count = singer.get_bookmark(state, catalog_entry['tap_stream_id'], 'LastSyncRecords')
+        if record_count is None:
+            return None
+        replication_key = metadata.to_map(catalog_entry['metadata']).get((), {}).get('replication-key')
+
+        plan = plan_query(self.api_type, record_count, start_date, replication_key, self.rest_max_records)
+        LOGGER.info("%s: Planned query of %s records: %s", catalog_entry['tap_stream_id'], record_count, plan)
+
+        return plan
+
+    def is_small_stream(self, catalog_entry, state):
+        """Returns whether the last sync of the stream returned few enough
+        records for its Bulk query to be routed to REST."""
+        record_count = singer.get_bookmark(state, catalog_entry['tap_stream_id'], 'LastSyncRecords')
+        return self.route_small_streams and record_count is not None and record_count <= self.rest_max_records
+
     def query(self, catalog_entry, state):
-        if self.api_type == BULK_API_TYPE:
+        plan = self.plan_query(catalog_entry, state) if self.count_probe or self.route_small_streams else None
+        api_type = plan.api_type if plan else self.api_type
+        if api_type != self.api_type:
+            # A Bulk job submitted ahead for the stream is left unused, and a
+            # Bulk API 2.0 job it was interrupted in is not resumed later, as
+            # its query started from an older bookmark
+            (state.get('submitted_jobs') or {}).pop(catalog_entry['tap_stream_id'], None)
+            stream_bookmarks = state.get('bookmarks', {}).get(catalog_entry['tap_stream_id'], {})
+            stream_bookmarks.pop('Bulk2JobID', None)
+            stream_bookmarks.pop('Bulk2Locator', None)
+
+        if api_type == BULK_API_TYPE:
             bulk = Bulk(self)
-            return bulk.query(catalog_entry, state)
-        elif self.api_type == REST_API_TYPE:
+            return bulk.query(catalog_entry, state, plan)
+        elif api_type == BULK2_API_TYPE:
+            bulk2 = Bulk2(self)
+            return bulk2.query(catalog_entry, state)
+        elif api_type == REST_API_TYPE:
             rest = Rest(self)
-            return rest.query(catalog_entry, state)
+            return rest.query(catalog_entry, state, plan)
         else:
             raise TapSalesforceException(
-                "api_type should be REST or BULK was: {}".format(
+                "api_type should be REST, BULK or BULK2 was: {}".format(
                     self.api_type))
 
+    def is_discover_included(self, sobject_name):
+        """Returns whether `sobject_name` matches one of the `discover_sobjects`
+        names or glob patterns, which like sobject names are case insensitive.
+        Every object is included when none are configured."""
+        if not self.discover_sobjects:
+            return True
+        return any(fnmatch.fnmatchcase(sobject_name.lower(), pattern.lower())
+                   for pattern in self.discover_sobjects)
+
     def get_blacklisted_objects(self):
-        if self.api_type == BULK_API_TYPE:
+        if self.api_type in (BULK_API_TYPE, BULK2_API_TYPE):
             return UNSUPPORTED_BULK_API_SALESFORCE_OBJECTS.union(
                 QUERY_RESTRICTED_SALESFORCE_OBJECTS).union(QUERY_INCOMPATIBLE_SALESFORCE_OBJECTS)
         elif self.api_type == REST_API_TYPE:
             return QUERY_RESTRICTED_SALESFORCE_OBJECTS.union(QUERY_INCOMPATIBLE_SALESFORCE_OBJECTS)
         else:
             raise TapSalesforceException(
-                "api_type should be REST or BULK was: {}".format(
+                "api_type should be REST, BULK or BULK2 was: {}".format(
                     self.api_type))
 
     # pylint: disable=line-too-long
     def get_blacklisted_fields(self):
-        if self.api_type == BULK_API_TYPE:
+        if self.api_type in (BULK_API_TYPE, BULK2_API_TYPE):
             return {('EntityDefinition', 'RecordTypesSupported'): "this field is unsupported by the Bulk API."}
         elif self.api_type == REST_API_TYPE:
             return {}
         else:
             raise TapSalesforceException(
-                "api_type should be REST or BULK was: {}".format(
+                "api_type should be REST, BULK or BULK2 was: {}".format(
                     self.api_type))
 
     def get_window_end_date(self, start_date, end_date):
@@ -1,25 +1,43 @@
 # pylint: disable=protected-access,use-yield-from
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import csv
+import hashlib
+import itertools
 import json
+import queue
 import sys
-import time
 import tempfile
 import singer
 import singer.utils as singer_utils
-from singer import metrics
+from singer import metadata, metrics
 import requests
-from requests.exceptions import RequestException
+from requests.exceptions import (
+    ChunkedEncodingError,
+    ConnectionError as RequestsConnectionError,
+    RequestException)
 
 import xmltodict
 
+from tap_salesforce.messages import write_state
+from tap_salesforce.salesforce.chunking import DEFAULT_CHUNK_SIZE, ChunkSizer
+from tap_salesforce.salesforce.concurrency import NOT_READY, ordered_map
+from tap_salesforce.salesforce.poller import PollInterval
+from tap_salesforce.salesforce.windowing import WindowPlan, WindowSizer
 from tap_salesforce.salesforce.rest import API_VERSION
 from tap_salesforce.salesforce.exceptions import (
     TapSalesforceException, TapSalesforceQuotaExceededException)
 
+# Batch statuses are polled at adaptive intervals (see PollInterval),
+# starting at the initial sleep and growing up to the maximum one
+BATCH_STATUS_POLLING_INITIAL_SLEEP = 1
 BATCH_STATUS_POLLING_SLEEP = 20
+PK_CHUNKED_BATCH_STATUS_POLLING_INITIAL_SLEEP = 5
 PK_CHUNKED_BATCH_STATUS_POLLING_SLEEP = 60
-ITER_CHUNK_SIZE = 1024
-DEFAULT_CHUNK_SIZE = 100000 # Max is 250000
+# How long a PK chunked job whose chunks are downloaded concurrently is
+# watched for new completed chunks before the ones already downloaded are
+# emitted
+PK_CHUNK_WATCH_TIMEOUT = 1
+ITER_CHUNK_SIZE = 65536
 MAX_RETRIES = 4
 LOGGER = singer.get_logger()
 
@@ -40,6 +58,46 @@ def find_parent(stream):
     return parent_stream
 
 
+def records_processed(batches):
+    """Returns the number of records processed so far by `batches`, a
+    batchInfo or a list of them."""
+    if isinstance(batches, dict):
+        batches = [batches]
+    return sum(int(b.get('numberRecordsProcessed') or 0) for b in batches)
+
+
+def iter_csv_lines(chunks, encoding=None, position=None):
+    """Splits a CSV body given as byte chunks into decoded lines. Line
+    breaks are kept and only newline bytes are split on, so line breaks
+    within a quoted value reach the CSV reader intact and other unicode
+    line boundaries are left alone. NULL bytes are removed so that lines can
+    be safely given to the CSV reader. If a `position` dict is given, its
+    'offset' is advanced by the size in bytes of every line yielded."""
+    encoding = encoding or 'utf-8'
+    pending = []
+
+    for chunk in chunks:
+        lines = chunk.split(b'\n')
+        if len(lines) == 1:
+            pending.append(chunk)
+            continue
+
+        pending.append(lines[0])
+        lines[0] = b''.join(pending)
+        pending = [lines.pop()]
+
+        for line in lines:
+            if position is not None:
+                position['offset'] += len(line) + 1
+            yield (line + b'\n').decode(encoding).replace('\0', '')
+
+    if any(pending):
+        line = b''.join(pending)
+        if position is not None:
+            position['offset'] += len(line)
+        yield line.decode(encoding).replace('\0', '')
+
+
 class Bulk():
 
     bulk_url = "{}/services/async/{}.0/{}"
@@ -59,10 +117,10 @@ class Bulk():
                         return False
         return True
 
-    def query(self, catalog_entry, state):
+    def query(self, catalog_entry, state, plan=None):
         self.check_bulk_quota_usage()
 
-        for record in self._bulk_query(catalog_entry, state):
+        for record in self._bulk_query(catalog_entry, state, plan):
             yield record
 
         self.sf.jobs_completed += 1
@@ -107,46 +165,242 @@ class Bulk():
                 "Retried more" in failure_message or \
                 "Failed to write query result" in failure_message
 
-    def _bulk_query(self, catalog_entry, state):
-        job_id = self._create_job(catalog_entry)
+    def _bulk_query(self, catalog_entry, state, plan=None):
         start_date = self.sf.get_start_date(state, catalog_entry)
 
-        batch_id = self._add_batch(catalog_entry, job_id, start_date)
+        # The query of a stream without a replication key is never windowed
+        replication_key = metadata.to_map(catalog_entry['metadata']).get((), {}).get('replication-key')
+        window_sizer = WindowSizer(self.sf, catalog_entry['tap_stream_id'], state if replication_key else None)
+        if plan is not None and plan.window_size:
+            window_sizer.limit(plan.window_size)
+
+        needs_pk_chunking = self.needs_pk_chunking(catalog_entry, state)
+        if plan is not None and plan.pk_chunking or needs_pk_chunking:
+            LOGGER.info("Starting Bulk Query of %s with PK Chunking", catalog_entry['stream'])
+            # A job submitted ahead is not PK chunked, leave it unused
+            (state.get('submitted_jobs') or {}).pop(catalog_entry['tap_stream_id'], None)
+            for result in self._pk_chunked_query(catalog_entry, start_date, state, window_sizer, needs_pk_chunking):
+                yield result
+            return
 
-        self._close_job(job_id)
+        job_id, batch_id = self._pop_submitted_job(catalog_entry, state, start_date)
+        if job_id is None:
+            job_id, batch_id = self._submit_job(catalog_entry, start_date)
 
         batch_status = self._poll_on_batch_status(job_id, batch_id)
 
         if batch_status['state'] == 'Failed':
             if self._can_pk_chunk_job(batch_status['stateMessage']):
-                # Get list of batch_status with pk_chunking or date_windowing
-                status_list = self._bulk_with_window([], catalog_entry, start_date)
-
-                for batch_status in status_list:
-                    job_id = batch_status['job_id']
-
-                    # Set pk_chunking to True to indicate that we should write a bookmark differently
-                    self.sf.pk_chunking = True
-
-                    # Add the bulk Job ID and its batches to the state so it can be resumed if necessary
-                    tap_stream_id = catalog_entry['tap_stream_id']
-                    state = singer.set_bookmark(state, tap_stream_id, 'JobID', job_id)
-                    state = singer.set_bookmark(state, tap_stream_id, 'BatchIDs', batch_status['completed'][:])
-
-                    for completed_batch_id in batch_status['completed']:
-                        for result in self.get_batch_results(job_id, completed_batch_id, catalog_entry):
-                            yield result
-                        # Remove the completed batch ID and write state
-                        state['bookmarks'][catalog_entry['tap_stream_id']]["BatchIDs"].remove(completed_batch_id)
-                        LOGGER.info("Finished syncing batch %s. Removed batch from state.", completed_batch_id)
-                        LOGGER.info("Batches to go: %d", len(state['bookmarks'][catalog_entry['tap_stream_id']]["BatchIDs"]))
-                        singer.write_state(state)
+                for result in self._pk_chunked_query(catalog_entry, start_date, state, window_sizer, True):
+                    yield result
             else:
                 raise TapSalesforceException(batch_status['stateMessage'])
         else:
             for result in self.get_batch_results(job_id, batch_id, catalog_entry):
                 yield result
 
+    def needs_pk_chunking(self, catalog_entry, state):
+        """Returns whether a sync of the stream once had to PK chunk its
+        query, in which case its query is PK chunked right away. When
+        `pk_chunking_min_records` is configured, streams whose PK chunked
+        syncs never returned that many records are forgotten, and start with
+        a plain query again."""
+        tap_stream_id = catalog_entry['tap_stream_id']
+        record_count = singer.get_bookmark(state, tap_stream_id, 'PKChunkedRecords')
+        if record_count is None:
+            return False
+
+        if self.sf.pk_chunking_min_records is not None and record_count < self.sf.pk_chunking_min_records:
+            LOGGER.info("%s returned at most %d records when PK chunked, starting with a plain query",
+                        tap_stream_id, record_count)
+            state['bookmarks'][tap_stream_id].pop('PKChunkedRecords')
+            return False
+        return True
+
+    #pylint: disable=too-many-positional-arguments
+    def _pk_chunked_query(self, catalog_entry, start_date, state, window_sizer, remember):
+        """Runs a PK chunked query. When `remember` is set, because a plain
+        query of the stream failed now or in an earlier sync, the largest
+        number of records its PK chunked queries returned is kept in its
+        'PKChunkedRecords' bookmark, which only `needs_pk_chunking` removes."""
+        record_count = 0
+        for result in self._run_pk_chunked_query(catalog_entry, start_date, state, window_sizer):
+            record_count += 1
+            yield result
+
+        if not remember:
+            return
+
+        tap_stream_id = catalog_entry['tap_stream_id']
+        largest_count = singer.get_bookmark(state, tap_stream_id, 'PKChunkedRecords')
+        singer.set_bookmark(state, tap_stream_id, 'PKChunkedRecords', max(record_count, largest_count or 0))
+
+    def _run_pk_chunked_query(self, catalog_entry, start_date, state, window_sizer):
+        chunk_sizer = ChunkSizer(self.sf, catalog_entry, state)
+        if self.sf.bulk_stream_pk_chunks:
+            failed_batches = {}
+            for result in self._stream_pk_chunked_query(catalog_entry, start_date, state, failed_batches, chunk_sizer):
+                yield result
+
+            if not failed_batches:
+                return
+
+            # Records of the completed chunks have already been
+            # emitted, they will be emitted again by the windowed
+            # retry of the whole date range
+            LOGGER.info("%d PK chunked batches failed, retrying with date windowing", len(failed_batches))
+            window_sizer.failed(singer_utils.strptime_with_tz(start_date), singer_utils.now())
+
+        # Get list of batch_status with pk_chunking or date_windowing
+        status_list = self._bulk_with_window([], catalog_entry, start_date, window_sizer=window_sizer, state=state,
+                                             chunk_sizer=chunk_sizer)
+
+        for result in self._get_pk_chunked_results(status_list, catalog_entry, state):
+            yield result
+
+    def _submit_job(self, catalog_entry, start_date):
+        job_id = self._create_job(catalog_entry)
+
+        batch_id = self._add_batch(catalog_entry, job_id, start_date)
+
+        self._close_job(job_id)
+
+        return job_id, batch_id
+
+    def _get_query_hash(self, catalog_entry, start_date):
+        query = self.sf._build_query_string(catalog_entry, start_date)
+        return hashlib.sha1(query.encode('utf-8')).hexdigest()
+
+    def submit_job_ahead(self, catalog_entry, state):
+        """Submits the job of a stream before its turn to be synced, so that
+        Salesforce runs its query while the streams before it are synced.
+
+        The job is kept in the 'submitted_jobs' of the state along with a
+        hash of its query, and picked up when the stream is synced later in
+        this run if its query is still the same."""
+        self.check_bulk_quota_usage()
+
+        start_date = self.sf.get_start_date(state, catalog_entry)
+        job_id, batch_id = self._submit_job(catalog_entry, start_date)
+        LOGGER.info("Submitted job %s ahead for %s", job_id, catalog_entry['tap_stream_id'])
+
+        state.setdefault('submitted_jobs', {})[catalog_entry['tap_stream_id']] = {
+            'JobID': job_id,
+            'BatchID': batch_id,
+            'QueryHash': self._get_query_hash(catalog_entry, start_date),
+            'SubmittedAt': singer_utils.strftime(singer_utils.now())}
+        write_state(state)
+
+    def _pop_submitted_job(self, catalog_entry, state, start_date):
+        """Returns the job ID and batch ID of the job submitted ahead for the
+        stream, or (None, None) if there is none that can be used."""
+        submitted_job = (state.get('submitted_jobs') or {}).pop(catalog_entry['tap_stream_id'], None)
+        if submitted_job is None:
+            return None, None
+
+        job_id = submitted_job['JobID']
+        if not submitted_job.get('SubmittedAt'):
+            LOGGER.info("Discarding job %s submitted ahead, the time it was submitted at is unknown", job_id)
+            return None, None
+        if submitted_job['QueryHash'] != self._get_query_hash(catalog_entry, start_date):
+            LOGGER.info("Discarding job %s submitted ahead, the query of %s has changed since", job_id, catalog_entry['tap_stream_id'])
+            return None, None
+        if not self.job_exists(job_id):
+            LOGGER.info("Discarding job %s submitted ahead, it no longer exists", job_id)
+            return None, None
+
+        LOGGER.info("Using job %s submitted ahead for %s", job_id, catalog_entry['tap_stream_id'])
+        # The job holds no record modified after it was submitted, an empty
+        # result must not move the bookmark past that time
+        self.sf.query_started_at = singer_utils.strptime_with_tz(submitted_job['SubmittedAt'])
+        return job_id, submitted_job['BatchID']
+
+    def _get_pk_chunked_results(self, status_list, catalog_entry, state):
+        for batch_status in status_list:
+            job_id = batch_status['job_id']
+
+            # Set pk_chunking to True to indicate that we should write a bookmark differently
+            self.sf.pk_chunking = True
+
+            # Add the bulk Job ID and its batches to the state so it can be resumed if necessary
+            tap_stream_id = catalog_entry['tap_stream_id']
+            state = singer.set_bookmark(state, tap_stream_id, 'JobID', job_id)
+            state = singer.set_bookmark(state, tap_stream_id, 'BatchIDs', batch_status['completed'][:])
+            state = singer.set_bookmark(state, tap_stream_id, 'BatchResultOffset', {})
+            checkpoint = state['bookmarks'][tap_stream_id]['BatchResultOffset']
+
+            for completed_batch_id, results in self.iter_batch_results(job_id, batch_status['completed'], catalog_entry, checkpoint):
+                for result in results:
+                    yield result
+                # Remove the completed batch ID and write state
+                checkpoint.clear()
+                state['bookmarks'][catalog_entry['tap_stream_id']]["BatchIDs"].remove(completed_batch_id)
+                LOGGER.info("Finished syncing batch %s. Removed batch from state.", completed_batch_id)
+                LOGGER.info("Batches to go: %d", len(state['bookmarks'][catalog_entry['tap_stream_id']]["BatchIDs"]))
+                write_state(state)
+
+    #pylint: disable=too-many-positional-arguments
+    def _stream_pk_chunked_query(self, catalog_entry, start_date, state, failed_batches, chunk_sizer=None):
+        """Runs a PK chunked job over the whole date range and yields the
+        records of each chunk as soon as it completes, instead of waiting for
+        every chunk. Every chunk Salesforce creates is kept in `BatchIDs`
+        until it has been emitted so that a resumed sync waits for the ones
+        that had not completed yet. Failed chunks are added to
+        `failed_batches` and stay in `BatchIDs`, so that a resumed sync
+        keeps the existing bookmark. The chunks are sized by `chunk_sizer`, if given."""
+        LOGGER.info("Retrying Bulk Query with PK Chunking, streaming batches as they complete")
+
+        job_id = self._create_job(catalog_entry, True, chunk_sizer.size if chunk_sizer else DEFAULT_CHUNK_SIZE)
+        self._add_batch(catalog_entry, job_id, start_date, order_by_clause=False)
+
+        # Set pk_chunking to True to indicate that we should write a bookmark differently
+        self.sf.pk_chunking = True
+
+        tap_stream_id = catalog_entry['tap_stream_id']
+        state = singer.set_bookmark(state, tap_stream_id, 'JobID', job_id)
+        state = singer.set_bookmark(state, tap_stream_id, 'BatchIDs', [])
+        state = singer.set_bookmark(state, tap_stream_id, 'BatchResultOffset', {})
+        batch_ids = state['bookmarks'][tap_stream_id]['BatchIDs']
+        checkpoint = state['bookmarks'][tap_stream_id]['BatchResultOffset']
+        last_seen_batches = {}
+
+        # Chunks downloaded concurrently are emitted as soon as they are
+        # ready, without waiting for the next chunks to complete
+        timeout = PK_CHUNK_WATCH_TIMEOUT if self.sf.bulk_download_concurrency > 1 else None
+
+        def completed_batch_ids():
+            for batches in self.watch_pk_chunked_batches(job_id, timeout):
+                if not batches:
+                    yield NOT_READY
+                    continue
+
+                last_seen_batches.update({b['id']: b for b in batches})
+                new_batch_ids = [b['id'] for b in batches if b['id'] not in batch_ids]
+                if new_batch_ids:
+                    batch_ids.extend(new_batch_ids)
+                    write_state(state)
+
+                for batch in batches:
+                    if batch['state'] == 'Completed':
+                        yield batch['id']
+                    elif batch['state'] == 'Failed':
+                        failed_batches[batch['id']] = batch.get('stateMessage')
+
+        for completed_batch_id, results in self.iter_batch_results(job_id, completed_batch_ids(), catalog_entry, checkpoint):
+            for result in results:
+                yield result
+            checkpoint.clear()
+            batch_ids.remove(completed_batch_id)
+            LOGGER.info("Finished syncing batch %s. Removed batch from state.", completed_batch_id)
+            LOGGER.info("Batches to go: %d", len(batch_ids))
+            write_state(state)
+
+        if chunk_sizer is not None:
+            chunk_sizer.job_done(list(last_seen_batches.values()))
+
+        # Close the job after all the batches are complete
+        self._close_job(job_id)
+
     def _bulk_query_with_pk_chunking(self, catalog_entry, start_date):
         LOGGER.info("Retrying Bulk Query with PK Chunking")
 
@@ -163,7 +417,7 @@ class Bulk():
 
         return batch_status
 
-    def _create_job(self, catalog_entry, pk_chunking=False):
+    def _create_job(self, catalog_entry, pk_chunking=False, chunk_size=DEFAULT_CHUNK_SIZE):
         url = self.bulk_url.format(self.sf.instance_url, API_VERSION, "job")
         body = {"operation": "queryAll", "object": catalog_entry['stream'], "contentType": "CSV"}
 
@@ -173,7 +427,7 @@ class Bulk():
         if pk_chunking:
             LOGGER.info("ADDING PK CHUNKING HEADER")
 
-            headers['Sforce-Enable-PKChunking'] = "true; chunkSize={}".format(DEFAULT_CHUNK_SIZE)
+            headers['Sforce-Enable-PKChunking'] = "true; chunkSize={}".format(chunk_size)
 
             # If the stream ends with 'CleanInfo' or 'History', we can PK Chunk on the object's parent
             if any(catalog_entry['stream'].endswith(suffix) for suffix in ["CleanInfo", "History"]):
@@ -211,30 +465,75 @@ class Bulk():
         return batch['batchInfo']['id']
 
     def _poll_on_pk_chunked_batch_status(self, job_id):
-        batches = self._get_batches(job_id)
+        def check(batches):
+            if any(b['state'] in ("Queued", "InProgress") for b in batches):
+                return None
+            completed_batches = [b['id'] for b in batches if b['state'] == "Completed"]
+            failed_batches = {b['id']: b.get('stateMessage') for b in batches if b['state'] == "Failed"}
+            return {'completed': completed_batches, 'failed': failed_batches, 'batches': batches}
+
+        return self.sf.job_poller.wait(
+            job_id,
+            lambda: self._get_batches(job_id),
+            check,
+            PollInterval(PK_CHUNKED_BATCH_STATUS_POLLING_INITIAL_SLEEP, PK_CHUNKED_BATCH_STATUS_POLLING_SLEEP),
+            records_processed)
+
+    def watch_pk_chunked_batches(self, job_id, timeout=None):
+        """Polls the batches of a PK chunked job with the shared job poller
+        until no batch is Queued or InProgress. After each poll, yields the
+        list of batches that were seen for the first time or whose state
+        changed. The original batch that Salesforce splits into chunks ('Not
+        Processed') is skipped. With a `timeout`, an empty list is yielded
+        whenever no batch changed for that many seconds."""
+        events = queue.Queue()
+        seen_states = {}
+
+        # Called on the poller's thread, hands the changes over to this one
+        def check(batches):
+            changed_batches = [b for b in batches
+                               if b['state'] != 'Not Processed' and seen_states.get(b['id']) != b['state']]
+            if changed_batches:
+                seen_states.update({b['id']: b['state'] for b in changed_batches})
+                events.put(changed_batches)
+
+            if any(b['state'] in ('Queued', 'InProgress') for b in batches):
+                return None
+            return True
+
+        done = self.sf.job_poller.submit(
+            job_id,
+            lambda: self._get_batches(job_id),
+            check,
+            PollInterval(PK_CHUNKED_BATCH_STATUS_POLLING_INITIAL_SLEEP, PK_CHUNKED_BATCH_STATUS_POLLING_SLEEP),
+            records_processed)
+        done.add_done_callback(lambda _: events.put(None))
 
-        while True:
-            queued_batches = [b['id'] for b in batches if b['state'] == "Queued"]
-            in_progress_batches = [b['id'] for b in batches if b['state'] == "InProgress"]
-
-            if not queued_batches and not in_progress_batches:
-                completed_batches = [b['id'] for b in batches if b['state'] == "Completed"]
-                failed_batches = {b['id']: b.get('stateMessage') for b in batches if b['state'] == "Failed"}
-                return {'completed': completed_batches, 'failed': failed_batches}
-            else:
-                time.sleep(PK_CHUNKED_BATCH_STATUS_POLLING_SLEEP)
-                batches = self._get_batches(job_id)
+        try:
+            while True:
+                try:
+                    event = events.get(timeout=timeout)
+                except queue.Empty:
+                    yield []
+                    continue
+                if event is None:
+                    # Raises the errors of the polls
+                    done.result()
+                    return
+                yield event
+        finally:
+            self.sf.job_poller.cancel(done)
 
     def _poll_on_batch_status(self, job_id, batch_id):
-        batch_status = self._get_batch(job_id=job_id,
-                                       batch_id=batch_id)
+        def check(batch_status):
+            return batch_status if batch_status['state'] in ['Completed', 'Failed', 'Not Processed'] else None
 
-        while batch_status['state'] not in ['Completed', 'Failed', 'Not Processed']:
-            time.sleep(BATCH_STATUS_POLLING_SLEEP)
-            batch_status = self._get_batch(job_id=job_id,
-                                           batch_id=batch_id)
-
-        return batch_status
+        return self.sf.job_poller.wait(
+            (job_id, batch_id),
+            lambda: self._get_batch(job_id=job_id, batch_id=batch_id),
+            check,
+            PollInterval(BATCH_STATUS_POLLING_INITIAL_SLEEP, BATCH_STATUS_POLLING_SLEEP),
+            records_processed)
 
     def job_exists(self, job_id):
         try:
@@ -280,16 +579,45 @@ class Bulk():
 
         return batch['batchInfo']
 
-    def get_batch_results(self, job_id, batch_id, catalog_entry):
+    def get_batch_results(self, job_id, batch_id, catalog_entry, checkpoint=None):
         """Given a job_id and batch_id, queries the batches results and reads
-        CSV lines yielding each line as a record."""
-        headers = self._get_bulk_headers()
+        CSV lines yielding each line as a record. Results are parsed straight
+        off the HTTP response unless `bulk_spool_results` is set, in which
+        case each result file is downloaded to disk first.
+
+        When a `checkpoint` dict is given, it is kept up to date with the
+        result ID, byte offset and row offset of the last record yielded, and
+        a checkpoint left for this batch by an earlier run is resumed from."""
+        if self.sf.bulk_spool_results:
+            _, csv_files = self._download_batch_results(job_id, batch_id, catalog_entry)
+            return self._read_batch_results(batch_id, csv_files, checkpoint)
+
+        return self._stream_batch_results(job_id, batch_id, catalog_entry, checkpoint)
+
+    def iter_batch_results(self, job_id, batch_ids, catalog_entry, checkpoint=None):
+        """Yields a (batch_id, records) pair for each batch in order. When
+        `bulk_download_concurrency` is greater than one, the result files of
+        the upcoming batches are downloaded in the background while the
+        current batch is being read, and `batch_ids` may then yield
+        `NOT_READY` while the next batch has not completed yet."""
+        if self.sf.bulk_download_concurrency <= 1:
+            for batch_id in batch_ids:
+                yield batch_id, self.get_batch_results(job_id, batch_id, catalog_entry, checkpoint)
+            return
+
+        downloads = ordered_map(lambda batch_id: self._download_batch_results(job_id, batch_id, catalog_entry),
+                                batch_ids,
+                                self.sf.bulk_download_concurrency)
+        for batch_id, csv_files in downloads:
+            yield batch_id, self._read_batch_results(batch_id, csv_files, checkpoint)
+
+    def _get_batch_result_ids(self, job_id, batch_id, catalog_entry):
         endpoint = "job/{}/batch/{}/result".format(job_id, batch_id)
         url = self.bulk_url.format(self.sf.instance_url, API_VERSION, endpoint)
 
         with metrics.http_request_timer("batch_result_list") as timer:
             timer.tags['sobject'] = catalog_entry['stream']
-            batch_result_resp = self.sf._make_request('GET', url, headers=headers)
+            batch_result_resp = self.sf._make_request('GET', url, headers=self._get_bulk_headers())
 
         # Returns a Dict where input:
         #   <result-list><result>1</result><result>2</result></result-list>
@@ -298,29 +626,150 @@ class Bulk():
                                             xml_attribs=False,
                                             force_list={'result'})['result-list']
 
-        for result in batch_result_list['result']:
-            endpoint = "job/{}/batch/{}/result/{}".format(job_id, batch_id, result)
-            url = self.bulk_url.format(self.sf.instance_url, API_VERSION, endpoint)
-            headers['Content-Type'] = 'text/csv'
-
-            with tempfile.NamedTemporaryFile(mode="w+", encoding="utf8") as csv_file:
-                resp = self.sf._make_request('GET', url, headers=headers, stream=True)
-                for chunk in resp.iter_content(chunk_size=ITER_CHUNK_SIZE, decode_unicode=True):
-                    if chunk:
-                        # Replace any NULL bytes in the chunk so it can be safely given to the CSV reader
-                        csv_file.write(chunk.replace('\0', ''))
-
-                csv_file.seek(0)
-                csv_reader = csv.reader(csv_file,
-                                        delimiter=',',
-                                        quotechar='"')
+        return batch_result_list['result']
 
-                column_name_list = next(csv_reader)
-
-                for line in csv_reader:
-                    rec = dict(zip(column_name_list, line))
+    def _get_batch_result(self, job_id, batch_id, result, offset=0):
+        endpoint = "job/{}/batch/{}/result/{}".format(job_id, batch_id, result)
+        url = self.bulk_url.format(self.sf.instance_url, API_VERSION, endpoint)
+        headers = self._get_bulk_headers()
+        headers['Content-Type'] = 'text/csv'
+        if offset:
+            # Offsets count the bytes of the decoded body, which are only the
+            # bytes the range applies to when the body is not compressed
+            headers['Accept-Encoding'] = 'identity'
+            headers['Range'] = 'bytes={}-'.format(offset)
+
+        return self.sf._make_request('GET', url, headers=headers, stream=True)
+
+    def _iter_batch_result_chunks(self, job_id, batch_id, result, resp, offset=0):
+        """Yields the body of a result file from `resp`, which was requested
+        from byte `offset`. An interrupted transfer is resumed with a Range
+        request from the last byte received. If Salesforce ignores the Range
+        header, the bytes that were already received are skipped."""
+        retries = MAX_RETRIES
+        while True:
+            skip = offset if resp.status_code != 206 else 0
+            try:
+                with resp:
+                    for chunk in resp.iter_content(chunk_size=ITER_CHUNK_SIZE):
+                        if skip:
+                            skipped = min(skip, len(chunk))
+                            chunk = chunk[skipped:]
+                            skip -= skipped
+                        offset += len(chunk)
+                        yield chunk
+                return
+            except (ChunkedEncodingError, RequestsConnectionError) as ex:
+                if retries == 0:
+                    raise
+                retries -= 1
+                LOGGER.info("Download of result %s for batch %s was interrupted at byte %d (%s), resuming",
+                            result, batch_id, offset, ex)
+                resp = self._get_batch_result(job_id, batch_id, result, offset)
+
+    def _get_batch_result_columns(self, job_id, batch_id, result):
+        with self._get_batch_result(job_id, batch_id, result) as resp:
+            lines = iter_csv_lines(resp.iter_content(chunk_size=ITER_CHUNK_SIZE), resp.encoding)
+            return next(csv.reader(lines, delimiter=',', quotechar='"'))
+
+    def _get_resume_point(self, batch_id, result_ids, checkpoint):
+        """Returns the result IDs left to read and, if a checkpoint for this
+        batch was left by an earlier run, the checkpoint to resume from."""
+        if checkpoint and checkpoint.get('BatchID') == batch_id and checkpoint.get('ResultID') in result_ids:
+            return result_ids[result_ids.index(checkpoint['ResultID']):], dict(checkpoint)
+        return result_ids, None
+
+    def _stream_batch_results(self, job_id, batch_id, catalog_entry, checkpoint=None):
+        result_ids = self._get_batch_result_ids(job_id, batch_id, catalog_entry)
+        result_ids, resume_point = self._get_resume_point(batch_id, result_ids, checkpoint)
+
+        for result in result_ids:
+            column_name_list = None
+            position = {'offset': 0, 'rows': 0}
+            if resume_point and resume_point['ResultID'] == result:
+                LOGGER.info("Resuming result %s of batch %s at row %d", result, batch_id, resume_point['RowOffset'])
+                column_name_list = self._get_batch_result_columns(job_id, batch_id, result)
+                position = {'offset': resume_point['ByteOffset'], 'rows': resume_point['RowOffset']}
+
+            resp = self._get_batch_result(job_id, batch_id, result, position['offset'])
+            chunks = self._iter_batch_result_chunks(job_id, batch_id, result, resp, position['offset'])
+            lines = iter_csv_lines(chunks, resp.encoding, position)
+            for rec in self._read_result(lines, batch_id, result, position, checkpoint, column_name_list):
+                yield rec
+
+    def _download_batch_results(self, job_id, batch_id, catalog_entry):
+        """Downloads every result file of a batch into a temporary file and
+        returns them, rewound and paired with their result ID and encoding,
+        alongside the batch_id. A download that is interrupted is restarted,
+        as nothing has been emitted from it yet."""
+        csv_files = []
+        for result in self._get_batch_result_ids(job_id, batch_id, catalog_entry):
+            csv_file = tempfile.NamedTemporaryFile(mode="w+b") # pylint: disable=consider-using-with
+
+            for attempt in range(1, MAX_RETRIES + 1):
+                try:
+                    with self._get_batch_result(job_id, batch_id, result) as resp:
+                        csv_file.seek(0)
+                        csv_file.truncate()
+                        for chunk in resp.iter_content(chunk_size=ITER_CHUNK_SIZE):
+                            csv_file.write(chunk)
+                        encoding = resp.encoding
+                    break
+                except (ChunkedEncodingError, RequestsConnectionError) as ex:
+                    if attempt == MAX_RETRIES:
+                        raise
+                    LOGGER.info("Download of result %s for batch %s was interrupted (%s), retrying", result, batch_id, ex)
+
+            csv_file.seek(0)
+            csv_files.append((result, csv_file, encoding))
+
+        return batch_id, csv_files
+
+    def _read_batch_results(self, batch_id, csv_files, checkpoint=None):
+        result_ids, resume_point = self._get_resume_point(batch_id, [result for result, _, _ in csv_files], checkpoint)
+
+        for result, csv_file, encoding in csv_files:
+            with csv_file:
+                if result not in result_ids:
+                    continue
+
+                column_name_list = None
+                position = {'offset': 0, 'rows': 0}
+                if resume_point and resume_point['ResultID'] == result:
+                    LOGGER.info("Resuming result %s of batch %s at row %d", result, batch_id, resume_point['RowOffset'])
+                    column_name_list = next(csv.reader(iter_csv_lines([csv_file.readline()], encoding)))
+                    csv_file.seek(resume_point['ByteOffset'])
+                    position = {'offset': resume_point['ByteOffset'], 'rows': resume_point['RowOffset']}
+
+                chunks = iter(lambda f=csv_file: f.read(ITER_CHUNK_SIZE), b'')
+                lines = iter_csv_lines(chunks, encoding, position)
+                for rec in self._read_result(lines, batch_id, result, position, checkpoint, column_name_list):
                     yield rec
 
+    # pylint: disable=too-many-positional-arguments
+    def _read_result(self, lines, batch_id, result, position, checkpoint=None, column_name_list=None):
+        """Parses the CSV `lines` of a result file into records. `position`
+        tracks the bytes consumed from the file, and since the CSV reader
+        never reads past the end of a record, it points right after the
+        record that was just parsed, which is what gets checkpointed."""
+        csv_reader = csv.reader(lines,
+                                delimiter=',',
+                                quotechar='"')
+
+        if column_name_list is None:
+            column_name_list = next(csv_reader)
+
+        if checkpoint is not None:
+            checkpoint.update({'BatchID': batch_id, 'ResultID': result})
+
+        for line in csv_reader:
+            rec = dict(zip(column_name_list, line))
+            position['rows'] += 1
+            if checkpoint is not None:
+                checkpoint['ByteOffset'] = position['offset']
+                checkpoint['RowOffset'] = position['rows']
+            yield rec
+
     def _close_job(self, job_id):
         endpoint = "job/{}".format(job_id)
         url = self.bulk_url.format(self.sf.instance_url, API_VERSION, endpoint)
@@ -333,62 +782,83 @@ class Bulk():
                 headers=self._get_bulk_headers(),
                 body=json.dumps(body))
 
-    def _iter_lines(self, response):
-        """Clone of the iter_lines function from the requests library with the change
-        to pass keepends=True in order to ensure that we do not strip the line breaks
-        from within a quoted value from the CSV stream."""
-        pending = None
-
-        for chunk in response.iter_content(decode_unicode=True, chunk_size=ITER_CHUNK_SIZE):
-            if pending is not None:
-                chunk = pending + chunk
-
-            lines = chunk.splitlines(keepends=True)
-
-            if lines and lines[-1] and chunk and lines[-1][-1] == chunk[-1]:
-                pending = lines.pop()
-            else:
-                pending = None
-
-            for line in lines:
-                yield line
-
-        if pending is not None:
-            yield pending
-
-    def _bulk_with_window(self, status_list, catalog_entry, start_date_str, end_date=None, retries=MAX_RETRIES):
-        """Bulk api call with date windowing"""
-        sync_start = singer_utils.now()
-        if end_date is None:
-            end_date = sync_start
+    #pylint: disable=too-many-positional-arguments,too-many-arguments
+    def _bulk_with_window(self, status_list, catalog_entry, start_date_str, retries=MAX_RETRIES,
+                          window_sizer=None, state=None, chunk_sizer=None):
+        """Bulk api call with date windowing, sized by `window_sizer`, from
+        `start_date_str` up to now. With `bulk_window_concurrency` set, the
+        batch statuses are yielded as the windows complete instead of being
+        returned once they all have. The PK chunks of the jobs are sized by
+        `chunk_sizer`."""
+        if window_sizer is None:
+            window_sizer = WindowSizer(self.sf, catalog_entry['tap_stream_id'])
+        if chunk_sizer is None:
+            chunk_sizer = ChunkSizer(self.sf, catalog_entry)
+
+        window_plan = WindowPlan(catalog_entry,
+                                 singer_utils.strptime_with_tz(start_date_str),
+                                 singer_utils.now(),
+                                 window_sizer,
+                                 state,
+                                 retries)
+        statuses = self._run_window_plan(catalog_entry, window_plan, chunk_sizer)
+
+        if self.sf.bulk_window_concurrency > 1:
+            return itertools.chain(status_list, statuses)
+
+        status_list.extend(statuses)
+        return status_list
+
+    def _run_window_plan(self, catalog_entry, window_plan, chunk_sizer):
+        """Runs the PK chunked jobs of the windows of `window_plan`, up to
+        `bulk_window_concurrency` of them at once. Yields the batch statuses
+        of the jobs in window order, so records are still emitted in
+        replication key order."""
+        concurrency = self.sf.bulk_window_concurrency
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            running = {}
+            while True:
+                while len(running) < concurrency:
+                    window = window_plan.next_window()
+                    if window is None:
+                        break
+                    running[executor.submit(self._run_window_job, catalog_entry, window_plan, window,
+                                            chunk_sizer.size)] = window
+
+                for window in window_plan.pop_done():
+                    yield window.result
+
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    window = running.pop(future)
+                    window.result = future.result()
+                    chunk_sizer.job_done(window.result.get('batches', []))
+                    if window.result['failed']:
+                        LOGGER.info("Failed Bulk Query with window of date {} to {}".format(
+                            window.start_date.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                            window.end_date.strftime('%Y-%m-%dT%H:%M:%SZ')))
+                        # If batch_status is failed then split the window in halves
+                        window_plan.failed(window)
+                    else:
+                        window_plan.done(window)
+
+        window_plan.finish()
+
+    def _run_window_job(self, catalog_entry, window_plan, window, chunk_size):
+        start_date_str = window.start_date.strftime('%Y-%m-%dT%H:%M:%SZ')
+        end_date_str = window.end_date.strftime('%Y-%m-%dT%H:%M:%SZ')
+        if window.start_date == window_plan.start_date and window_plan.is_last(window):
             LOGGER.info("Retrying Bulk Query with PK Chunking")
         else:
-            LOGGER.info("Retrying Bulk Query with window of date {} to {}".format(start_date_str, end_date.strftime('%Y-%m-%dT%H:%M:%SZ')))
+            LOGGER.info("Retrying Bulk Query with window of date {} to {}".format(start_date_str, end_date_str))
 
-        if retries == 0:
-            raise TapSalesforceException("Ran out of retries attempting to query Salesforce Object {}".format(catalog_entry['stream']))
-
-        job_id = self._create_job(catalog_entry, True)
-        self._add_batch(catalog_entry, job_id, start_date_str, end_date.strftime('%Y-%m-%dT%H:%M:%SZ'), False)
+        job_id = self._create_job(catalog_entry, True, chunk_size)
+        self._add_batch(catalog_entry, job_id, start_date_str, end_date_str, False)
         batch_status = self._poll_on_pk_chunked_batch_status(job_id)
         batch_status['job_id'] = job_id
         # Close the job after all the batches are complete
         self._close_job(job_id)
-
-        if batch_status['failed']:
-            LOGGER.info("Failed Bulk Query with window of date {} to {}".format(start_date_str, end_date.strftime('%Y-%m-%dT%H:%M:%SZ')))
-            # If batch_status is failed then reduce date window by half by updating end_date
-            end_date = self.sf.get_window_end_date(singer_utils.strptime_with_tz(start_date_str), end_date)
-
-            return self._bulk_with_window(status_list, catalog_entry, start_date_str, end_date, retries - 1)
-
-        else:
-            status_list.append(batch_status)
-
-            # If the date range was chunked (an end_date was passed), sync
-            # from the end_date -> now
-            if end_date < sync_start:
-                next_start_date_str = end_date.strftime('%Y-%m-%dT%H:%M:%SZ')
-                return self._bulk_with_window(status_list, catalog_entry, next_start_date_str, retries=retries)
-
-            return status_list
+        return batch_status
@@ -0,0 +1,223 @@
+# pylint: disable=protected-access,use-yield-from
+import csv
+import json
+import sys
+import singer
+from singer import metadata, metrics
+from requests.exceptions import (
+    ChunkedEncodingError,
+    ConnectionError as RequestsConnectionError,
+    HTTPError)
+
+from tap_salesforce.messages import write_state
+from tap_salesforce.salesforce.bulk import ITER_CHUNK_SIZE, MAX_RETRIES, iter_csv_lines
+from tap_salesforce.salesforce.poller import PollInterval
+from tap_salesforce.salesforce.rest import API_VERSION
+from tap_salesforce.salesforce.exceptions import (
+    TapSalesforceException, TapSalesforceQuotaExceededException)
+
+JOB_STATUS_POLLING_INITIAL_SLEEP = 1
+JOB_STATUS_POLLING_SLEEP = 20
+DEFAULT_MAX_RECORDS = 100000
+LOGGER = singer.get_logger()
+
+
+class Bulk2():
+    """Client for Bulk API 2.0 query jobs. Salesforce chunks the query
+    itself, and the results are read a page of up to `DEFAULT_MAX_RECORDS`
+    records at a time, each page pointing to the next one with a locator.
+
+    The job ID and the locator of the page being emitted are kept in the
+    'Bulk2JobID' and 'Bulk2Locator' bookmarks of incremental streams, so an
+    interrupted sync continues reading the results of the same job."""
+
+    bulk2_url = "{}/services/data/v{}.0/jobs/query{}"
+
+    def __init__(self, sf):
+        # Set csv max reading size to the platform's max size available.
+        csv.field_size_limit(sys.maxsize)
+        self.sf = sf
+
+    def query(self, catalog_entry, state):
+        self.check_bulk2_quota_usage()
+
+        for record in self._bulk2_query(catalog_entry, state):
+            yield record
+
+        self.sf.jobs_completed += 1
+
+    # pylint: disable=line-too-long
+    def check_bulk2_quota_usage(self):
+        endpoint = "limits"
+        url = self.sf.data_url.format(self.sf.instance_url, API_VERSION, endpoint)
+
+        with metrics.http_request_timer(endpoint):
+            resp = self.sf._make_request('GET', url, headers=self.sf._get_standard_headers()).json()
+
+        quota_max = resp['DailyBulkV2QueryJobs']['Max']
+        max_requests_for_run = int((self.sf.quota_percent_per_run * quota_max) / 100)
+
+        quota_remaining = resp['DailyBulkV2QueryJobs']['Remaining']
+        percent_used = (1 - (quota_remaining / quota_max)) * 100
+
+        if percent_used > self.sf.quota_percent_total:
+            total_message = ("Salesforce has reported {}/{} ({:3.2f}%) total Bulk API 2.0 query job quota " +
+                             "used across all Salesforce Applications. Terminating " +
+                             "replication to not continue past configured percentage " +
+                             "of {}% total quota.").format(quota_max - quota_remaining,
+                                                           quota_max,
+                                                           percent_used,
+                                                           self.sf.quota_percent_total)
+            raise TapSalesforceQuotaExceededException(total_message)
+        elif self.sf.jobs_completed > max_requests_for_run:
+            partial_message = ("This replication job has completed {} Bulk API 2.0 query jobs ({:3.2f}% of " +
+                               "total quota). Terminating replication due to allotted " +
+                               "quota of {}% per replication.").format(self.sf.jobs_completed,
+                                                                       (self.sf.jobs_completed / quota_max) * 100,
+                                                                       self.sf.quota_percent_per_run)
+            raise TapSalesforceQuotaExceededException(partial_message)
+
+    def _get_bulk2_headers(self):
+        headers = self.sf._get_standard_headers()
+        headers["Content-Type"] = "application/json"
+        return headers
+
+    def _bulk2_query(self, catalog_entry, state):
+        tap_stream_id = catalog_entry['tap_stream_id']
+        replication_key = metadata.to_map(catalog_entry['metadata']).get((), {}).get('replication-key')
+
+        job_id, locator = self._get_resumable_job(catalog_entry, state)
+        if job_id is None:
+            start_date = self.sf.get_start_date(state, catalog_entry)
+            job_id = self._create_job(catalog_entry, start_date)
+            locator = None
+
+        # Full table streams are synced under a new version on every run,
+        # so only incremental streams can continue an interrupted job
+        if replication_key:
+            state = singer.set_bookmark(state, tap_stream_id, 'Bulk2JobID', job_id)
+            state = singer.set_bookmark(state, tap_stream_id, 'Bulk2Locator', locator)
+            write_state(state)
+
+        job = self._poll_on_job_status(job_id)
+        if job['state'] != 'JobComplete':
+            self._clear_resumable_job(catalog_entry, state)
+            raise TapSalesforceException(job.get('errorMessage') or "Bulk API 2.0 job {} is {}".format(job_id, job['state']))
+
+        while True:
+            next_locator = None
+            for record, next_locator in self._get_job_results(job_id, locator, catalog_entry):
+                yield record
+
+            if next_locator is None:
+                break
+
+            locator = next_locator
+            if replication_key:
+                state = singer.set_bookmark(state, tap_stream_id, 'Bulk2Locator', locator)
+                write_state(state)
+
+        self._clear_resumable_job(catalog_entry, state)
+
+    def _get_resumable_job(self, catalog_entry, state):
+        """Returns the job ID and locator of a job left in the state by an
+        interrupted sync, or (None, None) if there is no such job or it can no
+        longer be read."""
+        job_id = singer.get_bookmark(state, catalog_entry['tap_stream_id'], 'Bulk2JobID')
+        if job_id is None:
+            return None, None
+
+        job = self._get_job(job_id)
+        if job is None or job['state'] in ('Failed', 'Aborted'):
+            LOGGER.info("Found stored Bulk API 2.0 Job ID %s that can no longer be read, starting a new job.", job_id)
+            self._clear_resumable_job(catalog_entry, state)
+            return None, None
+
+        locator = singer.get_bookmark(state, catalog_entry['tap_stream_id'], 'Bulk2Locator')
+        LOGGER.info("Found Job ID from previous Bulk API 2.0 Query. Resuming sync for job %s at locator %s", job_id, locator)
+        return job_id, locator
+
+    def _clear_resumable_job(self, catalog_entry, state):
+        bookmarks = state.get('bookmarks', {}).get(catalog_entry['tap_stream_id'], {})
+        bookmarks.pop('Bulk2JobID', None)
+        bookmarks.pop('Bulk2Locator', None)
+
+    def _create_job(self, catalog_entry, start_date):
+        url = self.bulk2_url.format(self.sf.instance_url, API_VERSION, "")
+        body = {"operation": "queryAll",
+                "query": self.sf._build_query_string(catalog_entry, start_date),
+                "contentType": "CSV",
+                "columnDelimiter": "COMMA",
+                "lineEnding": "LF"}
+
+        with metrics.http_request_timer("create_job") as timer:
+            timer.tags['sobject'] = catalog_entry['stream']
+            resp = self.sf._make_request(
+                'POST',
+                url,
+                headers=self._get_bulk2_headers(),
+                body=json.dumps(body))
+
+        return resp.json()['id']
+
+    def _get_job(self, job_id):
+        url = self.bulk2_url.format(self.sf.instance_url, API_VERSION, "/{}".format(job_id))
+
+        try:
+            with metrics.http_request_timer("get_job"):
+                return self.sf._make_request('GET', url, headers=self._get_bulk2_headers()).json()
+        except HTTPError as ex:
+            if ex.response is not None and ex.response.status_code == 404:
+                return None
+            raise
+
+    def _poll_on_job_status(self, job_id):
+        def check(job):
+            return job if job['state'] in ['JobComplete', 'Failed', 'Aborted'] else None
+
+        return self.sf.job_poller.wait(
+            job_id,
+            lambda: self._get_job(job_id),
+            check,
+            PollInterval(JOB_STATUS_POLLING_INITIAL_SLEEP, JOB_STATUS_POLLING_SLEEP),
+            lambda job: job.get('numberRecordsProcessed'))
+
+    def _get_results_page(self, job_id, locator):
+        url = self.bulk2_url.format(self.sf.instance_url, API_VERSION, "/{}/results".format(job_id))
+        params = {"maxRecords": DEFAULT_MAX_RECORDS}
+        if locator:
+            params["locator"] = locator
+
+        return self.sf._make_request('GET', url, headers=self.sf._get_standard_headers(), stream=True, params=params)
+
+    def _get_job_results(self, job_id, locator, catalog_entry):
+        """Yields (record, next_locator) pairs for the page of results at
+        `locator`, next_locator being None on the last page. An interrupted
+        download is requested again and the records that were already
+        yielded are skipped."""
+        rows = 0
+        for attempt in range(1, MAX_RETRIES + 1):
+            with metrics.http_request_timer("job_results") as timer:
+                timer.tags['sobject'] = catalog_entry['stream']
+                resp = self._get_results_page(job_id, locator)
+
+            next_locator = resp.headers.get('Sforce-Locator')
+            if next_locator in (None, '', 'null'):
+                next_locator = None
+
+            try:
+                with resp:
+                    lines = iter_csv_lines(resp.iter_content(chunk_size=ITER_CHUNK_SIZE), resp.encoding)
+                    csv_reader = csv.reader(lines, delimiter=',', quotechar='"')
+                    column_name_list = next(csv_reader, None)
+                    for row, line in enumerate(csv_reader):
+                        if row < rows:
+                            continue
+                        rows += 1
+                        yield dict(zip(column_name_list, line)), next_locator
+                return
+            except (ChunkedEncodingError, RequestsConnectionError) as ex:
+                if attempt == MAX_RETRIES:
+                    raise
+                LOGGER.info("Download of results of job %s was interrupted after %d records (%s), retrying",
+                            job_id, rows, ex)
@@ -0,0 +1,80 @@
+import singer
+from singer import metadata
+
+from tap_salesforce.messages import OUTPUT_LOCK
+
+CHUNK_SIZE_BOOKMARK = 'PKChunkSize'
+DEFAULT_CHUNK_SIZE = 100000
+MIN_CHUNK_SIZE = 10000
+MAX_CHUNK_SIZE = 250000 # The most Salesforce allows
+# Objects with up to this many selected fields get the largest chunks, wider
+# objects get chunks that shrink in proportion to their width
+NARROW_FIELD_COUNT = 20
+# A job whose batches all took less than this grows the chunks of the next
+# one, a job with a batch that took longer shrinks them
+FAST_BATCH_SECONDS = 60
+SLOW_BATCH_SECONDS = 600
+
+LOGGER = singer.get_logger()
+
+
+def clamp_chunk_size(chunk_size):
+    return max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, int(chunk_size)))
+
+
+def estimate_chunk_size(field_count):
+    """Returns the chunk size for an object of `field_count` selected
+    fields, rounded down to a thousand records."""
+    chunk_size = MAX_CHUNK_SIZE * NARROW_FIELD_COUNT // max(field_count, 1)
+    return clamp_chunk_size(chunk_size // 1000 * 1000)
+
+
+class ChunkSizer():
+    """Sizes the PK chunks of a stream's Bulk jobs.
+
+    A `pk-chunk-size` in the stream's catalog metadata is always used as is.
+    Otherwise the first job is chunked by the number of selected fields, and
+    every job that completes adjusts the size of the next one: halved when
+    a batch failed or was slow, doubled when every batch was fast. The size
+    is kept in the stream's 'PKChunkSize' bookmark for the next sync."""
+
+    def __init__(self, sf, catalog_entry, state=None):
+        self.tap_stream_id = catalog_entry['tap_stream_id']
+        self.state = state
+
+        self.configured_size = metadata.to_map(catalog_entry['metadata']).get((), {}).get('pk-chunk-size')
+        remembered_size = singer.get_bookmark(state, self.tap_stream_id, CHUNK_SIZE_BOOKMARK) if state else None
+
+        if self.configured_size:
+            self.size = clamp_chunk_size(self.configured_size)
+        elif remembered_size:
+            self.size = clamp_chunk_size(remembered_size)
+        else:
+            self.size = estimate_chunk_size(len(sf._get_selected_properties(catalog_entry))) # pylint: disable=protected-access
+
+    def job_done(self, batches):
+        """Adjusts the chunk size given the batchInfos of a PK chunked job
+        that is done."""
+        if self.configured_size:
+            return
+
+        batches = [b for b in batches if b['state'] in ('Completed', 'Failed')]
+        if not batches:
+            return
+
+        slowest_seconds = max(int(b.get('totalProcessingTime') or 0) for b in batches) / 1000
+        if any(b['state'] == 'Failed' for b in batches) or slowest_seconds > SLOW_BATCH_SECONDS:
+            size = clamp_chunk_size(self.size // 2)
+        elif slowest_seconds < FAST_BATCH_SECONDS:
+            size = clamp_chunk_size(self.size * 2)
+        else:
+            size = self.size
+
+        if size != self.size:
+            LOGGER.info("Changing the PK chunk size of %s from %d to %d", self.tap_stream_id, self.size, size)
+            self.size = size
+
+        if self.state is not None:
+            # Jobs may complete on other threads than the one writing the state
+            with OUTPUT_LOCK:
+                singer.set_bookmark(self.state, self.tap_stream_id, CHUNK_SIZE_BOOKMARK, self.size)
@@ -0,0 +1,104 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import threading
+
+
+# Yielded by the items given to `ordered_map` when their next item is not
+# available yet
+NOT_READY = object()
+
+
+def ordered_map(func, items, max_workers):
+    """Lazily maps `func` over `items` on a bounded thread pool, yielding the
+    results in the order of `items`.
+
+    Unlike `Executor.map`, items are only pulled from the iterable as slots
+    free up, so at most `max_workers` results are being computed or waiting
+    to be consumed at any time. An iterable whose items become available over
+    time may yield `NOT_READY` instead of blocking, in which case the results
+    of the items it already gave are yielded without waiting for more."""
+    items = iter(items)
+    pending = deque()
+    end = object()
+    exhausted = False
+
+    def submit_available(wait):
+        # With `wait`, blocks until there is at least an item to work on
+        nonlocal exhausted
+        while not exhausted and len(pending) < max_workers:
+            item = next(items, end)
+            if item is end:
+                exhausted = True
+            elif item is NOT_READY:
+                if pending or not wait:
+                    return
+            else:
+                pending.append(executor.submit(func, item))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            while True:
+                submit_available(wait=True)
+                if not pending:
+                    return
+                result = pending.popleft().result()
+                submit_available(wait=False)
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class Prefetcher():
+    """Iterates `items` on a background thread, started right away, keeping
+    up to `depth` items ready ahead of the consumer so that producing the
+    next item overlaps with consuming the current one. An exception raised by
+    `items` is raised to the consumer once it reaches it. `close` stops the
+    background thread."""
+
+    def __init__(self, items, depth, name=None):
+        self._ready = queue.Queue(maxsize=depth)
+        self._stopped = threading.Event()
+        self._finished = False
+        self._producer = threading.Thread(target=self._produce, args=(items,), name=name, daemon=True)
+        self._producer.start()
+
+    def _put(self, entry):
+        # Give up once the consumer is gone rather than block on a full queue
+        while not self._stopped.is_set():
+            try:
+                self._ready.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce(self, items):
+        try:
+            for item in items:
+                if not self._put((item, None)):
+                    return
+            self._put((None, StopIteration()))
+        except Exception as ex: # pylint: disable=broad-except
+            self._put((None, ex))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._finished:
+            raise StopIteration()
+
+        item, ex = self._ready.get()
+        if ex is not None:
+            self._finished = True
+            self.close()
+            raise ex
+        return item
+
+    def close(self):
+        self._stopped.set()
+
+    def __del__(self):
+        self.close()
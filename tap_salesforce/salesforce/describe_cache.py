@@ -0,0 +1,59 @@
+import hashlib
+import json
+import os
+import tempfile
+import singer
+
+LOGGER = singer.get_logger()
+
+
+class DescribeCache():
+    """On disk cache of sobject describes for one Salesforce instance and API
+    version, stored as a JSON file in `cache_dir`.
+
+    Every entry keeps the describe along with the validators to revalidate it
+    with: the ETag and Last-Modified headers Salesforce returned, or the time
+    it was fetched when the describe came from a composite batch, which does
+    not return headers."""
+
+    def __init__(self, cache_dir, instance_url, api_version):
+        key = hashlib.sha1("{}|{}".format(instance_url, api_version).encode('utf-8')).hexdigest()
+        self.path = os.path.join(cache_dir, "describe_{}.json".format(key))
+        self.entries = {}
+
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                LOGGER.warning("Ignoring unreadable describe cache %s", self.path)
+
+    def __contains__(self, sobject_name):
+        return sobject_name in self.entries
+
+    def get(self, sobject_name):
+        return self.entries[sobject_name]['describe']
+
+    def get_validators(self, sobject_name):
+        """Returns the conditional request headers to revalidate the cached
+        describe of `sobject_name` with."""
+        entry = self.entries[sobject_name]
+        headers = {"If-Modified-Since": entry['last_modified']}
+        if entry.get('etag'):
+            headers["If-None-Match"] = entry['etag']
+        return headers
+
+    def put(self, sobject_name, describe, last_modified, etag=None):
+        self.entries[sobject_name] = {'describe': describe, 'last_modified': last_modified, 'etag': etag}
+
+    def remove(self, sobject_name):
+        self.entries.pop(sobject_name, None)
+
+    def save(self):
+        """Writes the cache to a temporary file first so that an interrupted
+        write never leaves a truncated cache behind."""
+        cache_dir = os.path.dirname(self.path)
+        os.makedirs(cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=cache_dir, delete=False) as f:
+            json.dump(self.entries, f)
+        os.replace(f.name, self.path)
@@ -0,0 +1,56 @@
+import singer.utils as singer_utils
+
+# Streams expected to return at most this many records are queried with the
+# REST API, which costs a request per 2000 records, rather than with a Bulk job
+REST_MAX_RECORDS = 10000
+# Bulk queries expected to return more records than this time out without PK
+# chunking, so they are PK chunked from the start
+PK_CHUNKING_MIN_RECORDS = 10000000
+# Date windows are sized to hold about this many records each
+WINDOW_MAX_RECORDS = 25000000
+# The record count of a stream whose records could not be counted before
+# the count query timed out
+TOO_MANY_TO_COUNT = 'too many to count'
+
+
+class QueryPlan():
+    """How to query a stream, planned from the number of records it is
+    expected to return: the API to use, whether to PK chunk the Bulk job
+    right away and the size of the date windows to start with, if any.
+
+    A `record_count` of None means that counting the records timed out, in
+    which case the stream is assumed to be too large for a plain query."""
+
+    def __init__(self, api_type, record_count=None, pk_chunking=False, window_size=None):
+        self.api_type = api_type
+        self.record_count = record_count
+        self.pk_chunking = pk_chunking
+        self.window_size = window_size
+
+    def __repr__(self):
+        return "QueryPlan(api_type={}, record_count={}, pk_chunking={}, window_size={})".format(
+            self.api_type, self.record_count, self.pk_chunking, self.window_size)
+
+
+def plan_query(api_type, record_count, start_date_str, replication_key, rest_max_records=REST_MAX_RECORDS):
+    """Plans the query of a stream configured with `api_type` that is
+    expected to return `record_count` records from `start_date_str`, or
+    `TOO_MANY_TO_COUNT` if counting them timed out. Only
+    Bulk queries of up to `rest_max_records` records are moved to REST, as
+    the catalog of a stream discovered for REST may have fields the Bulk API
+    does not support."""
+    if record_count == TOO_MANY_TO_COUNT:
+        return QueryPlan(api_type, pk_chunking=api_type == "BULK")
+
+    if api_type in ("BULK", "BULK2") and record_count <= rest_max_records:
+        return QueryPlan("REST", record_count)
+
+    window_size = None
+    if replication_key and record_count > WINDOW_MAX_RECORDS:
+        date_range = singer_utils.now() - singer_utils.strptime_with_tz(start_date_str)
+        window_size = date_range * WINDOW_MAX_RECORDS / record_count
+
+    return QueryPlan(api_type,
+                     record_count,
+                     pk_chunking=api_type == "BULK" and record_count > PK_CHUNKING_MIN_RECORDS,
+                     window_size=window_size)
@@ -0,0 +1,135 @@
+from concurrent.futures import Future
+import threading
+import time
+
+
+class PollInterval():
+    """Adaptive interval between two polls of a job's status. It starts at
+    `initial` seconds, so that small jobs are picked up as soon as they are
+    done, and doubles after every poll up to `maximum`. While the job makes
+    progress, i.e. the number of records it processed grew since the previous
+    poll, the interval is kept as the job is likely to be done soon."""
+
+    def __init__(self, initial, maximum):
+        self.initial = initial
+        self.maximum = maximum
+        self.interval = None
+        self.records_processed = None
+
+    def next(self, records_processed=None):
+        """Returns the number of seconds to wait before the next poll, given
+        the number of records processed reported by the last one."""
+        made_progress = (records_processed is not None and self.records_processed is not None
+                         and records_processed > self.records_processed)
+        self.records_processed = records_processed
+
+        if self.interval is None:
+            self.interval = self.initial
+        elif not made_progress:
+            self.interval = self.interval * 2
+
+        self.interval = min(self.interval, self.maximum)
+        return self.interval
+
+
+class _Waiter():
+
+    def __init__(self, key, poll, check, records_processed, interval):
+        self.key = key
+        self.poll = poll
+        self.check = check
+        self.records_processed = records_processed
+        self.interval = interval
+        self.next_poll_at = time.monotonic()
+        self.future = Future()
+
+
+class JobPoller():
+    """Polls the status of many Bulk jobs from a single background thread,
+    shared by every stream being synced.
+
+    Callers block in `wait` until their job is done, or `submit` it and
+    wait on the returned future. Every cycle polls each job that is due
+    once, however many callers wait on it, and then waits until the next job
+    is due according to its `PollInterval`. The thread only runs while there
+    are jobs to poll."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._waiters = []
+        self._thread = None
+
+    def wait(self, key, poll, check, interval, records_processed=None):
+        """Calls `poll()` on every cycle until `check(status)` returns
+        something other than None for the status it returned, and returns it.
+        Exceptions raised by either function are raised here.
+
+        `key` identifies the job being polled, callers waiting on the same job
+        share its polls. `records_processed(status)` reports the job's
+        progress to its `interval`, a `PollInterval`."""
+        return self.submit(key, poll, check, interval, records_processed).result()
+
+    def submit(self, key, poll, check, interval, records_processed=None):
+        """Same as `wait`, but returns a future of the result instead of
+        blocking. `check` is called on the poller's thread."""
+        waiter = _Waiter(key, poll, check, records_processed, interval)
+
+        with self._condition:
+            self._waiters.append(waiter)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="bulk-job-poller", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+        return waiter.future
+
+    def cancel(self, future):
+        """Stops polling for the caller of `future`, returned by `submit`.
+        The future is left unresolved."""
+        with self._condition:
+            self._waiters = [w for w in self._waiters if w.future is not future]
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._waiters:
+                    self._thread = None
+                    return
+
+                now = time.monotonic()
+                due_keys = {w.key for w in self._waiters if w.next_poll_at <= now}
+                if not due_keys:
+                    self._condition.wait(min(w.next_poll_at for w in self._waiters) - now)
+                    continue
+
+                due_waiters = [w for w in self._waiters if w.key in due_keys]
+
+            done = self._poll(due_waiters)
+
+            with self._condition:
+                self._waiters = [w for w in self._waiters if w not in done]
+
+    def _poll(self, waiters):
+        """Polls every job of `waiters` once and returns the waiters that are done."""
+        done = []
+        statuses = {}
+
+        for waiter in waiters:
+            try:
+                if waiter.key not in statuses:
+                    statuses[waiter.key] = waiter.poll()
+                status = statuses[waiter.key]
+
+                result = waiter.check(status)
+                if result is not None:
+                    waiter.future.set_result(result)
+                    done.append(waiter)
+                    continue
+
+                records_processed = waiter.records_processed(status) if waiter.records_processed else None
+                waiter.next_poll_at = time.monotonic() + waiter.interval.next(records_processed)
+            except Exception as ex: # pylint: disable=broad-except
+                waiter.future.set_exception(ex)
+                done.append(waiter)
+
+        return done
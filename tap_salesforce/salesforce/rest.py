@@ -1,95 +1,134 @@
 # pylint: disable=protected-access,use-yield-from
 import singer
 import singer.utils as singer_utils
+from singer import metadata
 from requests.exceptions import HTTPError
-from tap_salesforce.salesforce.exceptions import TapSalesforceException
+from tap_salesforce.salesforce.concurrency import Prefetcher
+from tap_salesforce.salesforce.windowing import WindowPlan, WindowSizer
 
 LOGGER = singer.get_logger()
 API_VERSION = '61'
-MAX_RETRIES = 4
+# Number of records each date window queried concurrently keeps ready ahead
+# of the one being emitted
+SHARD_BUFFER_SIZE = 2000
+
+def split_date_range(start_date, end_date, count):
+    """Splits [start_date, end_date) into `count` consecutive windows of
+    the same length, returned as (window_start, window_end) tuples."""
+    if end_date <= start_date:
+        return [(start_date, end_date)]
+
+    step = (end_date - start_date) / count
+    boundaries = [start_date + step * i for i in range(count)] + [end_date]
+    return list(zip(boundaries, boundaries[1:]))
+
 
 class Rest():
 
     def __init__(self, sf):
         self.sf = sf
 
-    def query(self, catalog_entry, state):
+    def query(self, catalog_entry, state, plan=None):
         start_date = self.sf.get_start_date(state, catalog_entry)
-        query = self.sf._build_query_string(catalog_entry, start_date)
-
-        return self._query_recur(query, catalog_entry, start_date)
-
-    # pylint: disable=too-many-positional-arguments
-    def _query_recur(
-            self,
-            query,
-            catalog_entry,
-            start_date_str,
-            end_date=None,
-            retries=MAX_RETRIES):
-        params = {"q": query}
-        url = "{}/services/data/v{}.0/queryAll".format(self.sf.instance_url, API_VERSION)
-        headers = self.sf._get_standard_headers()
 
-        sync_start = singer_utils.now()
-        if end_date is None:
-            end_date = sync_start
+        replication_key = metadata.to_map(catalog_entry['metadata']).get((), {}).get('replication-key')
+        if replication_key and self.sf.rest_query_shards > 1:
+            return self._query_sharded(catalog_entry, start_date)
+
+        # Start with the window size learned by previous syncs, if any. The
+        # query of a stream without a replication key is never windowed.
+        window_sizer = WindowSizer(self.sf, catalog_entry['tap_stream_id'], state if replication_key else None)
+        if plan is not None and plan.window_size:
+            window_sizer.limit(plan.window_size)
+        window_plan = WindowPlan(catalog_entry,
+                                 singer_utils.strptime_with_tz(start_date),
+                                 singer_utils.now(),
+                                 window_sizer,
+                                 state if replication_key else None)
+
+        return self._query_windows(catalog_entry, window_plan)
+
+    def _query_sharded(self, catalog_entry, start_date_str):
+        """Splits the date range from `start_date_str` to now into
+        `rest_query_shards` windows of the replication key, which are queried
+        concurrently. The records are emitted window after window, so they
+        stay ordered by the replication key."""
+        start_date = singer_utils.strptime_with_tz(start_date_str)
+        end_date = singer_utils.now()
+        windows = split_date_range(start_date, end_date, self.sf.rest_query_shards)
+        LOGGER.info("Querying %s in %d concurrent date windows", catalog_entry['stream'], len(windows))
+
+        def query_window(window_start, window_end):
+            window_sizer = WindowSizer(self.sf, catalog_entry['tap_stream_id'])
+            window_plan = WindowPlan(catalog_entry, window_start, window_end, window_sizer)
+            return self._query_windows(catalog_entry, window_plan, open_ended=False)
+
+        shards = [Prefetcher(query_window(window_start, window_end),
+                             SHARD_BUFFER_SIZE,
+                             name="{}-window-{}".format(catalog_entry['stream'], i))
+                  for i, (window_start, window_end) in enumerate(windows)]
+        try:
+            for shard in shards:
+                for rec in shard:
+                    yield rec
+        finally:
+            for shard in shards:
+                shard.close()
+
+    def _query_windows(self, catalog_entry, window_plan, open_ended=True):
+        """Queries the records of every window of `window_plan` in turn,
+        splitting the windows that time out. When `open_ended`, the last
+        window is queried without an end date, so that it includes the
+        records modified since the plan was made."""
+        url = "{}/services/data/v{}.0/queryAll".format(self.sf.instance_url, API_VERSION)
 
-        if retries == 0:
-            raise TapSalesforceException(
-                "Ran out of retries attempting to query Salesforce Object {}".format(
-                    catalog_entry['stream']))
+        while True:
+            window = window_plan.next_window()
+            if window is None:
+                break
 
-        retryable = False
-        try:
-            for rec in self._sync_records(url, headers, params):
-                yield rec
-
-            # If the date range was chunked (an end_date was passed), sync
-            # from the end_date -> now
-            if end_date < sync_start:
-                next_start_date_str = singer_utils.strftime(end_date)
-                query = self.sf._build_query_string(catalog_entry, next_start_date_str)
-                for record in self._query_recur(
-                        query,
-                        catalog_entry,
-                        next_start_date_str,
-                        retries=retries):
-                    yield record
-
-        except HTTPError as ex:
-            response = ex.response.json()
-            if isinstance(response, list) and response[0].get("errorCode") == "QUERY_TIMEOUT":
-                start_date = singer_utils.strptime_with_tz(start_date_str)
-                day_range = (end_date - start_date).days
-                LOGGER.info(
-                    "Salesforce returned QUERY_TIMEOUT querying %d days of %s",
-                    day_range,
-                    catalog_entry['stream'])
-                retryable = True
-            else:
+            end_date = None if open_ended and window_plan.is_last(window) else window.end_date
+            query = self.sf._build_query_string(catalog_entry,
+                                                singer_utils.strftime(window.start_date),
+                                                singer_utils.strftime(end_date) if end_date else None)
+            try:
+                for rec in self._sync_records(url, self.sf._get_standard_headers(), {"q": query}):
+                    yield rec
+            except HTTPError as ex:
+                response = ex.response.json()
+                if isinstance(response, list) and response[0].get("errorCode") == "QUERY_TIMEOUT":
+                    LOGGER.info(
+                        "Salesforce returned QUERY_TIMEOUT querying %d days of %s",
+                        (window.end_date - window.start_date).days,
+                        catalog_entry['stream'])
+                    window_plan.failed(window)
+                    continue
                 raise ex
 
-        if retryable:
-            end_date = self.sf.get_window_end_date(singer_utils.strptime_with_tz(start_date_str), end_date)
+            window_plan.done(window)
+            window_plan.pop_done()
 
-            query = self.sf._build_query_string(catalog_entry, singer_utils.strftime(start_date),
-                                                singer_utils.strftime(end_date))
-            for record in self._query_recur(
-                    query,
-                    catalog_entry,
-                    start_date_str,
-                    end_date,
-                    retries - 1):
-                yield record
+        window_plan.finish()
 
     def _sync_records(self, url, headers, params):
+        pages = self._get_pages(url, headers, params)
+        if self.sf.rest_prefetch_pages:
+            # Request the next pages while the records of this one are emitted
+            pages = Prefetcher(pages, self.sf.rest_prefetch_pages, name="rest-prefetch")
+
+        try:
+            for records in pages:
+                for rec in records:
+                    yield rec
+        finally:
+            pages.close()
+
+    def _get_pages(self, url, headers, params):
         while True:
             resp = self.sf._make_request('GET', url, headers=headers, params=params)
             resp_json = resp.json()
 
-            for rec in resp_json.get('records'):
-                yield rec
+            yield resp_json.get('records')
 
             next_records_url = resp_json.get('nextRecordsUrl')
 
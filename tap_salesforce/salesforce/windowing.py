@@ -0,0 +1,234 @@
+import datetime
+import singer
+import singer.utils as singer_utils
+from singer import metadata
+
+from tap_salesforce.messages import OUTPUT_LOCK
+from tap_salesforce.salesforce.exceptions import TapSalesforceException
+
+WINDOW_SIZE_BOOKMARK = 'WindowSeconds'
+WINDOW_PLAN_BOOKMARK = 'WindowPlan'
+MAX_RETRIES = 4
+LOGGER = singer.get_logger()
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class WindowSizer():
+    """Sizes the date windows a stream is queried in once a query timed out.
+
+    A stream is queried over its whole date range until a window fails, which
+    halves the window. Every window that succeeds after that doubles the size
+    of the next one. The largest window that succeeded since the last failure
+    is kept in the stream's 'WindowSeconds' bookmark, so the next sync starts
+    with windows of that size instead of timing out on the whole range again.
+
+    Without a `state` nothing is remembered, the windows are only sized
+    within the current query."""
+
+    def __init__(self, sf, tap_stream_id, state=None):
+        self.sf = sf
+        self.tap_stream_id = tap_stream_id
+        self.state = state
+
+        learned_seconds = singer.get_bookmark(state, tap_stream_id, WINDOW_SIZE_BOOKMARK) if state else None
+        self.size = datetime.timedelta(seconds=learned_seconds) if learned_seconds else None
+
+    def limit(self, size):
+        """Makes the windows no larger than `size`."""
+        self.size = size if self.size is None else min(self.size, size)
+
+    def window_end(self, start_date, end_date):
+        """Returns the end of the next window starting at `start_date`, no
+        later than `end_date`."""
+        if self.size is None:
+            return end_date
+        return min(end_date, start_date + self.size)
+
+    def split(self, start_date, end_date):
+        """Splits [start_date, end_date) into consecutive windows of the
+        current size, returned as (window_start, window_end) tuples."""
+        windows = []
+        while start_date < end_date:
+            window_end = self.window_end(start_date, end_date)
+            windows.append((start_date, window_end))
+            start_date = window_end
+        return windows
+
+    def succeeded(self, start_date, end_date):
+        if self.size is None:
+            return
+
+        size = end_date - start_date
+        self.size = max(self.size, size * 2)
+
+        learned_seconds = self._get_learned_seconds()
+        if learned_seconds is None or size.total_seconds() > learned_seconds:
+            self._set_learned_seconds(size.total_seconds())
+
+    def failed(self, start_date, end_date):
+        """Returns the end of the window, half the size of the one that
+        failed, to retry from `start_date` with."""
+        end_date = self.sf.get_window_end_date(start_date, end_date)
+        self.size = end_date - start_date
+
+        learned_seconds = self._get_learned_seconds()
+        if learned_seconds is None or self.size.total_seconds() < learned_seconds:
+            self._set_learned_seconds(self.size.total_seconds())
+
+        return end_date
+
+    def _get_learned_seconds(self):
+        if self.state is None:
+            return None
+        return singer.get_bookmark(self.state, self.tap_stream_id, WINDOW_SIZE_BOOKMARK)
+
+    def _set_learned_seconds(self, seconds):
+        # Windows may be queried on other threads than the one writing the state
+        if self.state is not None:
+            with OUTPUT_LOCK:
+                singer.set_bookmark(self.state, self.tap_stream_id, WINDOW_SIZE_BOOKMARK, int(seconds))
+
+
+class Window():
+    """A date window [start_date, end_date) of a `WindowPlan`. `result` is
+    left to the client querying it."""
+
+    def __init__(self, start_date, end_date, status=PENDING):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.status = status
+        self.result = None
+
+    def __repr__(self):
+        return "Window({}, {}, {})".format(self.start_date, self.end_date, self.status)
+
+
+class WindowPlan():
+    """The date windows a stream is queried in, from `start_date` up to
+    `end_date`, shared by the REST and Bulk clients.
+
+    Clients loop on `next_window` and report how querying each window went
+    with `done` or `failed`. Windows are planned one at a time from the rest
+    of the range with the size given by `window_sizer`, and a window that
+    failed is replaced by smaller ones covering the same dates. The query
+    fails once `retries` windows have failed.
+
+    With a `state`, the windows that are not done yet are kept in the
+    stream's 'WindowPlan' bookmark, so that an interrupted sync picks them
+    up from its bookmark onwards.
+
+    The query of a stream without a replication key has no date filter, so
+    its whole range is queried as a single window, retried as a whole when
+    it fails."""
+
+    # pylint: disable=too-many-positional-arguments,too-many-arguments
+    def __init__(self, catalog_entry, start_date, end_date, window_sizer, state=None, retries=MAX_RETRIES):
+        self.catalog_entry = catalog_entry
+        self.start_date = start_date
+        self.end_date = end_date
+        self.window_sizer = window_sizer
+        self.state = state
+        self.retries = retries
+        self.windowed = bool(metadata.to_map(catalog_entry['metadata']).get((), {}).get('replication-key'))
+        self.windows = self._load_windows()
+        # The first window is planned even if the range is empty
+        self.planned_until = self.windows[-1].end_date if self.windows else None
+
+    def next_window(self):
+        """Marks the next pending window as running and returns it, or
+        returns None once the whole range has been planned and no window
+        is pending."""
+        window = next((w for w in self.windows if w.status == PENDING), None)
+        if window is None:
+            start_date = self.start_date if self.planned_until is None else self.planned_until
+            if self.planned_until is not None and start_date >= self.end_date:
+                return None
+            window_end = self.window_sizer.window_end(start_date, self.end_date) if self.windowed else self.end_date
+            window = Window(start_date, window_end)
+            self.windows.append(window)
+            self.planned_until = window.end_date
+
+        if self.retries == 0:
+            raise TapSalesforceException(
+                "Ran out of retries attempting to query Salesforce Object {}".format(self.catalog_entry['stream']))
+
+        window.status = RUNNING
+        self._checkpoint()
+        return window
+
+    def done(self, window):
+        window.status = DONE
+        self.window_sizer.succeeded(window.start_date, window.end_date)
+        self._checkpoint()
+
+    def failed(self, window):
+        """Replaces `window` with windows of the smaller size the window
+        sizer falls back to."""
+        window.status = FAILED
+        self.retries -= 1
+
+        index = self.windows.index(window)
+        if not self.windowed:
+            self.windows.insert(index + 1, Window(window.start_date, window.end_date))
+            return
+
+        self.window_sizer.failed(window.start_date, window.end_date)
+        self.windows[index + 1:index + 1] = [Window(start_date, end_date) for start_date, end_date
+                                             in self.window_sizer.split(window.start_date, window.end_date)]
+        self._checkpoint()
+
+    def pop_done(self):
+        """Removes the windows that are done from the start of the plan, up
+        to the first one that is not, and returns them in order. Windows that
+        failed are dropped along the way."""
+        popped = []
+        while self.windows and self.windows[0].status in (DONE, FAILED):
+            window = self.windows.pop(0)
+            if window.status == DONE:
+                popped.append(window)
+        return popped
+
+    def is_last(self, window):
+        """Returns whether `window` ends the range of the plan."""
+        return window.end_date >= self.end_date
+
+    def finish(self):
+        """Removes the plan from the state once every window is done."""
+        if self.state is not None:
+            with OUTPUT_LOCK:
+                self.state.get('bookmarks', {}).get(self.catalog_entry['tap_stream_id'], {}).pop(
+                    WINDOW_PLAN_BOOKMARK, None)
+
+    def _load_windows(self):
+        """Returns the windows left by an interrupted sync that are after
+        `start_date`, the first one starting at `start_date`."""
+        if self.state is None or not self.windowed:
+            return []
+
+        windows = []
+        for start_str, end_str in singer.get_bookmark(self.state, self.catalog_entry['tap_stream_id'],
+                                                      WINDOW_PLAN_BOOKMARK) or []:
+            start_date = max(singer_utils.strptime_with_tz(start_str), self.start_date)
+            end_date = singer_utils.strptime_with_tz(end_str)
+            if start_date < end_date:
+                windows.append(Window(start_date, end_date))
+
+        if windows:
+            windows[0].start_date = self.start_date
+            LOGGER.info("Resuming %d planned date windows of %s", len(windows), self.catalog_entry['stream'])
+        return windows
+
+    def _checkpoint(self):
+        # A range queried as a single window has nothing worth resuming
+        if self.state is None or not self.windowed or self.window_sizer.size is None:
+            return
+
+        windows = [[singer_utils.strftime(w.start_date), singer_utils.strftime(w.end_date)]
+                   for w in self.windows if w.status in (PENDING, RUNNING)]
+        # Windows may be queried on other threads than the one writing the state
+        with OUTPUT_LOCK:
+            singer.set_bookmark(self.state, self.catalog_entry['tap_stream_id'], WINDOW_PLAN_BOOKMARK, windows)
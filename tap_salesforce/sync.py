@@ -5,6 +5,9 @@ from singer import Transformer, metadata, metrics
 from singer import SingerSyncError
 from requests.exceptions import RequestException
 from tap_salesforce.salesforce.bulk import Bulk
+from tap_salesforce.bookmarks import ReplicationKeyTracker
+from tap_salesforce.converters import RecordConverter
+from tap_salesforce.messages import ThrottledStateWriter, write_message, write_state
 
 LOGGER = singer.get_logger()
 
@@ -64,8 +67,11 @@ def set_stream_version(catalog_entry, state, stream_version):
 def resume_syncing_bulk_query(sf, catalog_entry, job_id, state, counter):
     bulk = Bulk(sf)
     current_bookmark = singer.get_bookmark(state, catalog_entry['tap_stream_id'], 'JobHighestBookmarkSeen') or sf.get_start_date(state, catalog_entry)
-    current_bookmark = singer_utils.strptime_with_tz(current_bookmark)
     batch_ids = singer.get_bookmark(state, catalog_entry['tap_stream_id'], 'BatchIDs')
+    # Byte and row offset of the last record emitted from the current batch
+    if singer.get_bookmark(state, catalog_entry['tap_stream_id'], 'BatchResultOffset') is None:
+        state = singer.set_bookmark(state, catalog_entry['tap_stream_id'], 'BatchResultOffset', {})
+    checkpoint = singer.get_bookmark(state, catalog_entry['tap_stream_id'], 'BatchResultOffset')
 
     start_time = singer_utils.now()
     stream = catalog_entry['stream']
@@ -75,18 +81,34 @@ def resume_syncing_bulk_query(sf, catalog_entry, job_id, state, counter):
     stream_version = get_stream_version(catalog_entry, state)
     schema = catalog_entry['schema']
 
+    replication_key_tracker = ReplicationKeyTracker(start_time, current_bookmark)
+
     if not bulk.job_exists(job_id):
         LOGGER.info("Found stored Job ID that no longer exists, resetting bookmark and removing JobID from state.")
         return counter
 
+    failed_batch_ids = []
+
+    def completed_batch_ids():
+        # Batches of a job whose chunks were being streamed may still be
+        # running, wait for each of them to finish
+        for batches in bulk.watch_pk_chunked_batches(job_id):
+            for batch in batches:
+                if batch['id'] not in batch_ids:
+                    continue
+                if batch['state'] == 'Completed':
+                    yield batch['id']
+                elif batch['state'] == 'Failed':
+                    failed_batch_ids.append(batch['id'])
+
     # Iterate over the remaining batches, removing them once they are synced
-    for batch_id in batch_ids[:]:
-        with Transformer(pre_hook=transform_bulk_data_hook) as transformer:
-            for rec in bulk.get_batch_results(job_id, batch_id, catalog_entry):
+    with Transformer(pre_hook=transform_bulk_data_hook) as transformer:
+        converter = RecordConverter(schema, transformer, BLACKLISTED_FIELDS)
+        for batch_id, results in bulk.iter_batch_results(job_id, completed_batch_ids(), catalog_entry, checkpoint):
+            for rec in results:
                 counter.increment()
-                rec = transformer.transform(rec, schema)
-                rec = fix_record_anytype(rec, schema)
-                singer.write_message(
+                rec = converter.convert(rec)
+                write_message(
                     singer.RecordMessage(
                         stream=(
                             stream_alias or stream),
@@ -96,28 +118,43 @@ def resume_syncing_bulk_query(sf, catalog_entry, job_id, state, counter):
                     allow_nan=True)
 
                 # Update bookmark if necessary
-                replication_key_value = replication_key and singer_utils.strptime_with_tz(rec[replication_key])
-                if replication_key_value and replication_key_value <= start_time and replication_key_value > current_bookmark:
-                    current_bookmark = singer_utils.strptime_with_tz(rec[replication_key])
-
-        state = singer.set_bookmark(state,
-                                    catalog_entry['tap_stream_id'],
-                                    'JobHighestBookmarkSeen',
-                                    singer_utils.strftime(current_bookmark))
-        batch_ids.remove(batch_id)
-        LOGGER.info("Finished syncing batch %s. Removing batch from state.", batch_id)
-        LOGGER.info("Batches to go: %d", len(batch_ids))
-        singer.write_state(state)
+                if replication_key:
+                    replication_key_tracker.update(rec[replication_key])
+
+            state = singer.set_bookmark(state,
+                                        catalog_entry['tap_stream_id'],
+                                        'JobHighestBookmarkSeen',
+                                        replication_key_tracker.highest)
+            checkpoint.clear()
+            batch_ids.remove(batch_id)
+            LOGGER.info("Finished syncing batch %s. Removing batch from state.", batch_id)
+            LOGGER.info("Batches to go: %d", len(batch_ids))
+            write_state(state)
+
+    if failed_batch_ids:
+        # Records of the failed batches were never emitted, so the existing
+        # bookmark must be kept rather than the highest one seen in the job
+        LOGGER.info("Batches %s of job %s failed, keeping the existing bookmark.", failed_batch_ids, job_id)
+        state['bookmarks'][catalog_entry['tap_stream_id']].pop('JobHighestBookmarkSeen', None)
 
     return counter
 
 def sync_stream(sf, catalog_entry, state):
     stream = catalog_entry['stream']
 
+    # PK chunking is decided per stream by the Bulk client, as is using a
+    # job submitted ahead
+    sf.pk_chunking = False
+    sf.query_started_at = None
+
     with metrics.record_counter(stream) as counter:
         try:
             sync_records(sf, catalog_entry, state, counter)
-            singer.write_state(state)
+            if sf.route_small_streams:
+                # The number of records of this sync decides whether the
+                # next one is routed to REST
+                state = singer.set_bookmark(state, catalog_entry['tap_stream_id'], 'LastSyncRecords', counter.value)
+            write_state(state)
         except RequestException as ex:
             raise Exception("{} Response: {}, (Stream: {})".format(
                 ex, ex.response.text, stream)) from ex
@@ -132,7 +169,6 @@ def sync_stream(sf, catalog_entry, state):
         return counter
 
 def sync_records(sf, catalog_entry, state, counter):
-    chunked_bookmark = singer_utils.strptime_with_tz(sf.get_start_date(state, catalog_entry))
     stream = catalog_entry['stream']
     schema = catalog_entry['schema']
     stream_alias = catalog_entry.get('stream_alias')
@@ -144,49 +180,56 @@ def sync_records(sf, catalog_entry, state, counter):
     replication_key_value = None
 
     start_time = singer_utils.now()
+    replication_key_tracker = ReplicationKeyTracker(start_time, sf.get_start_date(state, catalog_entry))
 
     LOGGER.info('Syncing Salesforce data for stream %s', stream)
 
-    for rec in sf.query(catalog_entry, state):
-        counter.increment()
-        with Transformer(pre_hook=transform_bulk_data_hook) as transformer:
-            rec = transformer.transform(rec, schema)
-        rec = fix_record_anytype(rec, schema)
-        singer.write_message(
-            singer.RecordMessage(
-                stream=(
-                    stream_alias or stream),
-                record=rec,
-                version=stream_version,
-                time_extracted=start_time),
-            allow_nan=True)
-
-        replication_key_value = replication_key and singer_utils.strptime_with_tz(rec[replication_key])
-
-        if sf.pk_chunking:
-            if replication_key_value and replication_key_value <= start_time and replication_key_value > chunked_bookmark:
-                # Replace the highest seen bookmark and save the state in case we need to resume later
-                chunked_bookmark = singer_utils.strptime_with_tz(rec[replication_key])
+    # Bookmark updates are written according to the configured flush policy,
+    # sync_stream writes the final state once the stream is done
+    state_writer = ThrottledStateWriter(sf.state_flush_records, sf.state_flush_seconds)
+    with Transformer(pre_hook=transform_bulk_data_hook) as transformer:
+        converter = RecordConverter(schema, transformer, BLACKLISTED_FIELDS)
+        for rec in sf.query(catalog_entry, state):
+            counter.increment()
+            rec = converter.convert(rec)
+            write_message(
+                singer.RecordMessage(
+                    stream=(
+                        stream_alias or stream),
+                    record=rec,
+                    version=stream_version,
+                    time_extracted=start_time),
+                allow_nan=True)
+
+            if not replication_key:
+                continue
+
+            raised_highest = replication_key_tracker.update(rec[replication_key])
+            replication_key_value = replication_key_tracker.last_value
+
+            if sf.pk_chunking:
+                if raised_highest:
+                    # Replace the highest seen bookmark and save the state in case we need to resume later
+                    state = singer.set_bookmark(
+                        state,
+                        catalog_entry['tap_stream_id'],
+                        'JobHighestBookmarkSeen',
+                        replication_key_tracker.highest)
+                    state_writer.write_state(state)
+            # Before writing a bookmark, make sure Salesforce has not given us a
+            # record with one outside our range
+            elif replication_key_value and replication_key_tracker.is_within_sync(replication_key_value):
                 state = singer.set_bookmark(
                     state,
                     catalog_entry['tap_stream_id'],
-                    'JobHighestBookmarkSeen',
-                    singer_utils.strftime(chunked_bookmark))
-                singer.write_state(state)
-        # Before writing a bookmark, make sure Salesforce has not given us a
-        # record with one outside our range
-        elif replication_key_value and replication_key_value <= start_time:
-            state = singer.set_bookmark(
-                state,
-                catalog_entry['tap_stream_id'],
-                replication_key,
-                rec[replication_key])
-            singer.write_state(state)
+                    replication_key,
+                    rec[replication_key])
+                state_writer.write_state(state)
 
         # Tables with no replication_key will send an
         # activate_version message for the next sync
     if not replication_key:
-        singer.write_message(activate_version_message)
+        write_message(activate_version_message)
         state = set_stream_version(catalog_entry, state, None)
 
     # If pk_chunking is set, and selected streams has replication key then only write a bookmark at the end
@@ -196,36 +239,13 @@ def sync_records(sf, catalog_entry, state, counter):
             state,
             catalog_entry['tap_stream_id'],
             replication_key,
-            singer_utils.strftime(chunked_bookmark))
+            replication_key_tracker.highest)
     elif replication_key and not replication_key_value:
-        # If no records are synced update bookmark with the start_time
+        # If no records are synced update bookmark with the start_time, or
+        # the time the query ran at if that was earlier
+        query_time = min(start_time, sf.query_started_at) if sf.query_started_at else start_time
         state = singer.set_bookmark(
             state,
             catalog_entry['tap_stream_id'],
             replication_key,
-            singer_utils.strftime(start_time))
-
-
-def fix_record_anytype(rec, schema):
-    """Modifies a record when the schema has no 'type' element due to a SF type of 'anyType.'
-    Attempts to set the record's value for that element to an int, float, or string."""
-    def try_cast(val, coercion):
-        try:
-            return coercion(val)
-        except BaseException:
-            return val
-
-    for k, v in rec.items():
-        if schema['properties'][k].get("type") is None:
-            val = v
-            val = try_cast(v, int)
-            val = try_cast(v, float)
-            if v in ["true", "false"]:
-                val = (v == "true")  # pylint: disable=superfluous-parens
-
-            if v == "":
-                val = None
-
-            rec[k] = val
-
-    return rec
+            singer_utils.strftime(query_time))
@@ -0,0 +1,59 @@
+import unittest
+from unittest import mock
+from tap_salesforce import Salesforce
+from tap_salesforce.salesforce.exceptions import TapSalesforceException
+
+SOBJECTS = ['Object{}'.format(i) for i in range(60)]
+
+
+def describe_batch(sobject_names):
+    return {"hasErrors": False,
+            "results": [{"statusCode": 200, "result": {"name": name}} for name in sobject_names]}
+
+
+@mock.patch('tap_salesforce.salesforce.time.sleep')
+class TestBatchDescribe(unittest.TestCase):
+
+    def test_chunks_are_described_concurrently_in_order(self, mocked_sleep):
+        """
+        To verify that chunks described on the pool are returned in the order of the objects
+        """
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK", describe_concurrency=3)
+
+        with mock.patch.object(sf, '_post_describe_batch', side_effect=describe_batch) as mocked_post:
+            results = sf.batch_describe(SOBJECTS)
+
+        self.assertEqual(list(results.keys()), SOBJECTS)
+        self.assertEqual(mocked_post.call_count, 3)
+
+    def test_failed_objects_are_retried(self, mocked_sleep):
+        """
+        To verify that only the objects whose describe failed are requested again
+        """
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK")
+        responses = [
+            {"hasErrors": True,
+             "results": [{"statusCode": 200, "result": {"name": "Account"}},
+                         {"statusCode": 500, "result": [{"errorCode": "UNKNOWN_EXCEPTION"}]}]},
+            describe_batch(["Contact"]),
+        ]
+
+        with mock.patch.object(sf, '_post_describe_batch', side_effect=responses) as mocked_post:
+            results = sf.batch_describe(["Account", "Contact"])
+
+        self.assertEqual(results, {"Account": {"name": "Account"}, "Contact": {"name": "Contact"}})
+        self.assertEqual(mocked_post.call_args_list[1], mock.call(["Contact"]))
+
+    def test_error_is_raised_once_retries_run_out(self, mocked_sleep):
+        """
+        To verify that an object that keeps failing still fails the discovery
+        """
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK")
+        failure = {"hasErrors": True, "results": [{"statusCode": 500, "result": [{"errorCode": "UNKNOWN_EXCEPTION"}]}]}
+
+        with mock.patch.object(sf, '_post_describe_batch', return_value=failure) as mocked_post:
+            with self.assertRaises(TapSalesforceException) as err:
+                sf.batch_describe(["Account"])
+
+        self.assertEqual(mocked_post.call_count, 3)
+        self.assertIn("UNKNOWN_EXCEPTION", str(err.exception))
@@ -0,0 +1,136 @@
+import unittest
+from unittest import mock
+from requests.exceptions import ChunkedEncodingError
+from tap_salesforce import Salesforce
+from tap_salesforce.salesforce import Bulk2
+from tap_salesforce.salesforce.exceptions import TapSalesforceException
+
+# Pages of results keyed by the locator they are requested with
+PAGES = {
+    None: (b'"Id","SystemModstamp"\n"1","2024-01-01T00:00:00.000Z"\n"2","2024-01-02T00:00:00.000Z"\n', 'L2'),
+    'L2': (b'"Id","SystemModstamp"\n"3","2024-01-03T00:00:00.000Z"\n', 'null'),
+}
+
+
+class FakeResponse:
+
+    def __init__(self, body, locator, fail_after=None):
+        self.body = body
+        self.headers = {'Sforce-Locator': locator}
+        self.fail_after = fail_after
+        self.encoding = 'utf-8'
+
+    def iter_content(self, chunk_size=None):
+        for i in range(0, len(self.body), 8):
+            if self.fail_after is not None and i >= self.fail_after:
+                raise ChunkedEncodingError("Connection broken")
+            yield self.body[i:i + 8]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+def get_results_page(job_id, locator):
+    return FakeResponse(*PAGES[locator])
+
+
+def make_catalog_entry(replication_key='SystemModstamp'):
+    return {
+        'stream': 'Account',
+        'tap_stream_id': 'Account',
+        'schema': {'properties': {'Id': {}, 'SystemModstamp': {}}},
+        'metadata': [{'breadcrumb': [], 'metadata': {'replication-key': replication_key}}]
+    }
+
+
+@mock.patch('tap_salesforce.salesforce.bulk2.write_state')
+@mock.patch('tap_salesforce.salesforce.Bulk2.check_bulk2_quota_usage')
+@mock.patch('tap_salesforce.salesforce.Bulk2._create_job', return_value='job')
+class TestBulk2(unittest.TestCase):
+
+    def setUp(self):
+        self.bulk2 = Bulk2(Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK2"))
+
+    @mock.patch('tap_salesforce.salesforce.Bulk2._get_job', return_value={'state': 'JobComplete'})
+    @mock.patch('tap_salesforce.salesforce.Bulk2._get_results_page', side_effect=get_results_page)
+    def test_results_are_read_page_by_page(self, mocked_get_results_page, mocked_get_job, mocked_create_job, mocked_quota, mocked_write_state):
+        """
+        To verify that every page is read by following the locators and that the
+        job is removed from the state once all of them are read
+        """
+        state = {}
+        locators_in_state = []
+        mocked_write_state.side_effect = lambda state: locators_in_state.append(state['bookmarks']['Account']['Bulk2Locator'])
+
+        records = list(self.bulk2.query(make_catalog_entry(), state))
+
+        self.assertEqual([r['Id'] for r in records], ['1', '2', '3'])
+        self.assertEqual([args[1] for args, _ in mocked_get_results_page.call_args_list], [None, 'L2'])
+        self.assertEqual(locators_in_state, [None, 'L2'])
+        self.assertEqual(state, {'bookmarks': {'Account': {}}})
+
+    @mock.patch('tap_salesforce.salesforce.Bulk2._get_job', return_value={'state': 'JobComplete'})
+    @mock.patch('tap_salesforce.salesforce.Bulk2._get_results_page', side_effect=get_results_page)
+    def test_resume_job_from_locator(self, mocked_get_results_page, mocked_get_job, mocked_create_job, mocked_quota, mocked_write_state):
+        """
+        To verify that a job left in the state is continued from its locator instead of creating a new job
+        """
+        state = {'bookmarks': {'Account': {'Bulk2JobID': 'old_job', 'Bulk2Locator': 'L2'}}}
+
+        records = list(self.bulk2.query(make_catalog_entry(), state))
+
+        self.assertEqual([r['Id'] for r in records], ['3'])
+        mocked_create_job.assert_not_called()
+        mocked_get_results_page.assert_called_once_with('old_job', 'L2')
+
+    @mock.patch('tap_salesforce.salesforce.Bulk2._get_results_page', side_effect=get_results_page)
+    def test_expired_job_is_not_resumed(self, mocked_get_results_page, mocked_create_job, mocked_quota, mocked_write_state):
+        """
+        To verify that a new job is created when the job left in the state no longer exists
+        """
+        state = {'bookmarks': {'Account': {'Bulk2JobID': 'old_job', 'Bulk2Locator': 'L2'}}}
+
+        with mock.patch.object(self.bulk2, '_get_job', side_effect=[None, {'state': 'JobComplete'}]):
+            records = list(self.bulk2.query(make_catalog_entry(), state))
+
+        self.assertEqual([r['Id'] for r in records], ['1', '2', '3'])
+        mocked_create_job.assert_called_once()
+
+    @mock.patch('tap_salesforce.salesforce.Bulk2._get_job', return_value={'state': 'JobComplete'})
+    @mock.patch('tap_salesforce.salesforce.Bulk2._get_results_page', side_effect=get_results_page)
+    def test_full_table_stream_is_not_resumable(self, mocked_get_results_page, mocked_get_job, mocked_create_job, mocked_quota, mocked_write_state):
+        """
+        To verify that the job of a full table stream is not kept in the state
+        """
+        state = {}
+
+        records = list(self.bulk2.query(make_catalog_entry(replication_key=None), state))
+
+        self.assertEqual(len(records), 3)
+        mocked_write_state.assert_not_called()
+        self.assertEqual(state, {})
+
+    @mock.patch('tap_salesforce.salesforce.Bulk2._get_job', return_value={'state': 'JobComplete'})
+    def test_interrupted_page_skips_emitted_records(self, mocked_get_job, mocked_create_job, mocked_quota, mocked_write_state):
+        """
+        To verify that an interrupted page is requested again without emitting its records twice
+        """
+        responses = [FakeResponse(PAGES[None][0], 'null', fail_after=40), FakeResponse(PAGES[None][0], 'null')]
+
+        with mock.patch.object(self.bulk2, '_get_results_page', side_effect=responses):
+            records = list(self.bulk2.query(make_catalog_entry(), {}))
+
+        self.assertEqual([r['Id'] for r in records], ['1', '2'])
+
+    @mock.patch('tap_salesforce.salesforce.Bulk2._get_job', return_value={'state': 'Failed', 'errorMessage': 'INVALID_FIELD'})
+    def test_failed_job_raises(self, mocked_get_job, mocked_create_job, mocked_quota, mocked_write_state):
+        """
+        To verify that the error message of a failed job is raised
+        """
+        with self.assertRaises(TapSalesforceException) as err:
+            list(self.bulk2.query(make_catalog_entry(), {}))
+
+        self.assertEqual(str(err.exception), 'INVALID_FIELD')
@@ -0,0 +1,86 @@
+import threading
+import time
+import unittest
+from unittest import mock
+from tap_salesforce import Salesforce
+from tap_salesforce.salesforce import Bulk
+from tap_salesforce.salesforce.concurrency import ordered_map
+
+
+class TestOrderedMap(unittest.TestCase):
+
+    def test_results_are_yielded_in_input_order(self):
+        """
+        To verify that results come back in the order of the input even when
+        later items finish first
+        """
+        def slow_for_small_numbers(item):
+            time.sleep(0.05 / (item + 1))
+            return item * 2
+
+        self.assertEqual(list(ordered_map(slow_for_small_numbers, range(6), 3)), [0, 2, 4, 6, 8, 10])
+
+    def test_items_are_pulled_lazily(self):
+        """
+        To verify that no more than max_workers items are in flight ahead of the consumer
+        """
+        pulled = []
+
+        def items():
+            for item in range(10):
+                pulled.append(item)
+                yield item
+
+        results = ordered_map(lambda item: item, items(), 2)
+        next(results)
+
+        self.assertEqual(pulled, [0, 1, 2])
+
+
+class TestBatchResultPrefetch(unittest.TestCase):
+
+    catalog_entry = {'stream': 'Task', 'tap_stream_id': 'Task'}
+
+    def download(self, job_id, batch_id, catalog_entry):
+        self.download_threads.add(threading.current_thread().name)
+        return batch_id, [batch_id]
+
+    def read(self, batch_id, csv_files, checkpoint=None):
+        return iter([{'Id': csv_files[0]}])
+
+    def sync_batches(self, bulk_download_concurrency):
+        self.download_threads = set()
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z',
+                        api_type="BULK",
+                        bulk_download_concurrency=bulk_download_concurrency)
+        bulk = Bulk(sf)
+
+        with mock.patch.object(bulk, '_download_batch_results', side_effect=self.download), \
+             mock.patch.object(bulk, '_read_batch_results', side_effect=self.read):
+            return [(batch_id, list(records))
+                    for batch_id, records in bulk.iter_batch_results('job', ['b1', 'b2', 'b3'], self.catalog_entry)]
+
+    def test_prefetched_batches_are_emitted_in_order(self):
+        """
+        To verify that batches downloaded in the background are still emitted in batch order
+        """
+        results = self.sync_batches(bulk_download_concurrency=2)
+
+        self.assertEqual(results, [('b1', [{'Id': 'b1'}]), ('b2', [{'Id': 'b2'}]), ('b3', [{'Id': 'b3'}])])
+        self.assertNotIn(threading.current_thread().name, self.download_threads)
+
+    def test_default_reads_batches_serially(self):
+        """
+        To verify that batches are read on the calling thread, one at a time, by default
+        """
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK")
+        bulk = Bulk(sf)
+
+        with mock.patch.object(bulk, 'get_batch_results', side_effect=lambda job_id, batch_id, catalog_entry, checkpoint=None: [batch_id]) as mocked_get_batch_results, \
+             mock.patch.object(bulk, '_download_batch_results') as mocked_download:
+            results = [(batch_id, list(records))
+                       for batch_id, records in bulk.iter_batch_results('job', ['b1', 'b2', 'b3'], self.catalog_entry)]
+
+        self.assertEqual(results, [('b1', ['b1']), ('b2', ['b2']), ('b3', ['b3'])])
+        self.assertEqual(mocked_get_batch_results.call_count, 3)
+        mocked_download.assert_not_called()
@@ -0,0 +1,51 @@
+import datetime
+import itertools
+import threading
+import unittest
+from unittest import mock
+from tap_salesforce import Salesforce
+from tap_salesforce.salesforce import Bulk
+
+CATALOG_ENTRY = {
+    'stream': 'Account',
+    'tap_stream_id': 'Account',
+    'schema': {'properties': {'Id': {}, 'SystemModstamp': {}}},
+    'metadata': [{'breadcrumb': [], 'metadata': {'replication-key': 'SystemModstamp'}},
+                 {'breadcrumb': ['properties', 'Id'], 'metadata': {'inclusion': 'automatic'}},
+                 {'breadcrumb': ['properties', 'SystemModstamp'], 'metadata': {'inclusion': 'automatic'}}]
+}
+
+
+@mock.patch('tap_salesforce.salesforce.Bulk._close_job')
+@mock.patch('tap_salesforce.salesforce.bulk.singer_utils.now',
+            return_value=datetime.datetime(2024, 1, 17, tzinfo=datetime.timezone.utc))
+class TestBulkConcurrentWindows(unittest.TestCase):
+
+    def test_windows_run_concurrently_and_are_yielded_in_order(self, mocked_now, mocked_close_job):
+        """
+        To verify that once the whole range failed, its windows run their jobs
+        at the same time and their statuses come out in window order
+        """
+        sf = Salesforce(default_start_date='2024-01-01T00:00:00Z', api_type="BULK", bulk_window_concurrency=2)
+        bulk = Bulk(sf)
+        job_ids = itertools.count()
+        windows = {}
+        both_windows_running = threading.Barrier(2, timeout=5)
+
+        def add_batch(catalog_entry, job_id, start_date, end_date=None, order_by_clause=True):
+            windows[job_id] = (start_date[:10], end_date[:10])
+
+        def poll(job_id):
+            if windows[job_id] == ('2024-01-01', '2024-01-17'):
+                return {'completed': [], 'failed': {'b': 'QUERY_TIMEOUT'}}
+            both_windows_running.wait()
+            return {'completed': ['batch-{}'.format(windows[job_id][0])], 'failed': {}}
+
+        with mock.patch.object(bulk, '_create_job', side_effect=lambda *args: next(job_ids)), \
+             mock.patch.object(bulk, '_add_batch', side_effect=add_batch), \
+             mock.patch.object(bulk, '_poll_on_pk_chunked_batch_status', side_effect=poll):
+            status_list = list(bulk._bulk_with_window([], CATALOG_ENTRY, '2024-01-01T00:00:00Z'))
+
+        self.assertEqual([s['completed'] for s in status_list], [['batch-2024-01-01'], ['batch-2024-01-09']])
+        self.assertEqual(sorted(windows.values()),
+                         [('2024-01-01', '2024-01-09'), ('2024-01-01', '2024-01-17'), ('2024-01-09', '2024-01-17')])
@@ -0,0 +1,148 @@
+import unittest
+from unittest import mock
+from requests.exceptions import ChunkedEncodingError
+from tap_salesforce import Salesforce
+from tap_salesforce.salesforce import Bulk
+
+HEADER = b'"Id","Name"\n'
+CSV_BODY = HEADER + b'"1","one"\n"2","two"\n"3","three"\n'
+SECOND_RECORD_OFFSET = len(HEADER) + len(b'"1","one"\n')
+
+
+class FakeResponse:
+
+    def __init__(self, body, status_code=200, fail_after=None):
+        self.body = body
+        self.status_code = status_code
+        self.fail_after = fail_after
+        self.encoding = 'utf-8'
+
+    def iter_content(self, chunk_size=None):
+        for i in range(0, len(self.body), 4):
+            if self.fail_after is not None and i >= self.fail_after:
+                raise ChunkedEncodingError("Connection broken")
+            yield self.body[i:i + 4]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+def fake_range_server(fail_after=None, honour_range=True):
+    """Returns a '_get_batch_result' side effect serving CSV_BODY, optionally
+    breaking the first transfer after 'fail_after' bytes."""
+    calls = []
+
+    def get_batch_result(job_id, batch_id, result, offset=0):
+        calls.append(offset)
+        breaks = fail_after if len(calls) == 1 else None
+        if offset and honour_range:
+            return FakeResponse(CSV_BODY[offset:], status_code=206)
+        return FakeResponse(CSV_BODY, fail_after=breaks)
+
+    return get_batch_result, calls
+
+
+@mock.patch('tap_salesforce.salesforce.Bulk._get_batch_result_ids', return_value=['r1'])
+class TestBulkResumableDownloads(unittest.TestCase):
+
+    catalog_entry = {'stream': 'Account', 'tap_stream_id': 'Account'}
+    expected_records = [{'Id': '1', 'Name': 'one'}, {'Id': '2', 'Name': 'two'}, {'Id': '3', 'Name': 'three'}]
+
+    def setUp(self):
+        self.bulk = Bulk(Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK"))
+
+    def test_interrupted_transfer_resumes_from_last_byte(self, mocked_result_ids):
+        """
+        To verify that a dropped transfer continues with a Range request and no record is emitted twice
+        """
+        get_batch_result, calls = fake_range_server(fail_after=20)
+
+        with mock.patch.object(self.bulk, '_get_batch_result', side_effect=get_batch_result):
+            records = list(self.bulk.get_batch_results('job', 'batch', self.catalog_entry))
+
+        self.assertEqual(records, self.expected_records)
+        self.assertEqual(calls, [0, 20])
+
+    def test_ignored_range_header_skips_received_bytes(self, mocked_result_ids):
+        """
+        To verify that if Salesforce answers a Range request with the whole file, the
+        bytes that were already received are skipped
+        """
+        get_batch_result, calls = fake_range_server(fail_after=20, honour_range=False)
+
+        with mock.patch.object(self.bulk, '_get_batch_result', side_effect=get_batch_result):
+            records = list(self.bulk.get_batch_results('job', 'batch', self.catalog_entry))
+
+        self.assertEqual(records, self.expected_records)
+        self.assertEqual(calls, [0, 20])
+
+    def test_checkpoint_tracks_last_record(self, mocked_result_ids):
+        """
+        To verify that the checkpoint points right after the last record yielded
+        """
+        get_batch_result, _ = fake_range_server()
+        checkpoint = {}
+
+        with mock.patch.object(self.bulk, '_get_batch_result', side_effect=get_batch_result):
+            records = self.bulk.get_batch_results('job', 'batch', self.catalog_entry, checkpoint)
+            next(records)
+
+        self.assertEqual(checkpoint, {'BatchID': 'batch', 'ResultID': 'r1', 'ByteOffset': SECOND_RECORD_OFFSET, 'RowOffset': 1})
+
+    def test_resume_from_checkpoint(self, mocked_result_ids):
+        """
+        To verify that a checkpoint left by an earlier run is resumed from without
+        emitting the records before it again
+        """
+        get_batch_result, calls = fake_range_server()
+        checkpoint = {'BatchID': 'batch', 'ResultID': 'r1', 'ByteOffset': SECOND_RECORD_OFFSET, 'RowOffset': 1}
+
+        with mock.patch.object(self.bulk, '_get_batch_result', side_effect=get_batch_result):
+            records = list(self.bulk.get_batch_results('job', 'batch', self.catalog_entry, checkpoint))
+
+        self.assertEqual(records, self.expected_records[1:])
+        # the header is read from the start of the file, then the records from the checkpoint
+        self.assertEqual(calls, [0, SECOND_RECORD_OFFSET])
+        self.assertEqual(checkpoint['RowOffset'], 3)
+        self.assertEqual(checkpoint['ByteOffset'], len(CSV_BODY))
+
+    def test_resume_from_checkpoint_when_spooling(self, mocked_result_ids):
+        """
+        To verify that a spooled result file skips the records before the checkpoint
+        """
+        self.bulk.sf.bulk_spool_results = True
+        get_batch_result, _ = fake_range_server()
+        checkpoint = {'BatchID': 'batch', 'ResultID': 'r1', 'ByteOffset': SECOND_RECORD_OFFSET, 'RowOffset': 1}
+
+        with mock.patch.object(self.bulk, '_get_batch_result', side_effect=get_batch_result):
+            records = list(self.bulk.get_batch_results('job', 'batch', self.catalog_entry, checkpoint))
+
+        self.assertEqual(records, self.expected_records[1:])
+        self.assertEqual(checkpoint['RowOffset'], 3)
+
+    def test_checkpoint_of_other_batch_is_ignored(self, mocked_result_ids):
+        """
+        To verify that a checkpoint only applies to the batch it was taken in
+        """
+        get_batch_result, _ = fake_range_server()
+        checkpoint = {'BatchID': 'other', 'ResultID': 'r1', 'ByteOffset': SECOND_RECORD_OFFSET, 'RowOffset': 1}
+
+        with mock.patch.object(self.bulk, '_get_batch_result', side_effect=get_batch_result):
+            records = list(self.bulk.get_batch_results('job', 'batch', self.catalog_entry, checkpoint))
+
+        self.assertEqual(records, self.expected_records)
+
+    def test_range_request_asks_for_an_uncompressed_body(self, mocked_result_ids):
+        """
+        To verify that a Range request asks for the body without compression,
+        as its offset counts the bytes of the decoded body
+        """
+        with mock.patch.object(self.bulk.sf, '_make_request') as mocked_request:
+            self.bulk._get_batch_result('job', 'batch', 'r1', SECOND_RECORD_OFFSET)
+
+        headers = mocked_request.call_args[1]['headers']
+        self.assertEqual(headers['Range'], 'bytes={}-'.format(SECOND_RECORD_OFFSET))
+        self.assertEqual(headers['Accept-Encoding'], 'identity')
@@ -0,0 +1,127 @@
+import threading
+import unittest
+from unittest import mock
+from tap_salesforce import Salesforce, metrics
+from tap_salesforce.salesforce import Bulk
+from tap_salesforce.sync import resume_syncing_bulk_query
+
+# Successive responses of '_get_batches' for a PK chunked job, the original
+# batch is 'Not Processed' and the chunks complete one by one
+BATCH_POLLS = [
+    [{'id': 'b0', 'state': 'Not Processed'}, {'id': 'b1', 'state': 'Completed'}, {'id': 'b2', 'state': 'InProgress'}],
+    [{'id': 'b0', 'state': 'Not Processed'}, {'id': 'b1', 'state': 'Completed'}, {'id': 'b2', 'state': 'Completed'}],
+]
+
+
+@mock.patch('tap_salesforce.salesforce.bulk.write_state')
+@mock.patch('tap_salesforce.salesforce.bulk.PK_CHUNKED_BATCH_STATUS_POLLING_SLEEP', 0)
+@mock.patch('tap_salesforce.salesforce.Bulk._close_job')
+@mock.patch('tap_salesforce.salesforce.Bulk._add_batch')
+@mock.patch('tap_salesforce.salesforce.Bulk._create_job', return_value='job')
+class TestStreamPkChunks(unittest.TestCase):
+
+    catalog_entry = {'stream': 'Task', 'tap_stream_id': 'Task'}
+
+    def test_completed_chunks_are_emitted_while_others_run(self, mocked_create_job, mocked_add_batch, mocked_close_job, mocked_write_state):
+        """
+        To verify that records of a chunk are emitted as soon as it completes and
+        that BatchIDs only holds the chunks that have not been emitted yet
+        """
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK", bulk_stream_pk_chunks=True)
+        bulk = Bulk(sf)
+        state = {}
+        batch_ids_when_emitted = []
+
+        def get_batch_results(job_id, batch_id, catalog_entry, checkpoint=None):
+            batch_ids_when_emitted.append(state['bookmarks']['Task']['BatchIDs'][:])
+            return iter([{'Id': batch_id}])
+
+        with mock.patch.object(bulk, '_get_batches', side_effect=BATCH_POLLS), \
+             mock.patch.object(bulk, 'get_batch_results', side_effect=get_batch_results):
+            failed_batches = {}
+            records = list(bulk._stream_pk_chunked_query(self.catalog_entry, '2019-02-04T12:15:00Z', state, failed_batches))
+
+        self.assertEqual(records, [{'Id': 'b1'}, {'Id': 'b2'}])
+        self.assertEqual(batch_ids_when_emitted, [['b1', 'b2'], ['b2']])
+        self.assertEqual(state['bookmarks']['Task'], {'JobID': 'job', 'BatchIDs': [], 'BatchResultOffset': {}})
+        self.assertEqual(failed_batches, {})
+        self.assertTrue(sf.pk_chunking)
+
+    def test_failed_chunks_are_reported(self, mocked_create_job, mocked_add_batch, mocked_close_job, mocked_write_state):
+        """
+        To verify that failed chunks are collected so the caller can fall back to date windowing
+        """
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK", bulk_stream_pk_chunks=True)
+        bulk = Bulk(sf)
+        batches = [[{'id': 'b1', 'state': 'Completed'}, {'id': 'b2', 'state': 'Failed', 'stateMessage': 'QUERY_TIMEOUT'}]]
+
+        with mock.patch.object(bulk, '_get_batches', side_effect=batches), \
+             mock.patch.object(bulk, 'get_batch_results', return_value=iter([{'Id': 'b1'}])):
+            failed_batches = {}
+            records = list(bulk._stream_pk_chunked_query(self.catalog_entry, '2019-02-04T12:15:00Z', {}, failed_batches))
+
+        self.assertEqual(records, [{'Id': 'b1'}])
+        self.assertEqual(failed_batches, {'b2': 'QUERY_TIMEOUT'})
+
+    def test_downloaded_chunks_are_emitted_without_waiting_for_the_next(self, mocked_create_job, mocked_add_batch,
+                                                                       mocked_close_job, mocked_write_state):
+        """
+        To verify that with concurrent downloads, the records of a chunk are
+        emitted once it is downloaded, before the chunks after it complete
+        """
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK", bulk_stream_pk_chunks=True,
+                        bulk_download_concurrency=2)
+        bulk = Bulk(sf)
+        first_chunk_emitted = threading.Event()
+        polls = iter(BATCH_POLLS)
+
+        def get_batches(job_id):
+            batches = next(polls)
+            if batches is BATCH_POLLS[-1]:
+                # The last chunk only completes once the first one is emitted
+                self.assertTrue(first_chunk_emitted.wait(timeout=5))
+            return batches
+
+        with mock.patch.object(bulk, '_get_batches', side_effect=get_batches), \
+             mock.patch.object(bulk, '_download_batch_results',
+                               side_effect=lambda job_id, batch_id, catalog_entry: (batch_id, [batch_id])), \
+             mock.patch.object(bulk, '_read_batch_results',
+                               side_effect=lambda batch_id, csv_files, checkpoint=None: iter([{'Id': batch_id}])), \
+             mock.patch('tap_salesforce.salesforce.bulk.PK_CHUNK_WATCH_TIMEOUT', 0.01):
+            records = []
+            for record in bulk._stream_pk_chunked_query(self.catalog_entry, '2019-02-04T12:15:00Z', {}, {}):
+                records.append(record)
+                first_chunk_emitted.set()
+
+        self.assertEqual(records, [{'Id': 'b1'}, {'Id': 'b2'}])
+
+    @mock.patch('tap_salesforce.sync.write_state')
+    @mock.patch('tap_salesforce.sync.write_message')
+    def test_resumed_sync_keeps_bookmark_after_failed_chunk(self, mocked_sync_write_message, mocked_sync_write_state,
+                                                           mocked_create_job, mocked_add_batch, mocked_close_job,
+                                                           mocked_write_state):
+        """
+        To verify that a chunk first seen as Failed is kept in BatchIDs, so
+        that a sync interrupted afterwards and resumed does not move the
+        bookmark past the records of that chunk
+        """
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK", bulk_stream_pk_chunks=True)
+        bulk = Bulk(sf)
+        state = {}
+        batches = [{'id': 'b1', 'state': 'Completed'}, {'id': 'b2', 'state': 'Failed', 'stateMessage': 'QUERY_TIMEOUT'}]
+
+        with mock.patch.object(bulk, '_get_batches', return_value=batches), \
+             mock.patch.object(bulk, 'get_batch_results', return_value=iter([{'Id': 'b1'}])):
+            list(bulk._stream_pk_chunked_query(self.catalog_entry, '2019-02-04T12:15:00Z', state, {}))
+
+        self.assertEqual(state['bookmarks']['Task']['BatchIDs'], ['b2'])
+
+        # The sync is interrupted and resumed with the job's state
+        state['bookmarks']['Task']['JobHighestBookmarkSeen'] = '2024-01-01T00:00:00.000000Z'
+        catalog_entry = {'stream': 'Task', 'tap_stream_id': 'Task', 'schema': {'properties': {}},
+                         'metadata': [{'breadcrumb': [], 'metadata': {'replication-key': 'SystemModstamp'}}]}
+        with mock.patch('tap_salesforce.sync.Bulk.job_exists', return_value=True), \
+             mock.patch('tap_salesforce.sync.Bulk._get_batches', return_value=batches):
+            resume_syncing_bulk_query(sf, catalog_entry, 'job', state, metrics.record_counter('Task'))
+
+        self.assertNotIn('JobHighestBookmarkSeen', state['bookmarks']['Task'])
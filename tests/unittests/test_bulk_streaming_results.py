@@ -0,0 +1,89 @@
+import unittest
+from unittest import mock
+from requests.exceptions import ChunkedEncodingError
+from tap_salesforce import Salesforce
+from tap_salesforce.salesforce import Bulk
+from tap_salesforce.salesforce.bulk import iter_csv_lines
+
+CSV_BODY = ('"Id","Description"\n'
+            '"1","first line\nsecond line"\n'
+            '"2","line separator"\n'
+            '"3","null\0byte"\n').encode('utf-8')
+
+
+def chunked(body, size):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+class FakeResponse:
+
+    def __init__(self, body, chunk_size=7, status_code=200):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.encoding = 'utf-8'
+        self.status_code = status_code
+
+    def iter_content(self, chunk_size=None):
+        return iter(chunked(self.body, self.chunk_size))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class InterruptedResponse(FakeResponse):
+
+    def iter_content(self, chunk_size=None):
+        yield self.body[:10]
+        raise ChunkedEncodingError("Connection broken")
+
+
+EXPECTED_RECORDS = [
+    {'Id': '1', 'Description': 'first line\nsecond line'},
+    {'Id': '2', 'Description': 'line separator'},
+    {'Id': '3', 'Description': 'nullbyte'},
+]
+
+
+@mock.patch('tap_salesforce.salesforce.Bulk._get_batch_result_ids', return_value=['r1'])
+class TestBulkStreamingResults(unittest.TestCase):
+
+    catalog_entry = {'stream': 'Account', 'tap_stream_id': 'Account'}
+
+    def test_iter_lines_keeps_quoted_line_breaks(self, mocked_result_ids):
+        """
+        To verify that lines split across chunks are joined and that only newlines end a line
+        """
+        lines = list(iter_csv_lines(chunked(CSV_BODY, 3), 'utf-8'))
+
+        self.assertEqual(''.join(lines), CSV_BODY.decode('utf-8').replace('\0', ''))
+        self.assertEqual(len(lines), 5)
+
+    @mock.patch('tap_salesforce.salesforce.Bulk._get_batch_result', return_value=FakeResponse(CSV_BODY))
+    def test_results_are_parsed_from_the_response(self, mocked_get_batch_result, mocked_result_ids):
+        """
+        To verify that records are parsed straight off the response without spooling to disk
+        """
+        bulk = Bulk(Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK"))
+
+        with mock.patch('tap_salesforce.salesforce.bulk.tempfile.NamedTemporaryFile') as mocked_temp_file:
+            records = list(bulk.get_batch_results('job', 'batch', self.catalog_entry))
+
+        self.assertEqual(records, EXPECTED_RECORDS)
+        mocked_temp_file.assert_not_called()
+
+    @mock.patch('tap_salesforce.salesforce.Bulk._get_batch_result',
+                side_effect=[InterruptedResponse(CSV_BODY), FakeResponse(CSV_BODY)])
+    def test_spooled_download_is_retried(self, mocked_get_batch_result, mocked_result_ids):
+        """
+        To verify that with spooling enabled an interrupted download is restarted
+        before any record is emitted
+        """
+        bulk = Bulk(Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK", bulk_spool_results=True))
+
+        records = list(bulk.get_batch_results('job', 'batch', self.catalog_entry))
+
+        self.assertEqual(records, EXPECTED_RECORDS)
+        self.assertEqual(mocked_get_batch_result.call_count, 2)
@@ -0,0 +1,131 @@
+import datetime
+import unittest
+from unittest import mock
+from tap_salesforce import Salesforce, build_state, do_sync
+from tap_salesforce.salesforce import Bulk
+from tap_salesforce.sync import sync_stream
+
+
+def make_catalog_entry(stream):
+    return {
+        "stream": stream,
+        "tap_stream_id": stream,
+        "schema": {"properties": {"Id": {}, "SystemModstamp": {}}},
+        "metadata": [{"breadcrumb": [], "metadata": {"selected": True, "replication-key": "SystemModstamp"}},
+                     {"breadcrumb": ["properties", "Id"], "metadata": {"inclusion": "automatic"}},
+                     {"breadcrumb": ["properties", "SystemModstamp"], "metadata": {"inclusion": "automatic"}}]
+    }
+
+
+@mock.patch('tap_salesforce.salesforce.Bulk.check_bulk_quota_usage')
+@mock.patch('tap_salesforce.write_state')
+@mock.patch('tap_salesforce.salesforce.bulk.write_state')
+@mock.patch('tap_salesforce.salesforce.Bulk._close_job')
+@mock.patch('tap_salesforce.salesforce.Bulk._add_batch', return_value='batch')
+@mock.patch('tap_salesforce.salesforce.Bulk._create_job', side_effect=['job1', 'job2', 'job3'])
+class TestBulkSubmitAhead(unittest.TestCase):
+
+    catalog = {"streams": [make_catalog_entry(name) for name in ["Account", "Contact", "Lead"]]}
+
+    def test_jobs_of_next_streams_are_submitted(self, mocked_create_job, mocked_add_batch, mocked_close_job,
+                                                mocked_bulk_write_state, mocked_write_state, mocked_quota):
+        """
+        To verify that while a stream is synced the jobs of the next
+        `bulk_submit_ahead` streams have been submitted
+        """
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK", bulk_submit_ahead=1)
+        state = {}
+        submitted_when_synced = []
+
+        def sync_catalog_entry(sf, catalog_entry, state):
+            submitted_when_synced.append(sorted(state.get('submitted_jobs', {})))
+            state['submitted_jobs'].pop(catalog_entry['tap_stream_id'], None)
+
+        with mock.patch('tap_salesforce.sync_catalog_entry', side_effect=sync_catalog_entry):
+            do_sync(sf, self.catalog, state)
+
+        self.assertEqual(submitted_when_synced, [['Contact'], ['Contact', 'Lead'], ['Lead']])
+        self.assertEqual(mocked_create_job.call_count, 2)
+        self.assertEqual(mocked_quota.call_count, 2)
+
+    def test_submitted_job_is_used(self, mocked_create_job, mocked_add_batch, mocked_close_job,
+                                   mocked_bulk_write_state, mocked_write_state, mocked_quota):
+        """
+        To verify that a stream picks up the job submitted for it when its query is unchanged
+        """
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK")
+        bulk = Bulk(sf)
+        catalog_entry = make_catalog_entry("Account")
+        state = {}
+        bulk.submit_job_ahead(catalog_entry, state)
+
+        with mock.patch.object(bulk, 'job_exists', return_value=True):
+            self.assertEqual(bulk._pop_submitted_job(catalog_entry, state, sf.default_start_date), ('job1', 'batch'))
+        self.assertEqual(state['submitted_jobs'], {})
+
+    def test_outdated_job_is_discarded(self, mocked_create_job, mocked_add_batch, mocked_close_job,
+                                       mocked_bulk_write_state, mocked_write_state, mocked_quota):
+        """
+        To verify that a submitted job is not used once the stream's bookmark moved
+        or when the job no longer exists
+        """
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK")
+        bulk = Bulk(sf)
+        catalog_entry = make_catalog_entry("Account")
+
+        state = {}
+        bulk.submit_job_ahead(catalog_entry, state)
+        self.assertEqual(bulk._pop_submitted_job(catalog_entry, state, '2020-01-01T00:00:00Z'), (None, None))
+
+        state = {}
+        bulk.submit_job_ahead(catalog_entry, state)
+        with mock.patch.object(bulk, 'job_exists', return_value=False):
+            self.assertEqual(bulk._pop_submitted_job(catalog_entry, state, sf.default_start_date), (None, None))
+
+    def test_empty_submitted_job_keeps_bookmark_at_submit_time(self, mocked_create_job, mocked_add_batch,
+                                                               mocked_close_job, mocked_bulk_write_state,
+                                                               mocked_write_state, mocked_quota):
+        """
+        To verify that a stream whose job submitted ahead returns no records
+        is bookmarked at the time the job was submitted, not at the later
+        time the stream is synced, so records modified in between are synced
+        by the next run
+        """
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK")
+        catalog_entry = make_catalog_entry("Account")
+        state = {}
+        submitted_at = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        synced_at = submitted_at + datetime.timedelta(hours=3)
+
+        with mock.patch('tap_salesforce.salesforce.bulk.singer_utils.now', return_value=submitted_at):
+            Bulk(sf).submit_job_ahead(catalog_entry, state)
+
+        with mock.patch('tap_salesforce.sync.singer_utils.now', return_value=synced_at), \
+             mock.patch('tap_salesforce.sync.write_state'), \
+             mock.patch('tap_salesforce.sync.write_message'), \
+             mock.patch('tap_salesforce.salesforce.Bulk.job_exists', return_value=True), \
+             mock.patch('tap_salesforce.salesforce.Bulk._poll_on_batch_status', return_value={'state': 'Completed'}), \
+             mock.patch('tap_salesforce.salesforce.Bulk.get_batch_results', return_value=iter([])):
+            sync_stream(sf, catalog_entry, state)
+
+        mocked_create_job.assert_called_once()
+        self.assertEqual(state['bookmarks']['Account']['SystemModstamp'], '2024-01-01T00:00:00.000000Z')
+
+    def test_jobs_of_an_earlier_run_are_not_reused(self, mocked_create_job, mocked_add_batch, mocked_close_job,
+                                                   mocked_bulk_write_state, mocked_write_state, mocked_quota):
+        """
+        To verify that a job submitted ahead by an interrupted run is dropped
+        from the state, as its query may have run days before, which would
+        drop the rows of a full table stream changed since
+        """
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK")
+        bulk = Bulk(sf)
+        catalog_entry = make_catalog_entry("Account")
+        raw_state = {}
+        bulk.submit_job_ahead(catalog_entry, raw_state)
+
+        state = build_state(raw_state, {'streams': [catalog_entry]})
+
+        self.assertNotIn('submitted_jobs', state)
+        with mock.patch.object(bulk, 'job_exists', return_value=True):
+            self.assertEqual(bulk._pop_submitted_job(catalog_entry, state, sf.default_start_date), (None, None))
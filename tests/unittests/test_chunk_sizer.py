@@ -0,0 +1,68 @@
+import unittest
+from unittest import mock
+from tap_salesforce import Salesforce
+from tap_salesforce.salesforce import Bulk
+from tap_salesforce.salesforce.chunking import ChunkSizer
+
+
+def make_catalog_entry(field_count, stream_metadata=None):
+    properties = {'Field{}'.format(i): {} for i in range(field_count)}
+    return {
+        'stream': 'Account',
+        'tap_stream_id': 'Account',
+        'schema': {'properties': properties},
+        'metadata': [{'breadcrumb': [], 'metadata': stream_metadata or {}}] +
+                    [{'breadcrumb': ['properties', name], 'metadata': {'inclusion': 'automatic'}}
+                     for name in properties]
+    }
+
+
+def make_batch(state, seconds):
+    return {'id': 'b', 'state': state, 'totalProcessingTime': str(seconds * 1000)}
+
+
+class TestChunkSizer(unittest.TestCase):
+
+    sf = Salesforce(default_start_date='2024-01-01T00:00:00Z', api_type="BULK")
+
+    def test_size_shrinks_with_the_number_of_fields(self):
+        self.assertEqual(ChunkSizer(self.sf, make_catalog_entry(20)).size, 250000)
+        self.assertEqual(ChunkSizer(self.sf, make_catalog_entry(50)).size, 100000)
+        self.assertEqual(ChunkSizer(self.sf, make_catalog_entry(700)).size, 10000)
+
+    def test_size_follows_the_batches_of_previous_jobs(self):
+        """
+        To verify that failed or slow batches halve the chunk size, that fast
+        ones double it and that the size is remembered for the next sync
+        """
+        state = {}
+        sizer = ChunkSizer(self.sf, make_catalog_entry(50), state)
+
+        sizer.job_done([make_batch('Completed', 30), make_batch('Failed', 120)])
+        self.assertEqual(sizer.size, 50000)
+        sizer.job_done([make_batch('Completed', 900)])
+        self.assertEqual(sizer.size, 25000)
+        sizer.job_done([make_batch('Completed', 10)])
+        self.assertEqual(sizer.size, 50000)
+        sizer.job_done([make_batch('Completed', 300)])
+        self.assertEqual(sizer.size, 50000)
+
+        self.assertEqual(state['bookmarks']['Account']['PKChunkSize'], 50000)
+        self.assertEqual(ChunkSizer(self.sf, make_catalog_entry(50), state).size, 50000)
+
+    def test_catalog_metadata_overrides_the_size(self):
+        state = {'bookmarks': {'Account': {'PKChunkSize': 20000}}}
+        sizer = ChunkSizer(self.sf, make_catalog_entry(50, {'pk-chunk-size': 150000}), state)
+
+        sizer.job_done([make_batch('Failed', 900)])
+        self.assertEqual(sizer.size, 150000)
+
+    @mock.patch('tap_salesforce.salesforce.Bulk._get_bulk_headers', return_value={})
+    def test_job_is_created_with_the_chunk_size(self, mocked_headers):
+        bulk = Bulk(self.sf)
+        with mock.patch.object(self.sf, '_make_request') as mocked_request:
+            mocked_request.return_value.json.return_value = {'id': 'job'}
+            bulk._create_job(make_catalog_entry(20), True, 250000)
+
+        headers = mocked_request.call_args[1]['headers']
+        self.assertEqual(headers['Sforce-Enable-PKChunking'], "true; chunkSize=250000")
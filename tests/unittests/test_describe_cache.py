@@ -0,0 +1,61 @@
+import tempfile
+import unittest
+from unittest import mock
+from tap_salesforce import Salesforce
+
+
+def describe_batch(sobject_names):
+    return {name: {"name": name, "fields": []} for name in sobject_names}
+
+
+class TestDescribeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+
+    def make_sf(self):
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK", describe_cache_dir=self.cache_dir.name)
+        sf.instance_url = "https://example.my.salesforce.com"
+        return sf
+
+    def test_first_run_describes_and_caches_everything(self):
+        """
+        To verify that objects missing from the cache are described with composite batches and cached
+        """
+        sf = self.make_sf()
+
+        with mock.patch.object(sf, 'batch_describe', side_effect=describe_batch) as mocked_batch_describe, \
+             mock.patch.object(sf, '_revalidate_describes') as mocked_revalidate:
+            results = sf.describe_sobjects(["Account", "Contact"])
+
+        self.assertEqual(list(results.keys()), ["Account", "Contact"])
+        mocked_batch_describe.assert_called_once_with(["Account", "Contact"])
+        mocked_revalidate.assert_not_called()
+
+    def test_only_changed_objects_are_fetched_again(self):
+        """
+        To verify that cached describes are revalidated and only replaced when they changed
+        """
+        with mock.patch.object(Salesforce, 'batch_describe', side_effect=describe_batch):
+            self.make_sf().describe_sobjects(["Account", "Contact", "Lead"])
+
+        sf = self.make_sf()
+        revalidated = [
+            ("Account", 304, None, {}),
+            ("Contact", 200, {"name": "Contact", "fields": [{"name": "New__c"}]}, {"ETag": "abc", "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}),
+            ("Lead", 500, None, {}),
+        ]
+        with mock.patch.object(sf, 'batch_describe', side_effect=describe_batch) as mocked_batch_describe, \
+             mock.patch.object(sf, '_revalidate_describes', return_value=revalidated) as mocked_revalidate:
+            results = sf.describe_sobjects(["Account", "Contact", "Lead", "Opportunity"])
+
+        self.assertEqual(mocked_revalidate.call_args[0][0], ["Account", "Contact", "Lead"])
+        # The object whose revalidation failed is described again, along with the new one
+        mocked_batch_describe.assert_called_once_with(["Lead", "Opportunity"])
+        self.assertEqual(results["Contact"]["fields"], [{"name": "New__c"}])
+        self.assertEqual(list(results.keys()), ["Account", "Contact", "Lead", "Opportunity"])
+
+        # The validators of the changed object are used on the next run
+        cache = mocked_revalidate.call_args[0][1]
+        self.assertEqual(cache.get_validators("Contact"), {"If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT", "If-None-Match": "abc"})
@@ -0,0 +1,102 @@
+import io
+import json
+import unittest
+from unittest import mock
+from tap_salesforce import Salesforce, do_discover
+
+
+def describe_field(name, sf_type='string'):
+    return {'name': name, 'type': sf_type, 'nillable': True}
+
+
+DESCRIPTIONS = {
+    'Account': {'fields': [describe_field('Id', 'id'), describe_field('Name'),
+                           describe_field('SystemModstamp', 'datetime')]},
+    'Lead': {'fields': [describe_field('Id', 'id'), describe_field('Email'),
+                        describe_field('SystemModstamp', 'datetime')]},
+}
+
+EXISTING_CATALOG = {
+    'streams': [
+        {'stream': 'Account', 'tap_stream_id': 'Account', 'schema': {},
+         'metadata': [
+             {'breadcrumb': [], 'metadata': {'selected': True, 'replication-method': 'INCREMENTAL',
+                                             'replication-key': 'SystemModstamp'}},
+             {'breadcrumb': ['properties', 'Name'], 'metadata': {'selected': True}},
+             {'breadcrumb': ['properties', 'Removed'], 'metadata': {'selected': True}}]},
+        {'stream': 'Contact', 'tap_stream_id': 'Contact', 'schema': {},
+         'metadata': [{'breadcrumb': [], 'metadata': {'selected': True}}]},
+    ]
+}
+
+
+class TestDiscoverMerge(unittest.TestCase):
+
+    def discover(self, existing_catalog):
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="REST")
+        global_description = {'sobjects': [{'name': name} for name in DESCRIPTIONS]}
+        stdout = io.StringIO()
+        with mock.patch.object(sf, 'describe', return_value=global_description), \
+             mock.patch.object(sf, 'describe_sobjects', return_value=DESCRIPTIONS), \
+             mock.patch('sys.stdout', stdout):
+            do_discover(sf, existing_catalog)
+        return {entry['tap_stream_id']: {tuple(m['breadcrumb']): m['metadata'] for m in entry['metadata']}
+                for entry in json.loads(stdout.getvalue())['streams']}
+
+    def test_selections_are_kept(self):
+        """
+        To verify that the selections of the existing catalog are carried over,
+        that new objects are added unselected and removed ones are dropped
+        """
+        catalog = self.discover(EXISTING_CATALOG)
+
+        self.assertEqual(set(catalog), {'Account', 'Lead'})
+        self.assertTrue(catalog['Account'][()]['selected'])
+        self.assertEqual(catalog['Account'][()]['replication-method'], 'INCREMENTAL')
+        self.assertEqual(catalog['Account'][()]['replication-key'], 'SystemModstamp')
+        self.assertTrue(catalog['Account'][('properties', 'Name')]['selected'])
+        self.assertNotIn(('properties', 'Removed'), catalog['Account'])
+        self.assertNotIn('selected', catalog['Lead'][()])
+
+    def test_invalid_replication_key_is_dropped(self):
+        """
+        To verify that a replication key that is no longer valid is not carried over
+        """
+        existing_catalog = {'streams': [
+            {'stream': 'Lead', 'tap_stream_id': 'Lead', 'schema': {},
+             'metadata': [{'breadcrumb': [], 'metadata': {'selected': True, 'replication-key': 'LastModifiedDate'}}]}]}
+
+        catalog = self.discover(existing_catalog)
+
+        self.assertTrue(catalog['Lead'][()]['selected'])
+        self.assertNotIn('replication-key', catalog['Lead'][()])
+
+    def test_without_existing_catalog(self):
+        catalog = self.discover(None)
+
+        self.assertNotIn('selected', catalog['Account'][()])
+
+    def test_stream_alias_is_kept(self):
+        existing_catalog = {'streams': [
+            {'stream': 'Lead', 'tap_stream_id': 'Lead', 'stream_alias': 'leads', 'schema': {},
+             'metadata': [{'breadcrumb': [], 'metadata': {'selected': True}}]}]}
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="REST")
+        global_description = {'sobjects': [{'name': name} for name in DESCRIPTIONS]}
+        stdout = io.StringIO()
+
+        with mock.patch.object(sf, 'describe', return_value=global_description), \
+             mock.patch.object(sf, 'describe_sobjects', return_value=DESCRIPTIONS), \
+             mock.patch('sys.stdout', stdout):
+            do_discover(sf, existing_catalog)
+
+        lead = next(e for e in json.loads(stdout.getvalue())['streams'] if e['tap_stream_id'] == 'Lead')
+        self.assertEqual(lead['stream_alias'], 'leads')
+
+    def test_pk_chunk_size_is_kept(self):
+        existing_catalog = {'streams': [
+            {'stream': 'Lead', 'tap_stream_id': 'Lead', 'schema': {},
+             'metadata': [{'breadcrumb': [], 'metadata': {'selected': True, 'pk-chunk-size': 50000}}]}]}
+
+        catalog = self.discover(existing_catalog)
+
+        self.assertEqual(catalog['Lead'][()]['pk-chunk-size'], 50000)
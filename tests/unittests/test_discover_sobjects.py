@@ -0,0 +1,34 @@
+import io
+import unittest
+from unittest import mock
+from tap_salesforce import Salesforce, do_discover
+
+GLOBAL_DESCRIPTION = {'sobjects': [{'name': name} for name in
+                                   ['Account', 'Contact', 'Lead', 'Invoice__c', 'Payment__c', 'AccountChangeEvent']]}
+
+
+class TestDiscoverSobjects(unittest.TestCase):
+
+    def discovered_objects(self, discover_sobjects):
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="REST", discover_sobjects=discover_sobjects)
+        with mock.patch.object(sf, 'describe', return_value=GLOBAL_DESCRIPTION), \
+             mock.patch.object(sf, 'describe_sobjects', return_value={}) as mocked_describe_sobjects, \
+             mock.patch('sys.stdout', io.StringIO()):
+            do_discover(sf)
+        return mocked_describe_sobjects.call_args[0][0]
+
+    def test_names_and_patterns(self):
+        """
+        To verify that only the objects matching discover_sobjects are described
+        """
+        self.assertEqual(self.discovered_objects(['account', '*__c']), ['Account', 'Invoice__c', 'Payment__c'])
+
+    def test_comma_separated_string(self):
+        self.assertEqual(self.discovered_objects('Contact, Lead'), ['Contact', 'Lead'])
+
+    def test_every_object_by_default(self):
+        """
+        To verify that without discover_sobjects every object is described, except ChangeEvents
+        """
+        self.assertEqual(self.discovered_objects(None), ['Account', 'Contact', 'Lead', 'Invoice__c', 'Payment__c'])
+        self.assertEqual(self.discovered_objects(''), ['Account', 'Contact', 'Lead', 'Invoice__c', 'Payment__c'])
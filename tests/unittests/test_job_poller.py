@@ -0,0 +1,110 @@
+import threading
+import time
+import unittest
+from unittest import mock
+from tap_salesforce import Salesforce
+from tap_salesforce.salesforce import Bulk
+from tap_salesforce.salesforce.poller import JobPoller, PollInterval
+
+
+class TestPollInterval(unittest.TestCase):
+
+    def test_interval_grows_up_to_maximum(self):
+        interval = PollInterval(1, 20)
+
+        self.assertEqual([interval.next() for _ in range(7)], [1, 2, 4, 8, 16, 20, 20])
+
+    def test_interval_is_kept_while_job_makes_progress(self):
+        interval = PollInterval(1, 20)
+
+        self.assertEqual([interval.next(processed) for processed in [0, 0, 100, 200, 200]], [1, 2, 2, 2, 4])
+
+
+class TestJobPoller(unittest.TestCase):
+
+    def test_waiters_on_a_job_share_its_polls(self):
+        """
+        To verify that callers waiting on the same job concurrently get its
+        status from the same polls
+        """
+        poller = JobPoller()
+        statuses = iter(['InProgress', 'InProgress', 'Completed'])
+        results = []
+
+        def next_status():
+            # Hold the first poll until both callers wait on the job
+            while len(poller._waiters) < 2:
+                time.sleep(0.01)
+            return next(statuses)
+
+        poll = mock.Mock(side_effect=next_status)
+
+        def wait():
+            results.append(poller.wait('job', poll, lambda s: s if s == 'Completed' else None, PollInterval(0, 0)))
+
+        threads = [threading.Thread(target=wait) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(results, ['Completed', 'Completed'])
+        self.assertLessEqual(poll.call_count, 3)
+
+    def test_poll_errors_are_raised_to_the_caller(self):
+        poller = JobPoller()
+
+        with self.assertRaises(ValueError):
+            poller.wait('job', mock.Mock(side_effect=ValueError), lambda s: s, PollInterval(0, 0))
+
+        # The poller keeps serving later callers
+        self.assertEqual(poller.wait('job', lambda: 'done', lambda s: s, PollInterval(0, 0)), 'done')
+
+
+@mock.patch('tap_salesforce.salesforce.bulk.BATCH_STATUS_POLLING_INITIAL_SLEEP', 0.01)
+class TestPollOnBatchStatus(unittest.TestCase):
+
+    def test_batch_is_polled_until_done(self):
+        bulk = Bulk(Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK"))
+        batches = [{'id': 'b1', 'state': 'Queued'},
+                   {'id': 'b1', 'state': 'InProgress', 'numberRecordsProcessed': '10'},
+                   {'id': 'b1', 'state': 'Completed', 'numberRecordsProcessed': '20'}]
+
+        with mock.patch.object(bulk, '_get_batch', side_effect=batches) as mocked_get_batch:
+            batch_status = bulk._poll_on_batch_status('job', 'b1')
+
+        self.assertEqual(batch_status['state'], 'Completed')
+        self.assertEqual(mocked_get_batch.call_count, 3)
+
+
+@mock.patch('tap_salesforce.salesforce.bulk.PK_CHUNKED_BATCH_STATUS_POLLING_INITIAL_SLEEP', 0.01)
+class TestWatchPkChunkedBatches(unittest.TestCase):
+
+    def test_batches_are_watched_by_the_shared_poller(self):
+        """
+        To verify that the chunks of a streamed PK chunked job are polled by
+        the poller shared with the other jobs, and that their changes are
+        yielded as they are seen
+        """
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK")
+        bulk = Bulk(sf)
+        polls = [[{'id': 'b0', 'state': 'Not Processed'}, {'id': 'b1', 'state': 'InProgress'}],
+                 [{'id': 'b0', 'state': 'Not Processed'}, {'id': 'b1', 'state': 'Completed'}]]
+
+        with mock.patch.object(bulk, '_get_batches', side_effect=polls), \
+             mock.patch.object(sf.job_poller, 'submit', wraps=sf.job_poller.submit) as mocked_submit:
+            events = list(bulk.watch_pk_chunked_batches('job'))
+
+        self.assertEqual(events, [[{'id': 'b1', 'state': 'InProgress'}], [{'id': 'b1', 'state': 'Completed'}]])
+        mocked_submit.assert_called_once()
+
+    def test_abandoned_watch_stops_polling(self):
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK")
+        bulk = Bulk(sf)
+
+        with mock.patch.object(bulk, '_get_batches', return_value=[{'id': 'b1', 'state': 'InProgress'}]):
+            watch = bulk.watch_pk_chunked_batches('job')
+            next(watch)
+            watch.close()
+
+        self.assertEqual(sf.job_poller._waiters, [])
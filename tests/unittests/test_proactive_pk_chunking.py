@@ -0,0 +1,79 @@
+import unittest
+from unittest import mock
+from tap_salesforce import Salesforce
+from tap_salesforce.salesforce import Bulk
+from tap_salesforce.salesforce.planning import QueryPlan
+
+CATALOG_ENTRY = {
+    'stream': 'Account',
+    'tap_stream_id': 'Account',
+    'schema': {'properties': {'Id': {}, 'SystemModstamp': {}}},
+    'metadata': [{'breadcrumb': [], 'metadata': {'replication-key': 'SystemModstamp'}},
+                 {'breadcrumb': ['properties', 'Id'], 'metadata': {'inclusion': 'automatic'}},
+                 {'breadcrumb': ['properties', 'SystemModstamp'], 'metadata': {'inclusion': 'automatic'}}]
+}
+
+
+@mock.patch('tap_salesforce.salesforce.Bulk.check_bulk_quota_usage')
+class TestProactivePkChunking(unittest.TestCase):
+
+    sf = Salesforce(default_start_date='2024-01-01T00:00:00Z', api_type="BULK")
+
+    def test_stream_pk_chunked_before_stays_pk_chunked(self, mocked_quota):
+        """
+        To verify that a stream that once needed PK chunking starts PK
+        chunked, and that an incremental sync returning few records does not
+        make the next one start with a plain job again
+        """
+        state = {'bookmarks': {'Account': {'PKChunkedRecords': 5000}}}
+        bulk = Bulk(self.sf)
+
+        with mock.patch.object(bulk, '_submit_job') as mocked_submit_job, \
+             mock.patch.object(bulk, '_run_pk_chunked_query', return_value=iter([{'Id': '1'}, {'Id': '2'}])):
+            records = list(bulk.query(CATALOG_ENTRY, state))
+
+        self.assertEqual(records, [{'Id': '1'}, {'Id': '2'}])
+        mocked_submit_job.assert_not_called()
+        self.assertEqual(state['bookmarks']['Account']['PKChunkedRecords'], 5000)
+        self.assertTrue(bulk.needs_pk_chunking(CATALOG_ENTRY, state))
+
+    def test_configured_threshold_forgets_small_streams(self, mocked_quota):
+        """
+        To verify that with `pk_chunking_min_records` configured, a stream
+        whose PK chunked queries returned fewer records runs a plain job
+        """
+        sf = Salesforce(default_start_date='2024-01-01T00:00:00Z', api_type="BULK", pk_chunking_min_records=1000)
+        state = {'bookmarks': {'Account': {'PKChunkedRecords': 10}}}
+        bulk = Bulk(sf)
+
+        with mock.patch.object(bulk, '_submit_job', return_value=('job', 'batch')), \
+             mock.patch.object(bulk, '_poll_on_batch_status', return_value={'state': 'Completed'}), \
+             mock.patch.object(bulk, 'get_batch_results', return_value=iter([{'Id': '1'}])), \
+             mock.patch.object(bulk, '_run_pk_chunked_query') as mocked_pk_chunked_query:
+            records = list(bulk.query(CATALOG_ENTRY, state))
+
+        self.assertEqual(records, [{'Id': '1'}])
+        mocked_pk_chunked_query.assert_not_called()
+        self.assertNotIn('PKChunkedRecords', state['bookmarks']['Account'])
+
+    def test_failed_plain_job_remembers_pk_chunking(self, mocked_quota):
+        state = {}
+        bulk = Bulk(self.sf)
+
+        with mock.patch.object(bulk, '_submit_job', return_value=('job', 'batch')), \
+             mock.patch.object(bulk, '_poll_on_batch_status',
+                               return_value={'state': 'Failed', 'stateMessage': 'QUERY_TIMEOUT'}), \
+             mock.patch.object(bulk, '_run_pk_chunked_query', return_value=iter([{'Id': '1'}])):
+            list(bulk.query(CATALOG_ENTRY, state))
+
+        self.assertEqual(state['bookmarks']['Account']['PKChunkedRecords'], 1)
+        self.assertTrue(bulk.needs_pk_chunking(CATALOG_ENTRY, state))
+
+    def test_planned_pk_chunking_is_not_remembered(self, mocked_quota):
+        state = {}
+        bulk = Bulk(self.sf)
+
+        with mock.patch.object(bulk, '_run_pk_chunked_query', return_value=iter([{'Id': '1'}])):
+            list(bulk.query(CATALOG_ENTRY, state, QueryPlan("BULK", pk_chunking=True)))
+
+        self.assertNotIn('PKChunkedRecords', state.get('bookmarks', {}).get('Account', {}))
@@ -0,0 +1,111 @@
+import datetime
+import unittest
+from unittest import mock
+from requests.exceptions import ConnectionError as RequestsConnectionError, HTTPError
+from tap_salesforce import Salesforce
+from tap_salesforce.salesforce import Bulk
+from tap_salesforce.salesforce.planning import TOO_MANY_TO_COUNT, plan_query
+
+CATALOG_ENTRY = {
+    'stream': 'Account',
+    'tap_stream_id': 'Account',
+    'schema': {'properties': {'Id': {}, 'SystemModstamp': {}}},
+    'metadata': [{'breadcrumb': [], 'metadata': {'replication-key': 'SystemModstamp'}},
+                 {'breadcrumb': ['properties', 'Id'], 'metadata': {'inclusion': 'automatic'}},
+                 {'breadcrumb': ['properties', 'SystemModstamp'], 'metadata': {'inclusion': 'automatic'}}]
+}
+
+
+@mock.patch('tap_salesforce.salesforce.planning.singer_utils.now',
+            return_value=datetime.datetime(2024, 1, 11, tzinfo=datetime.timezone.utc))
+class TestPlanQuery(unittest.TestCase):
+
+    def test_small_bulk_query_uses_rest(self, mocked_now):
+        plan = plan_query("BULK", 50, '2024-01-01T00:00:00Z', 'SystemModstamp')
+
+        self.assertEqual(plan.api_type, "REST")
+        self.assertFalse(plan.pk_chunking)
+
+    def test_rest_query_stays_rest(self, mocked_now):
+        self.assertEqual(plan_query("REST", 50000000, '2024-01-01T00:00:00Z', 'SystemModstamp').api_type, "REST")
+
+    def test_large_bulk_query_is_pk_chunked_in_windows(self, mocked_now):
+        """
+        To verify that a query of 50M records over 10 days is PK chunked and
+        starts with windows of 5 days (25M records each)
+        """
+        plan = plan_query("BULK", 50000000, '2024-01-01T00:00:00Z', 'SystemModstamp')
+
+        self.assertEqual(plan.api_type, "BULK")
+        self.assertTrue(plan.pk_chunking)
+        self.assertEqual(plan.window_size, datetime.timedelta(days=5))
+
+    def test_uncountable_bulk_query_is_pk_chunked(self, mocked_now):
+        plan = plan_query("BULK", TOO_MANY_TO_COUNT, '2024-01-01T00:00:00Z', 'SystemModstamp')
+
+        self.assertTrue(plan.pk_chunking)
+        self.assertIsNone(plan.window_size)
+
+
+class TestCountProbe(unittest.TestCase):
+
+    def setUp(self):
+        self.sf = Salesforce(default_start_date='2024-01-01T00:00:00Z', api_type="BULK", count_probe=True)
+        self.sf.instance_url = 'https://example.my.salesforce.com'
+
+    def test_count_query(self):
+        resp = mock.Mock()
+        resp.json.return_value = {'totalSize': 42, 'done': True, 'records': []}
+
+        with mock.patch.object(self.sf, '_make_request', return_value=resp) as mocked_make_request:
+            self.assertEqual(self.sf.probe_record_count(CATALOG_ENTRY, '2024-01-01T00:00:00Z'), 42)
+
+        self.assertEqual(mocked_make_request.call_args[1]['params']['q'],
+                         "SELECT COUNT() FROM Account WHERE SystemModstamp >= 2024-01-01T00:00:00Z")
+
+    def test_count_query_timeout(self):
+        resp = mock.Mock()
+        resp.json.return_value = [{'errorCode': 'QUERY_TIMEOUT'}]
+
+        with mock.patch.object(self.sf, '_make_request', side_effect=HTTPError(response=resp)):
+            self.assertEqual(self.sf.probe_record_count(CATALOG_ENTRY, '2024-01-01T00:00:00Z'), TOO_MANY_TO_COUNT)
+
+    @mock.patch('tap_salesforce.salesforce.Rest.query', return_value=iter([]))
+    @mock.patch('tap_salesforce.salesforce.Bulk.query', return_value=iter([]))
+    def test_failed_count_query_falls_back_to_the_default_plan(self, mocked_bulk_query, mocked_rest_query):
+        resp = mock.Mock()
+        resp.json.return_value = [{'errorCode': 'MALFORMED_QUERY'}]
+
+        for error in (HTTPError(response=resp), RequestsConnectionError()):
+            with mock.patch.object(self.sf, '_make_request', side_effect=error):
+                self.assertIsNone(self.sf.probe_record_count(CATALOG_ENTRY, '2024-01-01T00:00:00Z'))
+                self.sf.query(CATALOG_ENTRY, {})
+
+            self.assertIsNone(mocked_bulk_query.call_args[0][2])
+        mocked_rest_query.assert_not_called()
+
+    @mock.patch('tap_salesforce.salesforce.Rest.query', return_value=iter([]))
+    @mock.patch('tap_salesforce.salesforce.Bulk.query', return_value=iter([]))
+    def test_small_stream_is_queried_with_rest(self, mocked_bulk_query, mocked_rest_query):
+        state = {'submitted_jobs': {'Account': {'JobID': 'job'}}}
+
+        with mock.patch.object(self.sf, 'probe_record_count', return_value=10):
+            self.sf.query(CATALOG_ENTRY, state)
+
+        mocked_rest_query.assert_called_once()
+        mocked_bulk_query.assert_not_called()
+        self.assertEqual(state['submitted_jobs'], {})
+
+    @mock.patch('tap_salesforce.salesforce.Bulk.check_bulk_quota_usage')
+    @mock.patch('tap_salesforce.salesforce.Bulk._create_job')
+    def test_large_stream_starts_pk_chunked(self, mocked_create_job, mocked_quota):
+        """
+        To verify that a stream planned for PK chunking does not submit a plain job first
+        """
+        with mock.patch.object(self.sf, 'probe_record_count', return_value=TOO_MANY_TO_COUNT), \
+             mock.patch.object(Bulk, '_pk_chunked_query', return_value=iter([{'Id': '1'}])) as mocked_pk_chunked_query:
+            records = list(self.sf.query(CATALOG_ENTRY, {}))
+
+        self.assertEqual(records, [{'Id': '1'}])
+        mocked_pk_chunked_query.assert_called_once()
+        mocked_create_job.assert_not_called()
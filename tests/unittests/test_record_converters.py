@@ -0,0 +1,93 @@
+import itertools
+import unittest
+from singer import Transformer
+from singer.transform import SchemaMismatch
+from tap_salesforce.converters import RecordConverter
+from tap_salesforce.salesforce import field_to_property_schema
+from tap_salesforce.sync import BLACKLISTED_FIELDS, transform_bulk_data_hook
+
+FIELD_TYPES = ['id', 'string', 'datetime', 'date', 'boolean', 'double', 'int', 'time', 'anyType', 'address', 'location']
+
+VALUES = [None, '', 'abc', '0', '0.0', '1.5', '1,000', '12', 'true', 'false', 'False', 'nan',
+          '2024-01-01T10:00:00.000Z', '2024-01-01T10:00:00.5+0000', '2024-01-01T10:00:00-0700',
+          '2024-01-01T10:00:00', '2024-01-01', '2024-02-30', '0999-01-01', 7, 2.5, True, False,
+          {'latitude': 1.5, 'longitude': 2.5}, {'city': 'Paris', 'street': None}]
+
+
+def build_schema():
+    properties = {}
+    for sf_type in FIELD_TYPES:
+        name = 'Id' if sf_type == 'id' else 'Field_{}'.format(sf_type)
+        properties[name], _ = field_to_property_schema({'name': name, 'type': sf_type}, {})
+    return {'type': 'object', 'properties': properties}
+
+
+def transform_with_transformer(rec, schema):
+    """The transformation the converters replace: singer's Transformer
+    followed by the anyType casts of fix_record_anytype"""
+    with Transformer(pre_hook=transform_bulk_data_hook) as transformer:
+        rec = transformer.transform(rec, schema)
+    for k, v in rec.items():
+        if schema['properties'][k].get("type") is None:
+            val = v
+            try:
+                val = float(v)
+            except BaseException:
+                pass
+            if v in ["true", "false"]:
+                val = (v == "true")
+            if v == "":
+                val = None
+            rec[k] = val
+    return rec
+
+
+class TestRecordConverter(unittest.TestCase):
+
+    def assert_same_as_transformer(self, rec, schema):
+        try:
+            expected = transform_with_transformer(dict(rec), schema)
+        except SchemaMismatch:
+            expected = SchemaMismatch
+
+        with Transformer(pre_hook=transform_bulk_data_hook) as transformer:
+            converter = RecordConverter(schema, transformer, BLACKLISTED_FIELDS)
+            try:
+                actual = converter.convert(dict(rec))
+            except SchemaMismatch:
+                actual = SchemaMismatch
+
+        self.assertEqual(repr(actual), repr(expected), rec)
+
+    def test_converted_values_match_transformer(self):
+        """
+        To verify that every field type produced by discovery is converted to the
+        same value as the Transformer would, or is rejected the same way
+        """
+        schema = build_schema()
+        for name, value in itertools.product(schema['properties'].keys(), VALUES):
+            self.assert_same_as_transformer({name: value}, schema)
+
+    def test_unknown_and_blacklisted_fields_are_dropped(self):
+        """
+        To verify that fields missing from the schema are dropped, and only reported when they are not blacklisted
+        """
+        schema = build_schema()
+        with Transformer(pre_hook=transform_bulk_data_hook) as transformer:
+            converter = RecordConverter(schema, transformer, BLACKLISTED_FIELDS)
+            rec = converter.convert({'Id': '1', 'attributes': {'type': 'Account'}, 'NewField__c': 'x'})
+
+        self.assertEqual(rec, {'Id': '1'})
+        self.assertEqual(transformer.removed, {'NewField__c'})
+
+    def test_mismatch_reports_field(self):
+        """
+        To verify that a value that cannot be converted raises the Transformer's error for that field
+        """
+        schema = build_schema()
+        with Transformer(pre_hook=transform_bulk_data_hook) as transformer:
+            converter = RecordConverter(schema, transformer, BLACKLISTED_FIELDS)
+            with self.assertRaises(SchemaMismatch) as err:
+                converter.convert({'Id': '1', 'Field_int': '1.5'})
+
+        self.assertIn('Field_int', str(err.exception))
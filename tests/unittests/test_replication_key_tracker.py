@@ -0,0 +1,40 @@
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+from tap_salesforce.bookmarks import ReplicationKeyTracker, normalize_date_time
+
+SYNC_START = datetime(2024, 1, 10, tzinfo=timezone.utc)
+
+
+class TestReplicationKeyTracker(unittest.TestCase):
+
+    def test_normalized_values_are_not_parsed(self):
+        """
+        To verify that values already in the normalized format are compared without being parsed
+        """
+        with mock.patch('tap_salesforce.bookmarks.singer_utils.strptime_to_utc') as mocked_strptime:
+            self.assertEqual(normalize_date_time('2024-01-02T03:04:05.000000Z'), '2024-01-02T03:04:05.000000Z')
+
+        mocked_strptime.assert_not_called()
+
+    def test_other_formats_are_normalized(self):
+        """
+        To verify that values in other formats or time zones are converted to the normalized UTC format
+        """
+        self.assertEqual(normalize_date_time('2024-01-02T03:04:05.000+0100'), '2024-01-02T02:04:05.000000Z')
+        self.assertEqual(normalize_date_time('2024-01-02'), '2024-01-02T00:00:00.000000Z')
+
+    def test_highest_value_within_sync_is_tracked(self):
+        """
+        To verify that only values higher than the current highest and not later than the sync start raise it
+        """
+        tracker = ReplicationKeyTracker(SYNC_START, '2024-01-01T00:00:00Z')
+
+        self.assertTrue(tracker.update('2024-01-05T00:00:00.000000Z'))
+        self.assertFalse(tracker.update('2024-01-03T00:00:00.000000Z'))
+        self.assertFalse(tracker.update('2024-01-11T00:00:00.000000Z'))
+        self.assertFalse(tracker.update(None))
+
+        self.assertEqual(tracker.highest, '2024-01-05T00:00:00.000000Z')
+        self.assertIsNone(tracker.last_value)
+        self.assertFalse(tracker.is_within_sync('2024-01-11T00:00:00.000000Z'))
@@ -0,0 +1,69 @@
+import threading
+import unittest
+from unittest import mock
+from tap_salesforce import Salesforce
+from tap_salesforce.salesforce.concurrency import Prefetcher
+from tap_salesforce.salesforce.rest import Rest
+
+
+def make_response(records, next_records_url=None):
+    resp = mock.Mock()
+    resp.json.return_value = {'records': records, 'nextRecordsUrl': next_records_url}
+    return resp
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def test_items_are_yielded_in_order(self):
+        self.assertEqual(list(Prefetcher(iter(range(10)), 2)), list(range(10)))
+
+    def test_errors_are_raised_after_earlier_items(self):
+        def items():
+            yield 1
+            raise ValueError("boom")
+
+        results = []
+        with self.assertRaises(ValueError):
+            for item in Prefetcher(items(), 2):
+                results.append(item)
+        self.assertEqual(results, [1])
+
+    def test_producer_stays_bounded(self):
+        """
+        To verify that no more than `depth` items are produced ahead of the consumer
+        """
+        produced = []
+        blocked = threading.Event()
+
+        def items():
+            for i in range(100):
+                produced.append(i)
+                if len(produced) > 3:
+                    blocked.set()
+                yield i
+
+        pages = Prefetcher(items(), 2)
+        self.assertEqual(next(pages), 0)
+        blocked.wait(1)
+        # The queue holds 2 items and the producer is blocked holding 1 more
+        self.assertLessEqual(len(produced), 4)
+        pages.close()
+
+
+class TestRestPrefetch(unittest.TestCase):
+
+    def test_pages_are_prefetched(self):
+        """
+        To verify that the records of every page are emitted in order when pages are prefetched
+        """
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="REST", rest_prefetch_pages=2)
+        sf.instance_url = 'https://example.my.salesforce.com'
+        responses = [make_response([{'Id': 1}, {'Id': 2}], '/next/1'),
+                     make_response([{'Id': 3}], '/next/2'),
+                     make_response([{'Id': 4}])]
+
+        with mock.patch.object(sf, '_make_request', side_effect=responses) as mocked_make_request:
+            records = list(Rest(sf)._sync_records('https://example.my.salesforce.com/query', {}, {'q': 'SELECT Id FROM Account'}))
+
+        self.assertEqual(records, [{'Id': 1}, {'Id': 2}, {'Id': 3}, {'Id': 4}])
+        self.assertEqual(mocked_make_request.call_args_list[2][0][1], 'https://example.my.salesforce.com/next/2')
@@ -0,0 +1,61 @@
+import datetime
+import re
+import threading
+import unittest
+from unittest import mock
+from tap_salesforce import Salesforce
+from tap_salesforce.salesforce.rest import Rest, split_date_range
+
+CATALOG_ENTRY = {
+    'stream': 'Account',
+    'tap_stream_id': 'Account',
+    'schema': {'properties': {'Id': {}, 'SystemModstamp': {}}},
+    'metadata': [{'breadcrumb': [], 'metadata': {'replication-key': 'SystemModstamp'}},
+                 {'breadcrumb': ['properties', 'Id'], 'metadata': {'inclusion': 'automatic'}},
+                 {'breadcrumb': ['properties', 'SystemModstamp'], 'metadata': {'inclusion': 'automatic'}}]
+}
+
+
+class TestSplitDateRange(unittest.TestCase):
+
+    def test_windows_cover_the_range(self):
+        start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        end = datetime.datetime(2024, 1, 5, tzinfo=datetime.timezone.utc)
+
+        windows = split_date_range(start, end, 4)
+
+        self.assertEqual([w[0].day for w in windows], [1, 2, 3, 4])
+        self.assertEqual(windows[-1][1], end)
+
+    def test_empty_range(self):
+        start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+        self.assertEqual(split_date_range(start, start, 4), [(start, start)])
+
+
+@mock.patch('tap_salesforce.salesforce.rest.singer_utils.now',
+            return_value=datetime.datetime(2024, 1, 5, tzinfo=datetime.timezone.utc))
+class TestRestSharding(unittest.TestCase):
+
+    def test_windows_are_queried_concurrently_and_emitted_in_order(self, mocked_now):
+        """
+        To verify that every window is queried before the first one is done, and
+        that records are emitted in window order
+        """
+        sf = Salesforce(default_start_date='2024-01-01T00:00:00Z', api_type="REST", rest_query_shards=4)
+        sf.instance_url = 'https://example.my.salesforce.com'
+        all_windows_queried = threading.Barrier(4, timeout=5)
+
+        def make_request(method, url, headers=None, params=None):
+            window_start = re.search(r">= (\S+)", params['q']).group(1)
+            self.assertIn("SystemModstamp <", params['q'])
+            all_windows_queried.wait()
+            resp = mock.Mock()
+            resp.json.return_value = {'records': [{'SystemModstamp': window_start}]}
+            return resp
+
+        with mock.patch.object(sf, '_make_request', side_effect=make_request):
+            records = list(Rest(sf).query(CATALOG_ENTRY, {}))
+
+        self.assertEqual([r['SystemModstamp'][:10] for r in records],
+                         ['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-04'])
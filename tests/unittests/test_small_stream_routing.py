@@ -0,0 +1,88 @@
+import unittest
+from unittest import mock
+from tap_salesforce import Salesforce
+from tap_salesforce.sync import sync_stream
+
+CATALOG_ENTRY = {
+    "stream": "Account",
+    "tap_stream_id": "Account",
+    "schema": {"type": "object",
+               "properties": {"Id": {"type": "string"},
+                              "SystemModstamp": {"anyOf": [{"type": "string", "format": "date-time"},
+                                                           {"type": ["string", "null"]}]}}},
+    "metadata": [{"breadcrumb": [], "metadata": {"replication-key": "SystemModstamp"}}]
+}
+
+
+@mock.patch('tap_salesforce.salesforce.Rest.query', return_value=iter([]))
+@mock.patch('tap_salesforce.salesforce.Bulk.query', return_value=iter([]))
+class TestSmallStreamRouting(unittest.TestCase):
+
+    sf = Salesforce(default_start_date='2024-01-01T00:00:00Z', api_type="BULK", rest_max_records=100)
+
+    def test_small_stream_is_queried_with_rest(self, mocked_bulk_query, mocked_rest_query):
+        state = {'bookmarks': {'Account': {'LastSyncRecords': 100}}}
+
+        with mock.patch.object(self.sf, 'probe_record_count') as mocked_probe:
+            self.sf.query(CATALOG_ENTRY, state)
+
+        mocked_rest_query.assert_called_once()
+        mocked_bulk_query.assert_not_called()
+        mocked_probe.assert_not_called()
+        self.assertTrue(self.sf.is_small_stream(CATALOG_ENTRY, state))
+
+    def test_large_stream_is_queried_with_bulk(self, mocked_bulk_query, mocked_rest_query):
+        self.sf.query(CATALOG_ENTRY, {'bookmarks': {'Account': {'LastSyncRecords': 101}}})
+
+        mocked_bulk_query.assert_called_once()
+        mocked_rest_query.assert_not_called()
+
+    def test_stream_without_history_is_queried_with_bulk(self, mocked_bulk_query, mocked_rest_query):
+        self.sf.query(CATALOG_ENTRY, {})
+
+        self.assertIsNone(mocked_bulk_query.call_args[0][2])
+        mocked_rest_query.assert_not_called()
+
+    def test_routing_is_off_by_default(self, mocked_bulk_query, mocked_rest_query):
+        sf = Salesforce(default_start_date='2024-01-01T00:00:00Z', api_type="BULK")
+        state = {'bookmarks': {'Account': {'LastSyncRecords': 1}}}
+
+        sf.query(CATALOG_ENTRY, state)
+
+        mocked_bulk_query.assert_called_once()
+        self.assertFalse(sf.is_small_stream(CATALOG_ENTRY, state))
+
+
+@mock.patch('tap_salesforce.sync.write_message')
+@mock.patch('tap_salesforce.sync.write_state')
+@mock.patch('tap_salesforce.messages.write_state')
+class TestLastSyncRecords(unittest.TestCase):
+
+    def test_record_count_is_kept_in_state(self, *mocks):
+        sf = Salesforce(default_start_date='2024-01-01T00:00:00Z', api_type="BULK", rest_max_records=100)
+        records = [{'Id': str(i), 'SystemModstamp': '2024-01-0{}T00:00:00.000Z'.format(i + 1)} for i in range(3)]
+        state = {}
+
+        with mock.patch.object(sf, 'query', return_value=iter(records)):
+            sync_stream(sf, CATALOG_ENTRY, state)
+
+        self.assertEqual(state['bookmarks']['Account']['LastSyncRecords'], 3)
+
+
+@mock.patch('tap_salesforce.salesforce.Rest.query', return_value=iter([]))
+class TestBulk2RoutedToRest(unittest.TestCase):
+
+    def test_bulk2_resume_bookmarks_are_cleared(self, mocked_rest_query):
+        """
+        To verify that a Bulk API 2.0 stream routed to REST does not keep the
+        job it was interrupted in for a later Bulk API 2.0 sync to resume
+        """
+        sf = Salesforce(default_start_date='2024-01-01T00:00:00Z', api_type="BULK2", rest_max_records=100)
+        state = {'bookmarks': {'Account': {'LastSyncRecords': 10, 'Bulk2JobID': 'job', 'Bulk2Locator': 'abc',
+                                           'SystemModstamp': '2024-01-01T00:00:00.000000Z'}}}
+
+        sf.query(CATALOG_ENTRY, state)
+
+        mocked_rest_query.assert_called_once()
+        self.assertEqual(state['bookmarks']['Account'],
+                         {'LastSyncRecords': 10, 'SystemModstamp': '2024-01-01T00:00:00.000000Z'})
@@ -0,0 +1,67 @@
+import unittest
+from unittest import mock
+from tap_salesforce import Salesforce, metrics
+from tap_salesforce.messages import ThrottledStateWriter
+from tap_salesforce.sync import sync_records
+
+RECORDS = [{'Id': str(i), 'SystemModstamp': '2024-01-0{}T00:00:00.000Z'.format(i + 1)} for i in range(5)]
+
+
+@mock.patch('tap_salesforce.sync.write_message')
+@mock.patch('tap_salesforce.messages.write_state')
+@mock.patch('tap_salesforce.salesforce.Salesforce.query', side_effect=lambda catalog_entry, state: iter(RECORDS))
+class TestStateFlush(unittest.TestCase):
+
+    catalog_entry = {
+        "stream": "Account",
+        "tap_stream_id": "Account",
+        "schema": {"type": "object",
+                   "properties": {"Id": {"type": "string"},
+                                  "SystemModstamp": {"anyOf": [{"type": "string", "format": "date-time"},
+                                                               {"type": ["string", "null"]}]}}},
+        "metadata": [{"breadcrumb": [], "metadata": {"replication-key": "SystemModstamp"}}]
+    }
+
+    def sync(self, **kwargs):
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="REST", **kwargs)
+        state = {}
+        sync_records(sf, self.catalog_entry, state, metrics.record_counter('Account'))
+        return state
+
+    def test_state_is_written_per_record_by_default(self, mocked_query, mocked_write_state, mocked_write_message):
+        """
+        To verify that without a flush policy the state is written after every record
+        """
+        self.sync()
+
+        self.assertEqual(mocked_write_state.call_count, 5)
+
+    def test_state_is_written_every_n_records(self, mocked_query, mocked_write_state, mocked_write_message):
+        """
+        To verify that the state is only written every `state_flush_records` records
+        and that the bookmark written is the one of the last record emitted
+        """
+        written_bookmarks = []
+        mocked_write_state.side_effect = lambda state: written_bookmarks.append(state['bookmarks']['Account']['SystemModstamp'])
+
+        state = self.sync(state_flush_records=2)
+
+        self.assertEqual(written_bookmarks, ['2024-01-02T00:00:00.000000Z', '2024-01-04T00:00:00.000000Z'])
+        self.assertEqual(state['bookmarks']['Account']['SystemModstamp'], '2024-01-05T00:00:00.000000Z')
+
+
+@mock.patch('tap_salesforce.messages.write_state')
+class TestThrottledStateWriter(unittest.TestCase):
+
+    @mock.patch('tap_salesforce.messages.time.monotonic', side_effect=[0, 1, 5, 11, 11, 12])
+    def test_state_is_written_every_t_seconds(self, mocked_monotonic, mocked_write_state):
+        """
+        To verify that the state is written once `every_seconds` have passed since the last write
+        """
+        state_writer = ThrottledStateWriter(every_seconds=10)
+
+        for _ in range(4):
+            state_writer.write_state({})
+
+        # Calls at 1 and 5 are skipped, the one at 11 writes, the one at 12 is skipped
+        self.assertEqual(mocked_write_state.call_count, 1)
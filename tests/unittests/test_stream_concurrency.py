@@ -0,0 +1,72 @@
+import unittest
+from unittest import mock
+import singer
+from tap_salesforce import Salesforce, do_sync
+from tap_salesforce.messages import StreamState
+
+
+def make_catalog_entry(stream):
+    return {
+        "stream": stream,
+        "tap_stream_id": stream,
+        "schema": {"properties": {}},
+        "metadata": [{"breadcrumb": [], "metadata": {"selected": True}}]
+    }
+
+
+def fake_sync_catalog_entry(sf, catalog_entry, state):
+    singer.set_bookmark(state, catalog_entry['tap_stream_id'], 'SystemModstamp', '2024-01-01T00:00:00.000000Z')
+
+
+@mock.patch('tap_salesforce.write_state')
+@mock.patch('tap_salesforce.sync_catalog_entry', side_effect=fake_sync_catalog_entry)
+class TestStreamConcurrency(unittest.TestCase):
+
+    catalog = {"streams": [make_catalog_entry(name) for name in ["Account", "Contact", "Lead", "User"]]}
+
+    def test_concurrent_sync_merges_stream_state(self, mocked_sync_catalog_entry, mocked_write_state):
+        """
+        To verify that every selected stream is synced and the bookmarks written by
+        each worker end up in the shared state
+        """
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK", stream_concurrency=3)
+        state = {}
+
+        do_sync(sf, self.catalog, state)
+
+        self.assertEqual(mocked_sync_catalog_entry.call_count, 4)
+        self.assertEqual(sorted(state['bookmarks'].keys()), ["Account", "Contact", "Lead", "User"])
+        self.assertIsNone(state['current_stream'])
+        self.assertNotIn('current_streams', state)
+
+    def test_resume_from_earliest_in_flight_stream(self, mocked_sync_catalog_entry, mocked_write_state):
+        """
+        To verify that an interrupted concurrent sync skips the streams before the
+        earliest in-flight stream
+        """
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK", stream_concurrency=2)
+        state = {"current_stream": "Contact", "current_streams": ["Contact", "User"]}
+
+        do_sync(sf, self.catalog, state)
+
+        synced_streams = sorted(args[1]['tap_stream_id'] for args, _ in mocked_sync_catalog_entry.call_args_list)
+        self.assertEqual(synced_streams, ["Contact", "Lead", "User"])
+
+
+class TestStreamState(unittest.TestCase):
+
+    def test_merge_only_touches_own_stream(self):
+        """
+        To verify that a worker's state copy only merges its own bookmarks and version
+        """
+        shared_state = {"bookmarks": {"Account": {"SystemModstamp": "a"}, "Contact": {"SystemModstamp": "b"}},
+                        "versions": {"Contact": 1}}
+        stream_state = StreamState(shared_state, "Contact")
+        singer.set_bookmark(stream_state, "Contact", "SystemModstamp", "c")
+        singer.clear_version(stream_state, "Contact")
+        stream_state["bookmarks"]["Account"]["SystemModstamp"] = "changed"
+
+        stream_state.merge()
+
+        self.assertEqual(shared_state, {"bookmarks": {"Account": {"SystemModstamp": "a"}, "Contact": {"SystemModstamp": "c"}},
+                                        "versions": {}})
@@ -0,0 +1,35 @@
+import unittest
+from unittest import mock
+from tap_salesforce import Salesforce, metrics
+from tap_salesforce.sync import Transformer, sync_records
+
+RECORDS = [{'Id': str(i), 'Amount': '1.5', 'Value': '2'} for i in range(3)]
+
+
+@mock.patch('tap_salesforce.sync.write_message')
+@mock.patch('tap_salesforce.salesforce.Salesforce.query', side_effect=lambda catalog_entry, state: iter(RECORDS))
+class TestSyncRecordsTransform(unittest.TestCase):
+
+    catalog_entry = {
+        "stream": "Opportunity",
+        "tap_stream_id": "Opportunity",
+        "schema": {"type": "object",
+                   "properties": {"Id": {"type": "string"},
+                                  "Amount": {"type": ["null", "number"]},
+                                  "Value": {}}},
+        "metadata": []
+    }
+
+    def test_transformer_is_built_once_per_stream(self, mocked_query, mocked_write_message):
+        """
+        To verify that a single Transformer is used for every record of a stream
+        and that the records are still transformed
+        """
+        sf = Salesforce(default_start_date='2019-02-04T12:15:00Z', api_type="BULK")
+
+        with mock.patch('tap_salesforce.sync.Transformer', wraps=Transformer) as mocked_transformer:
+            sync_records(sf, self.catalog_entry, {}, metrics.record_counter('Opportunity'))
+
+        mocked_transformer.assert_called_once()
+        records = [args[0].record for args, _ in mocked_write_message.call_args_list if hasattr(args[0], 'record')]
+        self.assertEqual(records, [{'Id': str(i), 'Amount': 1.5, 'Value': 2.0} for i in range(3)])
@@ -0,0 +1,155 @@
+import datetime
+import unittest
+from unittest import mock
+from tap_salesforce import Salesforce, build_state
+from tap_salesforce.salesforce import Bulk
+from tap_salesforce.salesforce.exceptions import TapSalesforceException
+from tap_salesforce.salesforce.rest import Rest
+from tap_salesforce.salesforce.windowing import WindowPlan, WindowSizer
+
+DAY = datetime.timedelta(days=1)
+START = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+NOW = datetime.datetime(2024, 1, 17, tzinfo=datetime.timezone.utc)
+
+CATALOG_ENTRY = {
+    'stream': 'Account',
+    'tap_stream_id': 'Account',
+    'schema': {'properties': {'Id': {}, 'SystemModstamp': {}}},
+    'metadata': [{'breadcrumb': [], 'metadata': {'replication-key': 'SystemModstamp'}},
+                 {'breadcrumb': ['properties', 'Id'], 'metadata': {'inclusion': 'automatic'}},
+                 {'breadcrumb': ['properties', 'SystemModstamp'], 'metadata': {'inclusion': 'automatic'}}]
+}
+
+FULL_TABLE_CATALOG_ENTRY = {
+    'stream': 'Account',
+    'tap_stream_id': 'Account',
+    'schema': {'properties': {'Id': {}}},
+    'metadata': [{'breadcrumb': [], 'metadata': {'replication-method': 'FULL_TABLE'}},
+                 {'breadcrumb': ['properties', 'Id'], 'metadata': {'inclusion': 'automatic'}}]
+}
+
+
+def window_days(window):
+    return ((window.start_date - START).days, (window.end_date - START).days)
+
+
+class TestWindowPlan(unittest.TestCase):
+
+    sf = Salesforce(default_start_date='2024-01-01T00:00:00Z', api_type="REST")
+
+    def test_failed_window_is_replaced_by_smaller_ones(self):
+        plan = WindowPlan(CATALOG_ENTRY, START, NOW, WindowSizer(self.sf, 'Account'))
+
+        window = plan.next_window()
+        self.assertEqual(window_days(window), (0, 16))
+        plan.failed(window)
+
+        first = plan.next_window()
+        self.assertEqual(window_days(first), (0, 8))
+        second = plan.next_window()
+        self.assertEqual(window_days(second), (8, 16))
+        self.assertIsNone(plan.next_window())
+
+        # Windows are popped in order, once every window before them is done
+        plan.done(second)
+        self.assertEqual(plan.pop_done(), [])
+        plan.done(first)
+        self.assertEqual(plan.pop_done(), [first, second])
+
+    def test_runs_out_of_retries(self):
+        plan = WindowPlan(CATALOG_ENTRY, START, NOW, WindowSizer(self.sf, 'Account'), retries=1)
+        plan.failed(plan.next_window())
+
+        with self.assertRaisesRegex(TapSalesforceException, "Ran out of retries"):
+            plan.next_window()
+
+    def test_checkpointed_windows_are_resumed_from_the_bookmark(self):
+        """
+        To verify that the windows left to query are kept in the state and
+        that a new plan resumes them from the stream's current start date
+        """
+        state = {}
+        plan = WindowPlan(CATALOG_ENTRY, START, NOW, WindowSizer(self.sf, 'Account', state), state)
+        plan.failed(plan.next_window())
+        plan.done(plan.next_window())
+        plan.next_window()
+
+        self.assertEqual(state['bookmarks']['Account']['WindowPlan'],
+                         [['2024-01-09T00:00:00.000000Z', '2024-01-17T00:00:00.000000Z']])
+
+        resumed = WindowPlan(CATALOG_ENTRY, START + 10 * DAY, NOW + DAY, WindowSizer(self.sf, 'Account', state), state)
+        self.assertEqual(window_days(resumed.next_window()), (10, 16))
+        self.assertEqual(window_days(resumed.next_window()), (16, 17))
+
+        resumed.finish()
+        self.assertNotIn('WindowPlan', state['bookmarks']['Account'])
+
+    def test_rest_queries_many_windows_without_recursing(self):
+        """
+        To verify that a range split into more windows than the recursion
+        limit is queried window after window, the windows not growing here
+        """
+        state = {'bookmarks': {'Account': {'WindowSeconds': 3600}}}
+        rest = Rest(self.sf)
+        start = START - 365 * DAY
+
+        with mock.patch.object(self.sf, 'get_start_date', return_value='2023-01-01T00:00:00Z'), \
+             mock.patch('tap_salesforce.salesforce.rest.singer_utils.now', return_value=NOW), \
+             mock.patch.object(self.sf, '_get_standard_headers', return_value={}), \
+             mock.patch.object(WindowSizer, 'succeeded'), \
+             mock.patch.object(rest, '_sync_records', side_effect=lambda url, headers, params: iter([params['q']])):
+            queries = list(rest.query(CATALOG_ENTRY, state))
+
+        self.assertEqual(len(queries), (NOW - start).days * 24)
+        self.assertNotIn('WindowPlan', state['bookmarks']['Account'])
+
+
+class TestFullTableStreamIsNotWindowed(unittest.TestCase):
+    """
+    The query of a stream without a replication key has no date filter, so
+    a window size left in its state must not split it into several queries
+    that each return every record
+    """
+
+    sf = Salesforce(default_start_date='2024-01-01T00:00:00Z', api_type="BULK")
+    state = {'bookmarks': {'Account': {'WindowSeconds': 86400,
+                                       'WindowPlan': [['2024-01-01T00:00:00.000000Z', '2024-01-02T00:00:00.000000Z']]}}}
+
+    def test_rest_queries_once(self):
+        state = {'bookmarks': {'Account': dict(self.state['bookmarks']['Account'])}}
+        rest = Rest(self.sf)
+
+        with mock.patch('tap_salesforce.salesforce.rest.singer_utils.now', return_value=NOW), \
+             mock.patch.object(self.sf, '_get_standard_headers', return_value={}), \
+             mock.patch.object(rest, '_sync_records', side_effect=lambda url, headers, params: iter([params['q']])):
+            queries = list(rest.query(FULL_TABLE_CATALOG_ENTRY, state))
+
+        self.assertEqual(queries, ['SELECT Id FROM Account'])
+
+    @mock.patch('tap_salesforce.salesforce.Bulk._close_job')
+    def test_failed_bulk_job_is_retried_over_the_whole_range(self, mocked_close_job):
+        state = {'bookmarks': {'Account': dict(self.state['bookmarks']['Account'])}}
+        bulk = Bulk(self.sf)
+        windows = []
+
+        def add_batch(catalog_entry, job_id, start_date, end_date=None, order_by_clause=True):
+            windows.append((start_date[:10], end_date[:10]))
+
+        with mock.patch('tap_salesforce.salesforce.bulk.singer_utils.now', return_value=NOW), \
+             mock.patch.object(bulk, '_create_job', return_value='job'), \
+             mock.patch.object(bulk, '_add_batch', side_effect=add_batch), \
+             mock.patch.object(bulk, '_poll_on_pk_chunked_batch_status',
+                               side_effect=[{'completed': [], 'failed': {'b': 'QUERY_TIMEOUT'}},
+                                            {'completed': ['b2'], 'failed': {}}]):
+            status_list = bulk._bulk_with_window([], FULL_TABLE_CATALOG_ENTRY, '2024-01-01T00:00:00Z',
+                                                 window_sizer=WindowSizer(self.sf, 'Account'), state=state)
+
+        self.assertEqual([s['completed'] for s in status_list], [['b2']])
+        self.assertEqual(windows, [('2024-01-01', '2024-01-17'), ('2024-01-01', '2024-01-17')])
+        self.assertNotIn('WindowPlan', state['bookmarks']['Account'])
+
+    def test_window_bookmarks_are_not_kept(self):
+        state = build_state(self.state, {'streams': [FULL_TABLE_CATALOG_ENTRY]})
+
+        self.assertNotIn('WindowSeconds', state['bookmarks']['Account'])
+        self.assertNotIn('WindowPlan', state['bookmarks']['Account'])
@@ -0,0 +1,96 @@
+import datetime
+import unittest
+from unittest import mock
+from requests.exceptions import HTTPError
+from tap_salesforce import Salesforce
+from tap_salesforce.salesforce.rest import Rest
+from tap_salesforce.salesforce.windowing import WindowSizer
+
+DAY = datetime.timedelta(days=1)
+START = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+NOW = datetime.datetime(2024, 1, 17, tzinfo=datetime.timezone.utc)
+
+CATALOG_ENTRY = {
+    'stream': 'Account',
+    'tap_stream_id': 'Account',
+    'schema': {'properties': {'Id': {}, 'SystemModstamp': {}}},
+    'metadata': [{'breadcrumb': [], 'metadata': {'replication-key': 'SystemModstamp'}},
+                 {'breadcrumb': ['properties', 'Id'], 'metadata': {'inclusion': 'automatic'}},
+                 {'breadcrumb': ['properties', 'SystemModstamp'], 'metadata': {'inclusion': 'automatic'}}]
+}
+
+
+class TestWindowSizer(unittest.TestCase):
+
+    sf = Salesforce(default_start_date='2024-01-01T00:00:00Z', api_type="REST")
+
+    def test_whole_range_until_a_window_fails(self):
+        sizer = WindowSizer(self.sf, 'Account', {})
+
+        self.assertEqual(sizer.window_end(START, NOW), NOW)
+        sizer.succeeded(START, NOW)
+        self.assertEqual(sizer.state, {})
+
+    def test_failures_shrink_and_successes_grow_the_window(self):
+        """
+        To verify that a failed window is halved, that the next windows double
+        in size, and that the largest successful window is remembered
+        """
+        state = {}
+        sizer = WindowSizer(self.sf, 'Account', state)
+
+        end_date = sizer.failed(START, NOW)
+        self.assertEqual(end_date, START + 8 * DAY)
+        end_date = sizer.failed(START, end_date)
+        self.assertEqual(end_date, START + 4 * DAY)
+        self.assertEqual(state['bookmarks']['Account']['WindowSeconds'], 4 * 86400)
+
+        sizer.succeeded(START, end_date)
+        self.assertEqual(sizer.window_end(end_date, NOW), START + 12 * DAY)
+        sizer.succeeded(end_date, START + 12 * DAY)
+        self.assertEqual(state['bookmarks']['Account']['WindowSeconds'], 8 * 86400)
+
+    def test_learned_size_is_used(self):
+        sizer = WindowSizer(self.sf, 'Account', {'bookmarks': {'Account': {'WindowSeconds': 2 * 86400}}})
+
+        self.assertEqual(sizer.window_end(START, NOW), START + 2 * DAY)
+
+
+def make_response(records):
+    resp = mock.Mock()
+    resp.json.return_value = {'records': records}
+    return resp
+
+
+def query_timeout():
+    resp = mock.Mock()
+    resp.json.return_value = [{'errorCode': 'QUERY_TIMEOUT'}]
+    return HTTPError(response=resp)
+
+
+@mock.patch('tap_salesforce.salesforce.rest.singer_utils.now', return_value=NOW)
+class TestRestWindowing(unittest.TestCase):
+
+    def test_query_starts_with_learned_window(self, mocked_now):
+        sf = Salesforce(default_start_date='2024-01-01T00:00:00Z', api_type="REST")
+        sf.instance_url = 'https://example.my.salesforce.com'
+        state = {'bookmarks': {'Account': {'WindowSeconds': 8 * 86400}}}
+
+        with mock.patch.object(sf, '_make_request', return_value=make_response([])) as mocked_make_request:
+            list(Rest(sf).query(CATALOG_ENTRY, state))
+
+        queries = [kwargs['params']['q'] for args, kwargs in mocked_make_request.call_args_list]
+        self.assertEqual(len(queries), 2)
+        self.assertIn("SystemModstamp < 2024-01-09", queries[0])
+        self.assertIn("SystemModstamp >= 2024-01-09", queries[1])
+        self.assertEqual(state['bookmarks']['Account']['WindowSeconds'], 8 * 86400)
+
+    def test_timeout_is_remembered(self, mocked_now):
+        sf = Salesforce(default_start_date='2024-01-01T00:00:00Z', api_type="REST")
+        sf.instance_url = 'https://example.my.salesforce.com'
+        state = {}
+
+        with mock.patch.object(sf, '_make_request', side_effect=[query_timeout(), make_response([]), make_response([])]):
+            list(Rest(sf).query(CATALOG_ENTRY, state))
+
+        self.assertEqual(state['bookmarks']['Account']['WindowSeconds'], 8 * 86400)